@@ -0,0 +1,242 @@
+"""
+Module to write block compressed (BGZF) output
+
+BGZF files are a series of independent gzip members of at most 64 KB each, so they can be read with gzip while
+also allowing random access to any position through virtual offsets. Blocks are compressed in a thread pool.
+"""
+
+# imports
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import click
+
+# maximum amount of uncompressed data in each block
+BLOCK_SIZE = 65280
+
+# empty block which marks the end of the file
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compress_block(data, level=6):
+    """
+    Compress data as a single BGZF block
+
+    :param data: uncompressed bytes of at most BLOCK_SIZE
+    :param level: zlib compression level
+    :return: compressed block
+    """
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+
+    # the extra field stores the size of the whole block minus one
+    block_size = len(compressed) + 26
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+
+    return (
+        header
+        + struct.pack("<H", block_size - 1)
+        + compressed
+        + struct.pack("<II", zlib.crc32(data), len(data))
+    )
+
+
+def make_virtual_offset(block_start, within_block):
+    """
+    Combine the offset of a compressed block and the offset within its uncompressed data
+
+    :param block_start: offset of the block in the compressed file
+    :param within_block: offset within the uncompressed data of the block
+    :return: virtual offset
+    """
+
+    return (block_start << 16) | within_block
+
+
+def split_virtual_offset(virtual_offset):
+    """
+    Split a virtual offset into the offset of its compressed block and the offset within the block
+
+    :param virtual_offset: virtual offset
+    :return: offset of the block and offset within the block
+    """
+
+    return virtual_offset >> 16, virtual_offset & 0xFFFF
+
+
+class BgzfWriter:
+    """
+    Text file which is written as BGZF with its blocks compressed in a thread pool
+    """
+
+    def __init__(self, filename, threads=None, level=6):
+        """
+        :param filename: path of the file to write
+        :param threads: number of threads to compress blocks with. Defaults to the number of cores
+        :param level: zlib compression level
+        """
+
+        self.handle = open(filename, "wb")
+        self.level = level
+        self.threads = threads if threads is not None else os.cpu_count()
+        self.pool = ThreadPoolExecutor(max_workers=self.threads)
+
+        # data waiting to fill a block and blocks being compressed
+        self.buffer = bytearray()
+        self.pending = deque()
+
+        # offset of each block in the compressed file once it is written
+        self.block_starts = []
+        self.num_blocks = 0
+
+    def write(self, text):
+        """
+        Write text to the file
+
+        :param text: text to write
+        """
+
+        self.buffer += text.encode()
+
+        while len(self.buffer) >= BLOCK_SIZE:
+            self.submit(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def submit(self, data):
+        """
+        Queue a block to be compressed and write out any blocks which have finished in order
+
+        :param data: uncompressed bytes of the block
+        """
+
+        self.pending.append(self.pool.submit(compress_block, data, self.level))
+        self.num_blocks += 1
+
+        # limit the number of blocks held in memory
+        while len(self.pending) > self.threads * 4 or (
+            len(self.pending) > 0 and self.pending[0].done()
+        ):
+            self.write_block(self.pending.popleft().result())
+
+    def write_block(self, block):
+        self.block_starts.append(self.handle.tell())
+        self.handle.write(block)
+
+    def mark(self):
+        """
+        Get the position of the next byte written. Use virtual_offset to convert it once the file is closed
+
+        :return: index of the block and offset within the block
+        """
+
+        return self.num_blocks, len(self.buffer)
+
+    def virtual_offset(self, mark):
+        """
+        Convert a position from mark to a virtual offset. The blocks up to the position must have been written
+
+        :param mark: index of the block and offset within the block
+        :return: virtual offset
+        """
+
+        block, within_block = mark
+
+        return make_virtual_offset(self.block_starts[block], within_block)
+
+    def close(self):
+        """
+        Write any remaining data and the end of file marker
+        """
+
+        if self.handle.closed:
+            return
+
+        if len(self.buffer) > 0:
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+
+        while len(self.pending) > 0:
+            self.write_block(self.pending.popleft().result())
+
+        # a position at the very end of the data points to the end of file marker
+        self.block_starts.append(self.handle.tell())
+
+        self.pool.shutdown()
+        self.handle.write(EOF_BLOCK)
+        self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PlainWriter:
+    """
+    Uncompressed text file which keeps track of the number of bytes written such that positions can be indexed
+    in the same way as BgzfWriter
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: path of the file to write
+        """
+
+        self.handle = open(filename, "wb")
+        self.position = 0
+
+    def write(self, text):
+        data = text.encode()
+        self.handle.write(data)
+        self.position += len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def mark(self):
+        """
+        Get the position of the next byte written
+
+        :return: byte offset
+        """
+
+        return self.position
+
+    def virtual_offset(self, mark):
+        return mark
+
+    def close(self):
+        self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_output(filename, threads=None):
+    """
+    Open an output file for writing text. Files ending in .gz are written as BGZF
+
+    :param filename: path of the file to write. Use '-' for stdout
+    :param threads: number of threads to compress blocks with
+    :return: open handle of the file
+    """
+
+    if filename == "-":
+        return click.open_file(filename, "wt")
+
+    if filename.endswith(".gz"):
+        return BgzfWriter(filename, threads)
+
+    return PlainWriter(filename)
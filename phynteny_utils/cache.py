@@ -0,0 +1,213 @@
+"""
+Module to cache phynteny scores on disk
+
+The scores of a masked gene only depend on the category sequence of its phage, the index which is masked and the
+models, so they are stored in an SQLite database under a hash of the three. Identical synteny is common across
+prophages and repeated runs, and cached genes skip the models entirely. The least recently used entries are
+removed once the cache holds more than a maximum number of entries.
+"""
+
+# imports
+import os
+import time
+import struct
+import hashlib
+import sqlite3
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    key BLOB PRIMARY KEY,
+    scores BLOB NOT NULL,
+    member_scores BLOB NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used);
+"""
+
+
+def model_fingerprint(files, *settings):
+    """
+    Hash the files the models were loaded from and the settings used to run them. Other files in the models
+    directory, such as exports for another backend, do not change the fingerprint
+
+    :param files: paths of the files the models were loaded from
+    :param settings: settings which change the scores of the models such as the backend
+    :return: fingerprint of the models
+    """
+
+    fingerprint = hashlib.sha256()
+
+    for path in files:
+        fingerprint.update(os.path.basename(path).encode() + b"\0")
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                fingerprint.update(block)
+
+    fingerprint.update(repr(settings).encode())
+
+    return fingerprint.digest()
+
+
+def cache_key(fingerprint, encoding, index):
+    """
+    Generate the key of a masked gene
+
+    :param fingerprint: fingerprint of the models from model_fingerprint
+    :param encoding: integer encoding of the categories of the phage
+    :param index: index of the masked gene
+    :return: key of the gene
+    """
+
+    return hashlib.blake2b(
+        fingerprint
+        + struct.pack("<I", index)
+        + np.asarray(encoding, dtype="<i2").tobytes(),
+        digest_size=16,
+    ).digest()
+
+
+class PredictionCache:
+    """
+    Least recently used cache of the scores of masked genes
+    """
+
+    def __init__(self, path, fingerprint, max_entries=1000000):
+        """
+        :param path: path of the SQLite database to store the cache in. Created if it does not exist
+        :param fingerprint: fingerprint of the models from model_fingerprint
+        :param max_entries: maximum number of genes to keep in the cache
+        """
+
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # workers may share the cache so wait for the other processes rather than failing
+        self.connection = sqlite3.connect(path, timeout=600)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+
+        # count the genes once as adding genes keeps a running count. The maximum size may also be smaller than
+        # when the cache was last used
+        self.evict()
+
+    def keys(self, encoding, unk_idx):
+        """
+        Generate the keys of the masked genes of a phage
+
+        :param encoding: integer encoding of the categories of the phage
+        :param unk_idx: indexes of the masked genes
+        :return: list of keys
+        """
+
+        return [cache_key(self.fingerprint, encoding, i) for i in unk_idx]
+
+    def get(self, keys):
+        """
+        Look up the scores of many genes and mark them as recently used
+
+        :param keys: keys of the genes
+        :return: dictionary mapping each key found to its scores and the softmax of each model
+        """
+
+        found = {}
+
+        # stay below the limit on the number of parameters in a query
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            rows = self.connection.execute(
+                "SELECT key, scores, member_scores FROM scores WHERE key IN (%s)"
+                % ",".join(["?"] * len(chunk)),
+                chunk,
+            ).fetchall()
+
+            for key, scores, member_scores in rows:
+                scores = np.frombuffer(scores, dtype="<f4")
+                found[key] = (
+                    scores,
+                    np.frombuffer(member_scores, dtype="<f4").reshape(-1, len(scores)),
+                )
+
+        hits = len([k for k in keys if k in found])
+        self.hits += hits
+        self.misses += len(keys) - hits
+
+        if len(found) > 0:
+            now = time.time_ns()
+            with self.connection:
+                self.connection.executemany(
+                    "UPDATE scores SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+
+        return found
+
+    def put(self, keys, scores, member_scores):
+        """
+        Add the scores of many genes and remove the least recently used genes if the cache is full
+
+        :param keys: keys of the genes
+        :param scores: scores of each gene with shape (genes, categories)
+        :param member_scores: softmax of each model with shape (models, genes, categories)
+        """
+
+        if len(keys) == 0:
+            return
+
+        now = time.time_ns()
+        scores = np.asarray(scores, dtype="<f4")
+        member_scores = np.asarray(member_scores, dtype="<f4")
+
+        rows = [
+            (
+                scores[i].tobytes(),
+                np.ascontiguousarray(member_scores[:, i]).tobytes(),
+                now,
+                keys[i],
+            )
+            for i in range(len(keys))
+        ]
+
+        with self.connection:
+            added = self.connection.executemany(
+                "INSERT OR IGNORE INTO scores (scores, member_scores, last_used, key) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            ).rowcount
+
+            # another worker may have added some of the genes since they were looked up
+            if added < len(rows):
+                self.connection.executemany(
+                    "UPDATE scores SET scores = ?, member_scores = ?, last_used = ? "
+                    "WHERE key = ?",
+                    rows,
+                )
+
+        self.count += added
+        if self.count > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used genes until the cache holds at most max_entries genes. The cache is only
+        counted again here, to include genes added or removed by other workers sharing it
+        """
+
+        with self.connection:
+            self.count = self.connection.execute(
+                "SELECT COUNT(*) FROM scores"
+            ).fetchone()[0]
+            excess = self.count - self.max_entries
+            if excess > 0:
+                self.count -= self.connection.execute(
+                    "DELETE FROM scores WHERE key IN "
+                    "(SELECT key FROM scores ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                ).rowcount
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,220 @@
+"""
+Module to write the phynteny table as Parquet
+
+Columns are typed rather than written as text: positions are integers, scores and confidence are float32, and
+categories are dictionary encoded against the full list of categories such that every row group shares the same
+categories. Rows are written in row groups as phages are annotated so only the columns which are needed have to be
+read back. Requires pyarrow which is an optional dependency of phynteny.
+"""
+
+# name of the Parquet table in the output directory
+PARQUET_NAME = "phynteny.parquet"
+
+# ways of storing the sequence of each gene
+SEQUENCE_MODES = ["none", "plain", "dictionary"]
+
+
+def import_pyarrow():
+    """
+    Import pyarrow only when Parquet output is requested
+
+    :return: pyarrow and pyarrow.parquet modules
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Parquet output requires pyarrow. Install it with 'pip install pyarrow'"
+        )
+
+    return pyarrow, pyarrow.parquet
+
+
+def gene_columns(key, sequence, phage, phage_predictions, categories, phrog_integer):
+    """
+    Generate the columns of a phage. Columns are numpy arrays such that they can be sent between processes
+    without pyarrow
+
+    :param key: name of the phage
+    :param sequence: sequence of the phage as a string
+    :param phage: dictionary of features extracted from the phage
+    :param phage_predictions: unknown indexes, predictions, scores and confidence of the phage
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :return: dictionary of columns
+    """
+
+    import numpy as np
+
+    unk_idx, predictions, scores, confidence = phage_predictions
+    num_genes = len(phage.get("phrogs"))
+
+    position = np.array(phage.get("position"), dtype=np.int64).reshape(-1, 2)
+    phrogs = np.array(phage.get("phrogs"), dtype=np.int64)
+
+    # known category of each gene where genes without a category are of unknown function
+    known_category = np.array(
+        [phrog_integer.get(p if p != 0 else "No_PHROG") for p in phrogs], dtype=object
+    )
+    known_category[known_category == None] = 0
+
+    # columns which are only filled for the genes phynteny made predictions for. -1 marks a missing category
+    phynteny_category = np.full(num_genes, -1, dtype=np.int8)
+    phynteny_score = np.full(num_genes, np.nan, dtype=np.float32)
+    phynteny_confidence = np.full(num_genes, np.nan, dtype=np.float32)
+
+    if len(predictions) > 0:
+        phynteny_category[unk_idx] = predictions
+        phynteny_score[unk_idx] = np.max(np.asarray(scores), axis=1)
+        phynteny_confidence[unk_idx] = confidence
+
+    columns = {
+        "ID": np.array(phage.get("protein_id"), dtype=object),
+        "start": position[:, 0],
+        "end": position[:, 1],
+        "strand": np.where(np.array(phage.get("sense")) == "+", 1, -1).astype(np.int8),
+        "phrog_id": phrogs,
+        "phrog_category": known_category.astype(np.int8),
+        "phynteny_category": phynteny_category,
+        "phynteny_score": phynteny_score,
+        "confidence": phynteny_confidence,
+        "phage": np.full(num_genes, key, dtype=object),
+        "sequence": np.array([sequence[p[0] : p[1]] for p in position], dtype=object),
+    }
+
+    return columns
+
+
+class ParquetWriter:
+    """
+    Parquet table which is written in row groups as phages are annotated
+    """
+
+    def __init__(self, path, categories, sequences="plain", row_group_size=100000):
+        """
+        :param path: path of the Parquet file to write
+        :param categories: dictionary mapping PHROG categories to their corresponding integer
+        :param sequences: how to store the sequence of each gene. One of ['none', 'plain', 'dictionary']
+        :param row_group_size: number of genes in each row group
+        """
+
+        if sequences not in SEQUENCE_MODES:
+            raise ValueError(f"Invalid sequences. Must be one of {SEQUENCE_MODES}")
+
+        self.pa, self.pq = import_pyarrow()
+
+        self.path = path
+        self.sequences = sequences
+        self.row_group_size = row_group_size
+        self.columns = []
+        self.num_rows = 0
+
+        self.category_names = self.pa.array(
+            [categories.get(i) for i in range(len(categories))]
+        )
+
+        category = self.pa.dictionary(self.pa.int8(), self.pa.string())
+        fields = [
+            ("ID", self.pa.string()),
+            ("start", self.pa.int64()),
+            ("end", self.pa.int64()),
+            ("strand", self.pa.int8()),
+            ("phrog_id", self.pa.int64()),
+            ("phrog_category", category),
+            ("phynteny_category", category),
+            ("phynteny_score", self.pa.float32()),
+            ("confidence", self.pa.float32()),
+            ("phage", self.pa.dictionary(self.pa.int32(), self.pa.string())),
+        ]
+        if sequences == "plain":
+            fields.append(("sequence", self.pa.large_string()))
+        elif sequences == "dictionary":
+            fields.append(
+                (
+                    "sequence",
+                    self.pa.dictionary(self.pa.int32(), self.pa.large_string()),
+                )
+            )
+
+        self.schema = self.pa.schema(fields)
+        self.writer = self.pq.ParquetWriter(
+            path,
+            self.schema,
+            use_dictionary=[
+                "phrog_category",
+                "phynteny_category",
+                "phage",
+            ]
+            + (["sequence"] if sequences == "dictionary" else []),
+        )
+
+    def add(self, columns):
+        """
+        Add the columns of a phage to the table
+
+        :param columns: dictionary of columns from gene_columns
+        """
+
+        self.columns.append(columns)
+        self.num_rows += len(columns.get("start"))
+
+        if self.num_rows >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the waiting phages as a row group
+        """
+
+        if self.num_rows == 0:
+            return
+
+        import numpy as np
+
+        def concat(name):
+            return np.concatenate([c.get(name) for c in self.columns])
+
+        phynteny_category = concat("phynteny_category")
+        missing = np.isnan(concat("phynteny_score"))
+
+        arrays = [
+            self.pa.array(concat("ID"), type=self.pa.string()),
+            self.pa.array(concat("start")),
+            self.pa.array(concat("end")),
+            self.pa.array(concat("strand")),
+            self.pa.array(concat("phrog_id"), mask=concat("phrog_id") == 0),
+            self.pa.DictionaryArray.from_arrays(
+                concat("phrog_category"), self.category_names
+            ),
+            self.pa.DictionaryArray.from_arrays(
+                self.pa.array(phynteny_category, mask=phynteny_category < 0),
+                self.category_names,
+            ),
+            self.pa.array(concat("phynteny_score"), mask=missing),
+            self.pa.array(concat("confidence"), mask=missing),
+            self.pa.array(concat("phage"), type=self.pa.string()).dictionary_encode(),
+        ]
+
+        if self.sequences != "none":
+            sequence = self.pa.array(concat("sequence"), type=self.pa.large_string())
+            if self.sequences == "dictionary":
+                sequence = sequence.dictionary_encode()
+            arrays.append(sequence)
+
+        self.writer.write_table(
+            self.pa.Table.from_arrays(arrays, schema=self.schema),
+            row_group_size=self.num_rows,
+        )
+
+        self.columns = []
+        self.num_rows = 0
+
+    def close(self):
+        """
+        Write any remaining phages and close the file
+        """
+
+        self.flush()
+        self.writer.close()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+from phynteny_utils import statistics
+from phynteny_utils import format_data
+from phynteny_utils import resources
+import click
+import numpy as np
+
+
+@click.command()
+@click.option(
+    "-c",
+    "--confidence_path",
+    type=click.Path(exists=True),
+    help="Dictionary of kernel density estimators to compile",
+    default=resources.resource_path("phrog_annotation_info", "confidence_kde.pkl"),
+)
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(),
+    help="Path to save the compiled confidence curves (.npz)",
+    required=True,
+)
+@click.option(
+    "--step",
+    type=click.FLOAT,
+    help="Spacing of the phynteny scores the confidence is evaluated at",
+    default=0.001,
+    show_default=True,
+)
+def main(confidence_path, outfile, step):
+    category_names = format_data.get_dict(
+        resources.resource_path("phrog_annotation_info", "integer_category.pkl")
+    )
+    confidence_dict = format_data.get_dict(confidence_path)
+
+    print("Compiling confidence curves from " + confidence_path)
+    compiled = statistics.compile_confidence(
+        confidence_dict, category_names, np.arange(0, 10 + step / 2, step)
+    )
+    np.savez_compressed(outfile, **compiled)
+
+    # report how closely the curves match the kernel density estimators
+    max_error = statistics.check_confidence(confidence_dict, compiled, category_names)
+    print("Maximum difference from the kernel density estimators: " + str(max_error))
+    print("Compiled confidence curves saved to " + outfile)
+
+
+if __name__ == "__main__":
+    main()
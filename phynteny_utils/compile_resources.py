@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+from phynteny_utils import format_data
+from phynteny_utils import predictor
+from phynteny_utils import resources
+from phynteny_utils import statistics
+import click
+import hashlib
+import numpy as np
+
+
+@click.command()
+@click.option(
+    "--phrog_integer",
+    type=click.Path(exists=True),
+    help="Dictionary mapping PHROGs to their category integer",
+    default=resources.resource_path("phrog_annotation_info", "phrog_integer.pkl"),
+)
+@click.option(
+    "--categories",
+    type=click.Path(exists=True),
+    help="Dictionary mapping category integers to their names",
+    default=resources.resource_path("phrog_annotation_info", "integer_category.pkl"),
+)
+@click.option(
+    "-c",
+    "--confidence_path",
+    type=click.Path(exists=True),
+    help="Compiled confidence curves (.npz) or dictionary of kernel density estimators which is compiled first",
+    default=resources.resource_path("phrog_annotation_info", "confidence_curves.npz"),
+)
+@click.option(
+    "--step",
+    type=click.FLOAT,
+    help="Spacing of the phynteny scores the confidence is evaluated at when compiling kernel density estimators",
+    default=0.001,
+    show_default=True,
+)
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(),
+    help="Path to save the resource bundle",
+    default=resources.BUNDLE_PATH,
+    show_default=True,
+)
+@click.option(
+    "--version",
+    type=click.STRING,
+    help="Version to record in the bundle. Defaults to a hash of the input files",
+)
+def main(phrog_integer, categories, confidence_path, step, outfile, version):
+    """
+    Compile the PHROG categories, category names and confidence curves into a single memory-mapped bundle
+    """
+
+    if version is None:
+        digest = hashlib.sha256()
+        for path in [phrog_integer, categories, confidence_path]:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        version = digest.hexdigest()[:12]
+
+    category_names = format_data.get_dict(categories)
+
+    if confidence_path.endswith(".npz"):
+        compiled = predictor.get_confidence(confidence_path)
+    else:
+        print("Compiling confidence curves from " + confidence_path)
+        compiled = statistics.compile_confidence(
+            format_data.get_dict(confidence_path),
+            category_names,
+            np.arange(0, 10 + step / 2, step),
+        )
+
+    resources.compile_bundle(
+        outfile, format_data.get_dict(phrog_integer), category_names, compiled, version
+    )
+    print("Resource bundle version " + version + " saved to " + outfile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+from phynteny_utils import predictor
+from phynteny_utils import resources
+from phynteny_utils.models import FUSED_MODEL
+import click
+import glob
+import os
+import sys
+
+
+@click.command()
+@click.option(
+    "-m",
+    "--models",
+    type=click.Path(exists=True),
+    help="Path to directory containing phynteny models",
+    default=resources.MODEL_DIR,
+)
+@click.option(
+    "-o",
+    "--outdir",
+    type=click.Path(),
+    help="Directory to save the converted models",
+    required=True,
+)
+@click.option(
+    "--examples",
+    type=click.INT,
+    help="Number of random masked genomes to check each converted model against",
+    default=1000,
+    show_default=True,
+)
+@click.option(
+    "--tolerance",
+    type=click.FLOAT,
+    help="Largest difference allowed between the softmax of a converted model and the original",
+    default=1e-5,
+    show_default=True,
+)
+def main(models, outdir, examples, tolerance):
+    """
+    Convert the Phynteny models to take category integers rather than one-hot encoded categories
+    """
+
+    import tensorflow as tf
+
+    if os.path.abspath(outdir) == os.path.abspath(models):
+        sys.exit("The converted models must be saved to a different directory")
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    print("Converting the Phynteny models in " + models + " to integer inputs")
+    files = [
+        m
+        for m in sorted(glob.glob(models + "/*.h5"))
+        if os.path.basename(m) != FUSED_MODEL
+    ]
+
+    for m in files:
+        model = tf.keras.models.load_model(m)
+        integer_model = predictor.integer_input_model(model)
+
+        difference = predictor.verify_integer_model(model, integer_model, examples)
+        if difference > tolerance:
+            sys.exit(
+                "The converted model differs from "
+                + m
+                + " by "
+                + str(difference)
+                + ". Not saving it"
+            )
+
+        outfile = os.path.join(outdir, os.path.basename(m))
+        integer_model.save(outfile)
+        print(
+            "Converted "
+            + m
+            + " to "
+            + outfile
+            + ". Largest difference in softmax: "
+            + str(difference)
+        )
+
+
+if __name__ == "__main__":
+    main()
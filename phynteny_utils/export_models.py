@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+from phynteny_utils import numpy_models
+from phynteny_utils import resources
+import click
+
+
+@click.command()
+@click.option(
+    "-m",
+    "--models",
+    type=click.Path(exists=True),
+    help="Path to directory containing phynteny models",
+    default=resources.MODEL_DIR,
+)
+@click.option(
+    "-o",
+    "--outdir",
+    type=click.Path(exists=True),
+    help="Directory to save the exported models. Defaults to the models directory",
+    default=None,
+)
+@click.option(
+    "--bundle",
+    is_flag=True,
+    help="Convert the models to a single bundle in the models directory with a manifest of their shapes and checksums rather than exporting each model",
+)
+def main(models, outdir, bundle):
+    if bundle:
+        print("Converting the Phynteny models in " + models + " to a bundle")
+        print("Phynteny model bundle saved to " + numpy_models.bundle_models(models))
+        return
+
+    if outdir == None:
+        outdir = models
+
+    print("Exporting the Phynteny models in " + models + " for the numpy backend")
+    exported = numpy_models.export_models(models, outdir)
+    print("Exported " + str(len(exported)) + " models to " + outdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,10 @@ import sys
 import shutil
 import pickle5
 from loguru import logger
-from tensorflow.keras.preprocessing.sequence import pad_sequences
-from sklearn.model_selection import train_test_split
+
+# value of the rows after the end of a genome for models with a masking layer. Other models see the padding as
+# unknown genes
+PAD_VALUE = -1
 
 
 def instantiate_dir(output_dir, force):
@@ -151,6 +153,112 @@ def one_hot_encode(sequence, num_functions):
     return np.array(encoding)
 
 
+def pad_sequence(sequence, max_length):
+    """
+    Post-pad an integer encoded sequence with zeros. Equivalent to keras pad_sequences with padding="post"
+
+    :param sequence: integer encoded list of PHROG categories in a sequence
+    :param max_length: length to pad the sequence to. Longer sequences keep their last max_length values
+    :return: padded sequence as a numpy array
+    """
+
+    sequence = np.asarray(sequence, dtype=np.int32)[-max_length:]
+
+    padded = np.zeros(max_length, dtype=np.int32)
+    padded[: len(sequence)] = sequence
+
+    return padded
+
+
+def encode_genome(sequence, num_functions, max_length):
+    """
+    One hot encode an entire padded genome
+
+    :param sequence: integer encoded list of PHROG categories in a sequence
+    :param num_functions: number of possible PHROG categories
+    :param max_length: maximum length of a sequence
+    :return: float32 one-hot matrix of shape (max_length, num_functions)
+    """
+
+    X = np.zeros((max_length, num_functions), dtype=np.float32)
+    X[np.arange(max_length), pad_sequence(sequence, max_length)] = 1
+
+    return X
+
+
+def generate_masked(sequences, masked_idx, num_functions, max_length, pad_value=None):
+    """
+    Generate every masked copy of a batch of genomes in a single tensor
+
+    :param sequences: list of integer encoded PHROG category sequences
+    :param masked_idx: list containing the indexes to mask for each sequence
+    :param num_functions: number of possible PHROG categories
+    :param max_length: maximum length of a sequence
+    :param pad_value: value to fill the rows after the end of each genome with. Defaults to unknown genes
+    :return: float32 tensor of shape (number of masked indexes, max_length, num_functions)
+    """
+
+    # one-hot encode each genome once
+    genomes = np.zeros((len(sequences), max_length, num_functions), dtype=np.float32)
+    for i in range(len(sequences)):
+        genomes[i] = encode_genome(sequences[i], num_functions, max_length)
+
+    # the genome and masked position of each example
+    genome = np.repeat(
+        np.arange(len(sequences)), np.array([len(m) for m in masked_idx], dtype=int)
+    )
+    masked = np.array([i for m in masked_idx for i in m], dtype=int)
+
+    # copy each genome once per masked position and mask the unknowns
+    X = genomes[genome]
+    X[np.arange(len(genome)), masked, :] = 0
+
+    if pad_value is not None:
+        X[pad_rows([len(s) for s in sequences], max_length)[genome]] = pad_value
+
+    return X
+
+
+def pad_rows(lengths, max_length):
+    """
+    Find the rows after the end of each genome
+
+    :param lengths: number of genes in each genome
+    :param max_length: length the genomes are padded to
+    :return: boolean array of shape (genomes, max_length)
+    """
+
+    return np.arange(max_length) >= np.minimum(lengths, max_length)[:, None]
+
+
+def generate_masked_integer(sequences, masked_idx, num_functions, max_length):
+    """
+    Generate every masked copy of a batch of genomes as category integers for models with an integer input.
+    Masked genes are set to num_functions which these models map to a row of zeros
+
+    :param sequences: list of integer encoded PHROG category sequences
+    :param masked_idx: list containing the indexes to mask for each sequence
+    :param num_functions: number of possible PHROG categories
+    :param max_length: maximum length of a sequence
+    :return: int32 array of shape (number of masked indexes, max_length)
+    """
+
+    genomes = np.zeros((len(sequences), max_length), dtype=np.int32)
+    for i in range(len(sequences)):
+        genomes[i] = pad_sequence(sequences[i], max_length)
+
+    # the genome and masked position of each example
+    genome = np.repeat(
+        np.arange(len(sequences)), np.array([len(m) for m in masked_idx], dtype=int)
+    )
+    masked = np.array([i for m in masked_idx for i in m], dtype=int)
+
+    X = genomes[genome]
+    X[np.arange(len(genome)), masked] = num_functions
+
+    return X
+
+
 def one_hot_decode(encoded_seq):
     """
     Return one-hot encoding of PHROG category to its original numeral value
@@ -179,7 +287,7 @@ def generate_example(sequence, num_functions, max_length, idx, unmask=False):
         ValueError("Phage contains more genes than the maximum specified!")
 
     # pad the sequence
-    padded_sequence = pad_sequences([sequence], padding="post", maxlen=max_length)[0]
+    padded_sequence = pad_sequence(sequence, max_length)
 
     # generate encoding
     y = np.array(one_hot_encode(padded_sequence, num_functions))
@@ -209,16 +317,7 @@ def generate_prediction(sequence, num_functions, max_length, idx):
     :return: encoded matrix which can be parsed to the model
     """
 
-    # construct features
-    seq_len = len(sequence)
-    padded_sequence = pad_sequences(sequence, padding="post", maxlen=max_length)[0]
-
-    X = np.array(one_hot_encode(padded_sequence, num_functions))
-
-    # mask the unknown
-    X[idx, 0:num_functions] = np.zeros(num_functions)
-
-    return X.reshape((1, max_length, num_functions))
+    return generate_masked(sequence[:1], [[idx]], num_functions, max_length)
 
 
 def generate_dataset(data, num_functions, max_length, unmask=False):
@@ -284,6 +383,8 @@ def test_train(data, path, num_functions, max_genes=120, test_size=10, unmask=Fa
     :param unamsk: specify if masking should be ignored
     """
 
+    from sklearn.model_selection import train_test_split
+
     # get the keys of the data
     keys = list(data.keys())
 
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+from phynteny_utils import predictor
+from phynteny_utils import resources
+from phynteny_utils.models import FUSED_MODEL
+import click
+import os
+
+
+@click.command()
+@click.option(
+    "-m",
+    "--models",
+    type=click.Path(exists=True),
+    help="Path to directory containing phynteny models. The fused ensemble is saved to this directory",
+    default=resources.MODEL_DIR,
+)
+def main(models):
+    outfile = os.path.join(models, FUSED_MODEL)
+
+    print("Fusing the Phynteny models in " + models)
+    fused = predictor.fuse_models(predictor.get_models(models))
+
+    # record the models the ensemble was fused from such that it is not used once they change
+    fused.save(outfile)
+    predictor.write_fused_manifest(models)
+    print("Fused ensemble saved to " + outfile)
+
+
+if __name__ == "__main__":
+    main()
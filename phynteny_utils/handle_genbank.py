@@ -1,15 +1,54 @@
 """
 Module for manipulating genbank files
 """
+
 # imports
-import pandas as pd
-from pandas.errors import EmptyDataError
 import re
 from loguru import logger
-from Bio import SeqIO
 import gzip
 import random
 import binascii
+import sys
+import io
+import os
+import mmap
+import numpy as np
+from phynteny_utils import bgzf
+
+# qualifiers added by phynteny in the order they are written
+PHYNTENY_QUALIFIERS = ["phynteny", "phynteny_score", "phynteny_confidence"]
+
+# layout of the genbank feature table
+QUALIFIER_INDENT = 21
+QUALIFIER_INDENT_STR = " " * QUALIFIER_INDENT
+MAX_WIDTH = 80
+
+
+class DuplicateKeyError(ValueError):
+    """
+    Raised when a genbank file contains more than one record with the same id
+    """
+
+    def __init__(self, key):
+        super().__init__("Duplicate key '%s'" % key)
+        self.key = key
+
+    def __reduce__(self):
+        # rebuild from the id when the error is sent back from a worker process
+        return DuplicateKeyError, (self.key,)
+
+
+def check_key(key, seen):
+    """
+    Check that a record id has not already been seen in a file and add it to the ids seen
+
+    :param key: record id
+    :param seen: set of record ids already seen in the file
+    """
+
+    if key in seen:
+        raise DuplicateKeyError(key)
+    seen.add(key)
 
 
 def get_mmseqs(phrog_file):
@@ -19,6 +58,10 @@ def get_mmseqs(phrog_file):
     param phrog_filter: location of phrog file to filter
     return: phrog annotations if they exist
     """
+
+    import pandas as pd
+    from pandas.errors import EmptyDataError
+
     try:
         phrog_output = pd.read_csv(
             phrog_file, sep="\t", compression="gzip", header=None
@@ -34,10 +77,12 @@ def get_genbank(genbank):
     """
     Convert genbank file to a dictionary
 
-    param:
+    param genbank: path to the genbank file
     return: genbank file as a dictionary
     """
 
+    from Bio import SeqIO
+
     # if genbank.strip()[-3:] == ".gz":
     if is_gzip_file(genbank.strip()):
         try:
@@ -60,6 +105,474 @@ def get_genbank(genbank):
     return gb_dict
 
 
+def can_split(genbank):
+    """
+    Check whether a genbank file can be split into byte ranges which are parsed separately
+
+    :param genbank: path to a genbank file. Use '-' to read from stdin
+    :return: whether the file is an uncompressed regular file which can be memory-mapped
+    """
+
+    return genbank != "-" and os.path.isfile(genbank) and not is_gzip_file(genbank)
+
+
+def index_genbank(genbank):
+    """
+    Find the byte range of each record in an uncompressed genbank file by scanning the memory-mapped file for
+    the '//' lines which end each record
+
+    :param genbank: path to the genbank file
+    :return: list of the start and end offsets of each record
+    """
+
+    offsets = []
+
+    if os.path.getsize(genbank) == 0:
+        return offsets
+
+    with open(genbank, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        start = 0
+
+        while True:
+            end = mm.find(b"\n//", start)
+            if end == -1:
+                break
+
+            # the record ends after the newline of the '//' line
+            end = mm.find(b"\n", end + 3)
+            end = len(mm) if end == -1 else end + 1
+
+            offsets.append((start, end))
+            start = end
+
+    return offsets
+
+
+def split_offsets(offsets, num_ranges):
+    """
+    Group consecutive records into byte ranges of similar size
+
+    :param offsets: list of the start and end offsets of each record
+    :param num_ranges: number of ranges to create
+    :return: list of the start and end offsets of each range
+    """
+
+    if len(offsets) == 0:
+        return []
+
+    target = (offsets[-1][1] - offsets[0][0]) / max(num_ranges, 1)
+
+    ranges = []
+    start = offsets[0][0]
+
+    for i in range(len(offsets)):
+        if offsets[i][1] - start >= target or i == len(offsets) - 1:
+            ranges.append((start, offsets[i][1]))
+            start = offsets[i][1]
+
+    return ranges
+
+
+def read_range(genbank, start, end):
+    """
+    Parse the records within a byte range of an uncompressed genbank file. Each process maps the file itself
+    such that only the offsets are sent to it
+
+    :param genbank: path to the genbank file
+    :param start: offset of the first byte of the range
+    :param end: offset after the last byte of the range
+    :return: list of record ids and their records
+    """
+
+    from Bio import SeqIO
+
+    with open(genbank, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        text = mm[start:end].decode()
+
+    # ids already seen in the range
+    seen = set()
+
+    try:
+        records = []
+        for record in SeqIO.parse(io.StringIO(text), "gb"):
+            check_key(record.id, seen)
+            records.append((record.id, record))
+
+        return records
+
+    except DuplicateKeyError as e:
+        logger.error(genbank + " contains more than one record with the id " + e.key)
+        raise
+
+    except ValueError:
+        logger.error(genbank + " is not a genbank file!")
+        raise
+
+
+def open_genbank(genbank):
+    """
+    Open a genbank file for reading as text
+
+    :param genbank: path to a genbank file which may be gzipped. Use '-' to read from stdin
+    :return: open handle of the genbank file
+    """
+
+    if genbank == "-":
+        # stdin may also be gzipped so check the first two bytes without consuming them
+        if binascii.hexlify(sys.stdin.buffer.peek(2)[:2]) == b"1f8b":
+            return gzip.open(sys.stdin.buffer, "rt")
+
+        return sys.stdin
+
+    if is_gzip_file(genbank):
+        return gzip.open(genbank, "rt")
+
+    return open(genbank, "rt")
+
+
+def stream_genbank(genbank):
+    """
+    Read the records of a genbank file one at a time such that the whole file is never held in memory
+
+    :param genbank: path to a genbank file which may be gzipped. Use '-' to read from stdin
+    :return: generator of record ids and their records
+    """
+
+    from Bio import SeqIO
+
+    genbank = genbank.strip()
+
+    # ids already seen in the file
+    seen = set()
+
+    handle = open_genbank(genbank)
+
+    try:
+        for record in SeqIO.parse(handle, "gb"):
+            check_key(record.id, seen)
+
+            yield record.id, record
+
+    except DuplicateKeyError as e:
+        logger.error(genbank + " contains more than one record with the id " + e.key)
+        raise
+
+    except ValueError:
+        logger.error(genbank + " is not a genbank file!")
+        raise
+
+    finally:
+        if genbank != "-":
+            handle.close()
+
+
+def parse_location(location):
+    """
+    Get the start, end and sense of a feature from its location string without building a Biopython location.
+    Compound locations span from their first to last base and take the sense of their first part as in extract_features
+
+    :param location: location string from the feature table e.g. complement(join(1..10,20..30))
+    :return: zero-based start, end and sense of the feature
+    """
+
+    # ignore references to other records e.g. J00194.1:100..202
+    positions = [int(p) for p in re.findall(r"\d+", re.sub(r"[\w.]+:", "", location))]
+
+    # the first part is on the reverse strand if it is complemented
+    inner = location
+    for operator in ("join(", "order("):
+        if inner.startswith(operator):
+            inner = inner[len(operator) :]
+    sense = (
+        "-"
+        if location.startswith("complement(") or inner.startswith("complement(")
+        else "+"
+    )
+
+    # a site between two bases has no length
+    if "^" in location and len(positions) == 2:
+        return positions[0], positions[0], sense
+
+    return min(positions) - 1, max(positions), sense
+
+
+def scan_genbank(genbank, sequence=True, raw=False):
+    """
+    Scan the features table of a genbank file for the features required to make predictions.
+    Reads the text of each record directly which is much faster than building Biopython records.
+
+    :param genbank: path to a genbank file which may be gzipped. Use '-' to read from stdin
+    :param sequence: whether to keep the sequence of each record
+    :param raw: whether to keep the lines of each record and where each CDS ends such that it can be written with write_raw
+    :return: generator of record ids and dictionaries of their features in the same format as extract_features
+    """
+
+    genbank = genbank.strip()
+
+    # ids already seen in the file
+    seen = set()
+
+    # characters to remove from the ORIGIN section
+    strip_sequence = str.maketrans("", "", "0123456789 \t\n\r/")
+
+    handle = open_genbank(genbank)
+
+    try:
+        record = None
+
+        for line in handle:
+            # top level keywords start in the first column
+            if line[:1] != " ":
+                keyword = line[:12].strip()
+
+                if keyword == "LOCUS":
+                    fields = line.split()
+                    record = {
+                        "name": fields[1] if len(fields) > 1 else "",
+                        "accession": None,
+                        "version": None,
+                        "length": (
+                            int(fields[2])
+                            if len(fields) > 2 and fields[2].isdigit()
+                            else 0
+                        ),
+                        "features": [],
+                        "sequence": [],
+                        "lines": [line] if raw else None,
+                    }
+                    section = None
+                    continue
+
+                if record is None:
+                    if line.strip() != "":
+                        raise ValueError("Expected a LOCUS line")
+                    continue
+
+                if raw:
+                    record.get("lines").append(line)
+
+                if keyword == "//":
+                    yield scanned_record(record, seen, sequence, strip_sequence)
+                    record = None
+
+                elif keyword == "ACCESSION" and record.get("accession") is None:
+                    fields = line.split()
+                    record["accession"] = fields[1] if len(fields) > 1 else None
+
+                elif keyword == "VERSION":
+                    fields = line.split()
+                    record["version"] = fields[1] if len(fields) > 1 else None
+
+                section = keyword
+                continue
+
+            if raw:
+                record.get("lines").append(line)
+
+            if section == "FEATURES":
+                key = line[5:21].strip()
+                text = line[21:].strip()
+
+                if key != "":
+                    # start of a new feature
+                    feature = {
+                        "type": key,
+                        "location": text,
+                        "qualifiers": {},
+                        "qualifier_lines": {},
+                    }
+                    record.get("features").append(feature)
+                    qualifier = None
+
+                elif text.startswith("/"):
+                    # start of a new qualifier
+                    name, _, value = text[1:].partition("=")
+                    qualifier = name
+                    feature.get("qualifiers")[name] = value
+                    feature.get("qualifier_lines")[name] = []
+
+                elif qualifier is None:
+                    # location spread across several lines
+                    feature["location"] += text
+
+                else:
+                    # qualifier spread across several lines
+                    feature.get("qualifiers")[qualifier] += " " + text
+
+                if raw:
+                    # line after the end of the feature
+                    feature["end"] = len(record.get("lines"))
+                    if qualifier is not None:
+                        feature.get("qualifier_lines")[qualifier].append(
+                            feature.get("end") - 1
+                        )
+
+            elif section == "ORIGIN" and sequence:
+                record.get("sequence").append(line)
+
+        if record is not None:
+            raise ValueError("Premature end of file")
+
+    except DuplicateKeyError as e:
+        logger.error(genbank + " contains more than one record with the id " + e.key)
+        raise
+
+    except ValueError:
+        logger.error(genbank + " is not a genbank file!")
+        raise
+
+    finally:
+        if genbank != "-":
+            handle.close()
+
+
+def scanned_record(record, seen, sequence, strip_sequence):
+    """
+    Convert a record read by scan_genbank into the same features as extract_features
+
+    :param record: dictionary of the text read from the record
+    :param seen: set of record ids already seen in the file
+    :param sequence: whether to keep the sequence of the record
+    :param strip_sequence: translation table to remove line numbers and whitespace from the sequence
+    :return: record id and dictionary of its features
+    """
+
+    # use the same id as Biopython
+    if record.get("version") is not None:
+        key = record.get("version")
+    elif record.get("accession") is not None:
+        key = record.get("accession")
+    else:
+        key = record.get("name")
+
+    check_key(key, seen)
+
+    cds = [f for f in record.get("features") if f.get("type") == "CDS"]
+    locations = [parse_location(c.get("location")) for c in cds]
+
+    protein_id = [unquote(c.get("qualifiers").get("protein_id")) for c in cds]
+    phrogs = [unquote(c.get("qualifiers").get("phrog")) for c in cds]
+    phrogs = ["No_PHROG" if i is None else i for i in phrogs]
+
+    phage = {
+        "length": record.get("length"),
+        "phrogs": phrogs,
+        "protein_id": protein_id,
+        "sense": [l[2] for l in locations],
+        "position": [(l[0], l[1]) for l in locations],
+    }
+
+    if sequence:
+        phage["sequence"] = (
+            "".join(record.get("sequence")).translate(strip_sequence).upper()
+        )
+        phage["length"] = len(phage.get("sequence"))
+
+    if record.get("lines") is not None:
+        phage["lines"] = record.get("lines")
+        phage["cds_end"] = [c.get("end") for c in cds]
+
+        # lines of previous phynteny annotations which are replaced if the gene is annotated again
+        phage["cds_phynteny"] = [
+            [
+                i
+                for q in PHYNTENY_QUALIFIERS
+                for i in c.get("qualifier_lines").get(q, [])
+            ]
+            for c in cds
+        ]
+
+    return key, phage
+
+
+def write_raw(handle, phage, phage_predictions, categories):
+    """
+    Write a record scanned with scan_genbank by copying its original lines.
+    The phynteny qualifiers are inserted after the last line of each annotated CDS rather than rewriting the record
+
+    :param handle: open handle of the output genbank file
+    :param phage: dictionary of features from scan_genbank with raw=True
+    :param phage_predictions: unknown indexes, predictions, scores and confidence of the phage
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    """
+
+    unk_idx, predictions, scores, confidence = phage_predictions
+    lines = phage.get("lines")
+
+    # records with no predictions are unchanged
+    if len(predictions) == 0:
+        handle.writelines(lines)
+        return
+
+    # lines to insert before each line and lines to remove
+    insert = {}
+    remove = set()
+
+    for i in range(len(unk_idx)):
+        values = [
+            categories.get(predictions[i]),
+            str(np.max(scores[i])),
+            str(confidence[i]),
+        ]
+        insert[phage.get("cds_end")[unk_idx[i]]] = "".join(
+            [format_qualifier(q, v) for q, v in zip(PHYNTENY_QUALIFIERS, values)]
+        )
+        remove.update(phage.get("cds_phynteny")[unk_idx[i]])
+
+    for i in range(len(lines)):
+        if i in insert:
+            handle.write(insert.get(i))
+        if i not in remove:
+            handle.write(lines[i])
+
+
+def format_qualifier(key, value):
+    """
+    Format a qualifier as lines of a genbank feature table. Long values are wrapped in the same way as Biopython
+
+    :param key: name of the qualifier
+    :param value: value of the qualifier
+    :return: formatted qualifier
+    """
+
+    line = QUALIFIER_INDENT_STR + f'/{key}="{value.replace(chr(34), chr(34) * 2)}"'
+    lines = []
+
+    while len(line) > MAX_WIDTH:
+        # break at the last space which fits on the line
+        index = line.rfind(" ", QUALIFIER_INDENT + 2, MAX_WIDTH + 1)
+        if index == -1:
+            index = MAX_WIDTH
+
+        lines.append(line[:index] + "\n")
+        line = QUALIFIER_INDENT_STR + line[index:].lstrip()
+
+    lines.append(line + "\n")
+
+    return "".join(lines)
+
+
+def unquote(value):
+    """
+    Remove the quotes around a qualifier value
+
+    :param value: qualifier value as written in the feature table
+    :return: unquoted value
+    """
+
+    if value is None:
+        return None
+
+    if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1].replace('""', '"')
+
+    return value
+
+
 def phrog_to_integer(phrog_annot, phrog_integer):
     """
     Converts phrog annotation to its integer representation
@@ -83,9 +596,7 @@ def extract_features(this_phage):
         (int(this_CDS[i].location.start), int(this_CDS[i].location.end))
         for i in range(len(this_CDS))
     ]
-    sense = [
-        re.split("]", str(this_CDS[i].location))[1][1] for i in range(len(this_CDS))
-    ]
+    sense = [get_sense(this_CDS[i].location) for i in range(len(this_CDS))]
     protein_id = [
         this_CDS[i].qualifiers.get("protein_id") for i in range(len(this_CDS))
     ]
@@ -102,6 +613,22 @@ def extract_features(this_phage):
     }
 
 
+def get_sense(location):
+    """
+    Get the sense of a feature from its location. Compound locations take the sense of their first part
+
+    :param location: location of the feature
+    :return: '+' or '-'
+    """
+
+    strand = location.parts[0].strand
+
+    if strand is None:
+        raise ValueError(f"Feature at {location} has no strand")
+
+    return "-" if strand == -1 else "+"
+
+
 def filter_mmseqs(phrog_output, Eval=1e-5):
     """
     Function to filter the phogs mmseqs output
@@ -230,11 +757,13 @@ def write_genbank(gb_dict, filename):
     write genbank dictionary to a file
     """
 
+    from Bio import SeqIO
+
     keys = list(gb_dict.keys())
 
     # check for gzip
     if filename.strip()[-3:] == ".gz":
-        with gzip.open(filename, "wt") as handle:
+        with bgzf.BgzfWriter(filename) as handle:
             for key in keys:
                 SeqIO.write(gb_dict.get(key), handle, "genbank")
         handle.close()
@@ -0,0 +1,213 @@
+"""
+Module to index the records and proteins in the phynteny outputs
+
+The index is a text file of sorted lines of the form 'id<TAB>file<TAB>offset' which is searched with a binary search
+such that an entry can be found without reading the index or the outputs. Offsets are BGZF virtual offsets for
+compressed outputs.
+"""
+
+# imports
+import os
+import heapq
+import tempfile
+from Bio import bgzf as bio_bgzf
+
+# default name of the index in the output directory
+INDEX_NAME = "phynteny.idx"
+
+
+class IndexWriter:
+    """
+    Collect the positions of records and proteins as the outputs are written and save them as a sorted index.
+    Entries are sorted in chunks which are merged when the index is saved such that large outputs can be indexed
+    without holding every entry in memory
+    """
+
+    def __init__(self, filename, chunk_size=1000000):
+        """
+        :param filename: path of the index to write
+        :param chunk_size: number of entries to sort in memory before they are written to a temporary file
+        """
+
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.entries = []
+        self.chunks = []
+        self.handles = {}
+
+    def add(self, key, handle):
+        """
+        Index the position of the next byte written to an output
+
+        :param key: id to index
+        :param handle: output from bgzf.open_output
+        """
+
+        name = os.path.basename(handle.handle.name)
+        self.handles[name] = handle
+
+        mark = handle.mark()
+        if isinstance(mark, tuple):
+            mark = ".".join([str(m) for m in mark])
+
+        self.entries.append((key.encode(), name, str(mark)))
+
+        if len(self.entries) >= self.chunk_size:
+            self.spill()
+
+    def write_rows(self, handle, rows):
+        """
+        Write table rows and index the id in the first column of each row
+
+        :param handle: output from bgzf.open_output
+        :param rows: table rows to write
+        """
+
+        for row in rows:
+            key = row[: row.index("\t")]
+            if key != "":
+                self.add(key, handle)
+            handle.write(row)
+
+    def spill(self):
+        """
+        Sort the entries in memory and write them to a temporary file
+        """
+
+        self.entries.sort()
+        chunk = tempfile.TemporaryFile(
+            "w+b", dir=os.path.dirname(os.path.abspath(self.filename))
+        )
+        chunk.writelines(
+            [
+                k + b"\t" + n.encode() + b"\t" + m.encode() + b"\n"
+                for k, n, m in self.entries
+            ]
+        )
+        chunk.seek(0)
+
+        self.chunks.append(chunk)
+        self.entries = []
+
+    def resolve(self, line):
+        """
+        Convert the position of an entry to an offset. The outputs must be closed
+
+        :param line: entry from a chunk
+        :return: entry with its offset
+        """
+
+        key, name, mark = line.rstrip(b"\n").split(b"\t")
+        mark = tuple([int(m) for m in mark.split(b".")])
+        mark = mark[0] if len(mark) == 1 else mark
+
+        offset = self.handles.get(name.decode()).virtual_offset(mark)
+
+        return key + b"\t" + name + b"\t" + str(offset).encode() + b"\n"
+
+    def close(self):
+        """
+        Merge the sorted chunks and save the index. Call once the outputs have been closed
+        """
+
+        self.spill()
+
+        with open(self.filename, "wb") as f:
+            for line in heapq.merge(*self.chunks):
+                f.write(self.resolve(line))
+
+        for chunk in self.chunks:
+            chunk.close()
+
+
+def search(index, key):
+    """
+    Find the entries of an id in an index with a binary search
+
+    :param index: path to the index
+    :param key: id to look up
+    :return: list of the output files and offsets of the id
+    """
+
+    key = key.encode()
+    entries = []
+
+    with open(index, "rb") as f:
+        lo = 0
+        hi = os.path.getsize(index)
+
+        # find the first line whose id is not less than the key
+        while lo < hi:
+            mid = (lo + hi) // 2
+            line = line_at(f, mid)
+
+            if line == b"" or line.split(b"\t", 1)[0] >= key:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        line = line_at(f, lo)
+        while line != b"" and line.split(b"\t", 1)[0] == key:
+            k, name, offset = line.rstrip(b"\n").split(b"\t")
+            entries.append((name.decode(), int(offset)))
+            line = f.readline()
+
+    return entries
+
+
+def line_at(f, position):
+    """
+    Read the first line which starts at or after a position
+
+    :param f: index opened in binary mode
+    :param position: byte offset
+    :return: line
+    """
+
+    if position == 0:
+        f.seek(0)
+    else:
+        # a line starts at the position if the previous byte ends a line
+        f.seek(position - 1)
+        f.readline()
+
+    return f.readline()
+
+
+def fetch(directory, name, offset, key):
+    """
+    Read an entry from an output file
+
+    :param directory: directory containing the outputs
+    :param name: name of the output file
+    :param offset: byte offset or BGZF virtual offset of the entry
+    :param key: id of the entry
+    :return: genbank record if the file is a genbank file otherwise the table rows of the id
+    """
+
+    path = os.path.join(directory, name)
+
+    if name.endswith(".gz"):
+        handle = bio_bgzf.BgzfReader(path, "rt")
+    else:
+        handle = open(path, "rt")
+
+    with handle:
+        handle.seek(offset)
+
+        lines = [handle.readline()]
+
+        if ".gbk" in name:
+            # read until the end of the record
+            while lines[-1] != "" and not lines[-1].startswith("//"):
+                lines.append(handle.readline())
+
+        else:
+            # the rows of a phage are written together
+            while True:
+                line = handle.readline()
+                if line == "" or line.rstrip("\n").split("\t")[-1] != key:
+                    break
+                lines.append(line)
+
+    return "".join(lines)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 from phynteny_utils import models
+from phynteny_utils import resources
 import click
-import pkg_resources
 
 
 @click.command()
@@ -15,7 +15,7 @@ import pkg_resources
 def main(outfile):
     if outfile == None:
         print("Downloading Phynteny models to the default location")
-        db_dir = pkg_resources.resource_filename("phynteny_utils", "models")
+        db_dir = resources.MODEL_DIR
         # TODO reorganise the models to also consider the confidence pickle object
 
     else:
@@ -8,8 +8,8 @@ Based on code from https://github.com/gbouras13/pharokka/blob/master/bin/databas
 import os
 import sys
 import subprocess as sp
-import pkg_resources
 import re
+from phynteny_utils import resources
 
 PHYNTENY_MODEL_NAMES = [
     "grid_search_model.m_400.b_256.lr_0.0001.dr_0.1.l_2.a_tanh.o_rmsprop.rep_0.best_val_loss.h5",
@@ -24,6 +24,14 @@ PHYNTENY_MODEL_NAMES = [
     "grid_search_model.m_400.b_256.lr_0.0001.dr_0.1.l_2.a_tanh.o_rmsprop.rep_9.best_val_loss.h5",
 ]
 
+# file names of an ensemble fused into a single graph and the list of the models it was fused from
+FUSED_MODEL = "phynteny_ensemble.h5"
+FUSED_MANIFEST = "phynteny_ensemble.json"
+
+# file names of the weights of every model in a directory converted for the numpy backend and their manifest
+MODEL_BUNDLE = "phynteny_models.npz"
+BUNDLE_MANIFEST = "phynteny_models.json"
+
 
 def instantiate_install(db_dir):
     """
@@ -39,6 +47,34 @@ def instantiate_install(db_dir):
         print("Some models are missing.")
         get_model_zenodo(db_dir)
 
+        # the download does not raise if curl or tar fail so check what arrived
+        downloaded_flag = check_db_installation(db_dir)
+
+    # only bundle the complete ensemble
+    if downloaded_flag == False:
+        install_failed(get_model_url())
+        return
+
+    instantiate_bundle(db_dir)
+
+
+def instantiate_bundle(db_dir):
+    """
+    Convert the downloaded models to a single bundle which loads without TensorFlow
+
+    :param db_dir: path to the model directory
+    """
+
+    from phynteny_utils import numpy_models
+
+    if numpy_models.check_bundle(db_dir):
+        print("The Phynteny model bundle is up to date.")
+        return
+
+    print("Converting the Phynteny models to a bundle")
+    bundle = numpy_models.bundle_models(db_dir)
+    print("Phynteny model bundle saved to " + bundle)
+
 
 def instantiate_dir(db_dir):
     """
@@ -75,7 +111,7 @@ def get_model_url():
     Get the current url of the model
     """
 
-    url_path = pkg_resources.resource_filename("phynteny_utils", "current_models.txt")
+    url_path = resources.resource_path("current_models.txt")
 
     with open(url_path, "r") as file:
         url = file.readline().strip()
@@ -113,8 +149,18 @@ def get_model_zenodo(db_dir):
         # remove tarball
         sp.call(["rm", "-f", os.path.join(db_dir, tarball)])
     except:
-        sys.stderr.write(
-            "Error: Phynteny model install failed. \n Please try again or use the manual option detailed at https://github.com/susiegriggo/Phynteny/tree/main \n downloading from "
-            + url
-        )
+        install_failed(url)
         return 0
+
+
+def install_failed(url):
+    """
+    Report that the models could not be installed
+
+    :param url: url the models were downloaded from
+    """
+
+    sys.stderr.write(
+        "Error: Phynteny model install failed. \n Please try again or use the manual option detailed at https://github.com/susiegriggo/Phynteny/tree/main \n downloading from "
+        + url
+    )
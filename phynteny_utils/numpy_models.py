@@ -0,0 +1,924 @@
+"""
+Module to run Phynteny models using NumPy
+
+Trained models are exported from keras to a compact .npz archive of their weights such that predictions can be made
+without importing TensorFlow. The models in a directory can also be converted to a single uncompressed bundle of float32
+weights with a manifest of their layers, array shapes and checksums, which loads in one read.
+"""
+
+# imports
+import numpy as np
+import io
+import json
+import glob
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from phynteny_utils.models import FUSED_MODEL, MODEL_BUNDLE, BUNDLE_MANIFEST
+
+# version of the layout of the model bundle
+BUNDLE_VERSION = 1
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0, 1)
+
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "sigmoid": sigmoid,
+    "hard_sigmoid": hard_sigmoid,
+    "relu": lambda x: np.maximum(x, 0),
+    "linear": lambda x: x,
+    "softmax": softmax,
+}
+
+
+def get_activation(name):
+    """
+    Get the NumPy implementation of a keras activation function
+
+    :param name: name of the activation function
+    :return: activation function
+    """
+
+    if name not in ACTIVATIONS:
+        raise ValueError(
+            "Activation function "
+            + str(name)
+            + " is not supported. Must be one of "
+            + str(list(ACTIVATIONS.keys()))
+        )
+
+    return ACTIVATIONS.get(name)
+
+
+def model_weights(model):
+    """
+    Get the configuration and weights of a trained keras model
+
+    :param model: keras model built from Bidirectional LSTM layers and a Dense output layer. Models with an integer
+    input start with an Embedding layer which is folded into the input kernel of the first LSTM layer
+    :return: configuration of the layers and dictionary of weights
+    """
+
+    config = {"input_shape": list(model.input_shape[1:]), "layers": []}
+    weights = {}
+
+    # embedding of the category integers of a model with an integer input
+    embedding = None
+
+    for layer in model.layers:
+        layer_type = layer.__class__.__name__
+        prefix = "layer_" + str(len(config.get("layers"))) + "_"
+
+        if layer_type == "Embedding":
+            if len(config.get("layers")) > 0 or embedding is not None:
+                raise ValueError(
+                    "Only an Embedding before the first layer is supported"
+                )
+
+            embedding = layer.get_weights()[0]
+            continue
+
+        if layer_type == "Bidirectional":
+            if layer.get_config().get("merge_mode") != "concat":
+                raise ValueError(
+                    "Only Bidirectional layers with merge_mode concat are supported"
+                )
+
+            lstm_config = layer.forward_layer.get_config()
+            config["layers"].append(
+                {
+                    "type": "Bidirectional",
+                    "activation": lstm_config.get("activation"),
+                    "recurrent_activation": lstm_config.get("recurrent_activation"),
+                    "return_sequences": lstm_config.get("return_sequences"),
+                }
+            )
+
+            for direction, lstm in [
+                ("forward", layer.forward_layer),
+                ("backward", layer.backward_layer),
+            ]:
+                kernel, recurrent_kernel, bias = lstm.get_weights()
+
+                # multiplying the embedding by the kernel gives the input projection of each category integer
+                if embedding is not None and prefix == "layer_0_":
+                    kernel = embedding @ kernel
+
+                weights[prefix + direction + "_kernel"] = kernel
+                weights[prefix + direction + "_recurrent_kernel"] = recurrent_kernel
+                weights[prefix + direction + "_bias"] = bias
+
+        elif layer_type == "Dense":
+            config["layers"].append(
+                {
+                    "type": "Dense",
+                    "activation": layer.get_config().get("activation"),
+                }
+            )
+            kernel, bias = layer.get_weights()
+            weights[prefix + "kernel"] = kernel
+            weights[prefix + "bias"] = bias
+
+        elif layer_type == "Masking":
+            config["layers"].append(
+                {"type": "Masking", "mask_value": float(layer.mask_value)}
+            )
+
+        elif layer_type in ["InputLayer", "Dropout"]:
+            continue
+
+        else:
+            raise ValueError("Layers of type " + layer_type + " cannot be exported")
+
+    return config, weights
+
+
+def export_weights(model, outfile):
+    """
+    Export the weights of a trained keras model to a .npz archive
+
+    :param model: keras model built from Bidirectional LSTM layers and a Dense output layer
+    :param outfile: path of the .npz file to write
+    """
+
+    config, weights = model_weights(model)
+    np.savez_compressed(outfile, config=np.array(json.dumps(config)), **weights)
+
+
+def read_weights(path):
+    """
+    Read the configuration and weights of an exported model
+
+    :param path: path of the .npz file
+    :return: configuration of the layers and dictionary of weights
+    """
+
+    with np.load(path) as archive:
+        config = json.loads(str(archive["config"]))
+        weights = {k: archive[k] for k in archive.files if k != "config"}
+
+    return config, weights
+
+
+def input_projection(X, kernel, bias):
+    """
+    Project the input of an LSTM layer onto its gates
+
+    :param X: input tensor of shape (batch, timesteps, features) or integers of shape (batch, timesteps)
+    :param kernel: input kernel of the layer
+    :param bias: bias of the gates
+    :return: projection of shape (batch, timesteps, 4 * units)
+    """
+
+    # an integer input selects rows of the kernel rather than multiplying a one-hot matrix by it
+    if X.ndim == 2:
+        return kernel[X] + bias
+
+    batch, timesteps, features = X.shape
+
+    return (X.reshape(-1, features) @ kernel + bias).reshape(batch, timesteps, -1)
+
+
+def lstm(
+    X,
+    kernel,
+    recurrent_kernel,
+    bias,
+    activation,
+    recurrent_activation,
+    go_backwards,
+    return_sequences,
+    mask=None,
+):
+    """
+    Run a keras LSTM layer over a batch of sequences
+
+    :param X: input tensor of shape (batch, timesteps, features) or integers of shape (batch, timesteps) which select
+    the rows of the kernel
+    :param kernel: input kernel with the gates ordered input, forget, cell, output
+    :param recurrent_kernel: recurrent kernel
+    :param bias: bias of the gates
+    :param activation: activation function
+    :param recurrent_activation: activation function of the gates
+    :param go_backwards: whether to process the sequence in reverse
+    :param return_sequences: whether to return the output at every timestep
+    :param mask: boolean array of shape (batch, timesteps) where False marks padded timesteps which are skipped
+    :return: output at every timestep aligned to the input or the output at the final timestep
+    """
+
+    batch, timesteps = X.shape[:2]
+    units = recurrent_kernel.shape[0]
+
+    # the input projection of every timestep can be computed at once
+    z_X = input_projection(X, kernel, bias)
+
+    h = np.zeros((batch, units), dtype=np.float32)
+    c = np.zeros((batch, units), dtype=np.float32)
+
+    if return_sequences:
+        outputs = np.zeros((batch, timesteps, units), dtype=np.float32)
+
+    steps = range(timesteps - 1, -1, -1) if go_backwards else range(timesteps)
+
+    for t in steps:
+        h_t, c_t = lstm_step(
+            z_X[:, t], h, c, recurrent_kernel, activation, recurrent_activation
+        )
+        h, c = skip_padding(h_t, c_t, h, c, mask, t)
+
+        if return_sequences:
+            outputs[:, t] = h
+
+    if return_sequences:
+        return outputs
+
+    return h
+
+
+def lstm_masked(
+    X,
+    genome,
+    masked,
+    kernel,
+    recurrent_kernel,
+    bias,
+    activation,
+    recurrent_activation,
+    go_backwards,
+    return_sequences,
+    mask=None,
+):
+    """
+    Run a keras LSTM layer over masked copies of a batch of sequences.
+    States before the masked timestep are the same for every mask of a sequence so are computed once from the
+    unmasked sequence. Only the timesteps from the masked position onwards are recomputed for each mask.
+
+    :param X: unmasked input tensor of shape (batch, timesteps, features) or integers of shape (batch, timesteps)
+    :param genome: array of the sequence each mask belongs to
+    :param masked: array of the timestep to mask in each copy
+    :param kernel: input kernel with the gates ordered input, forget, cell, output
+    :param recurrent_kernel: recurrent kernel
+    :param bias: bias of the gates
+    :param activation: activation function
+    :param recurrent_activation: activation function of the gates
+    :param go_backwards: whether to process the sequence in reverse
+    :param return_sequences: whether to return the output at every timestep
+    :param mask: boolean array of shape (batch, timesteps) where False marks padded timesteps which are skipped
+    :return: output of each masked copy at every timestep or at the final timestep
+    """
+
+    batch, timesteps = X.shape[:2]
+    units = recurrent_kernel.shape[0]
+
+    # input projection of the unmasked sequences. A masked row only contributes the bias
+    z_X = input_projection(X, kernel, bias)
+
+    # order the timesteps are processed in
+    order = np.arange(timesteps)[::-1] if go_backwards else np.arange(timesteps)
+
+    # states of the unmasked sequences where H[s] is the hidden state after s steps
+    H = np.zeros((timesteps + 1, batch, units), dtype=np.float32)
+    C = np.zeros((timesteps + 1, batch, units), dtype=np.float32)
+
+    for s in range(timesteps):
+        h_t, c_t = lstm_step(
+            z_X[:, order[s]],
+            H[s],
+            C[s],
+            recurrent_kernel,
+            activation,
+            recurrent_activation,
+        )
+        H[s + 1], C[s + 1] = skip_padding(h_t, c_t, H[s], C[s], mask, order[s])
+
+    # step at which each mask is reached. Sorting the masks by this step means the masks which are active at each
+    # step are always the first rows
+    mask_steps = timesteps - 1 - masked if go_backwards else masked
+    mask_order = np.argsort(mask_steps, kind="stable")
+    mask_steps = mask_steps[mask_order]
+    genome = genome[mask_order]
+
+    # states shared by each mask up until its masked step
+    h = H[mask_steps, genome]
+    c = C[mask_steps, genome]
+
+    if return_sequences:
+        # outputs of the unmasked sequences aligned to the input
+        shared = np.transpose(H[1:][::-1] if go_backwards else H[1:], (1, 0, 2))
+        outputs = shared[genome]
+
+    for s in range(mask_steps[0], timesteps):
+        t = order[s]
+        start = np.searchsorted(mask_steps, s, side="left")
+        end = np.searchsorted(mask_steps, s, side="right")
+
+        # masks processing their masked timestep only receive the bias
+        z = np.empty((end, 4 * units), dtype=np.float32)
+        z[:start] = z_X[genome[:start], t]
+        z[start:end] = bias
+
+        h_t, c_t = lstm_step(
+            z, h[:end], c[:end], recurrent_kernel, activation, recurrent_activation
+        )
+        h[:end], c[:end] = skip_padding(
+            h_t,
+            c_t,
+            h[:end],
+            c[:end],
+            None if mask is None else mask[genome[:end]],
+            t,
+        )
+
+        if return_sequences:
+            outputs[:end, t] = h[:end]
+
+    # return the masks to their original order
+    unsort = np.argsort(mask_order)
+
+    if return_sequences:
+        return outputs[unsort]
+
+    return h[unsort]
+
+
+def lstm_step(z_x, h, c, recurrent_kernel, activation, recurrent_activation):
+    """
+    Advance the state of an LSTM by a single timestep
+
+    :param z_x: input projection of the timestep including the bias
+    :param h: hidden state
+    :param c: cell state
+    :param recurrent_kernel: recurrent kernel
+    :param activation: activation function
+    :param recurrent_activation: activation function of the gates
+    :return: updated hidden and cell states
+    """
+
+    units = recurrent_kernel.shape[0]
+    z = z_x + h @ recurrent_kernel
+
+    i = recurrent_activation(z[:, :units])
+    f = recurrent_activation(z[:, units : 2 * units])
+    g = activation(z[:, 2 * units : 3 * units])
+    o = recurrent_activation(z[:, 3 * units :])
+
+    c = f * c + i * g
+    h = o * activation(c)
+
+    return h, c
+
+
+def skip_padding(h_t, c_t, h, c, mask, t):
+    """
+    Keep the previous states of the sequences which are padded at a timestep like a keras LSTM after a Masking layer
+
+    :param h_t: hidden state after the timestep
+    :param c_t: cell state after the timestep
+    :param h: hidden state before the timestep
+    :param c: cell state before the timestep
+    :param mask: boolean array of shape (batch, timesteps) where False marks padded timesteps or None
+    :param t: timestep
+    :return: hidden and cell states
+    """
+
+    if mask is None:
+        return h_t, c_t
+
+    keep = mask[:, t, None]
+
+    return np.where(keep, h_t, h), np.where(keep, c_t, c)
+
+
+class NumpyModel:
+    """
+    Bidirectional LSTM model exported from keras which makes predictions with NumPy
+    """
+
+    def __init__(self, path, config=None, weights=None):
+        """
+        :param path: path of the exported model
+        :param config: configuration of the layers if the weights have already been read
+        :param weights: dictionary of weights if they have already been read
+        """
+
+        if weights is None:
+            config, weights = read_weights(path)
+
+        self.weights = {k: v.astype(np.float32, copy=False) for k, v in weights.items()}
+        self.path = path
+        self.layers = config.get("layers")
+        self.input_shape = tuple([None] + config.get("input_shape"))
+
+    def get_weight(self, idx, name):
+        return self.weights.get("layer_" + str(idx) + "_" + name)
+
+    def bidirectional(self, X, idx, mask=None):
+        """
+        Run a Bidirectional LSTM layer
+
+        :param X: input tensor of shape (batch, timesteps, features)
+        :param idx: index of the layer in the model
+        :param mask: boolean array of shape (batch, timesteps) where False marks padded timesteps
+        :return: concatenated forward and backward outputs
+        """
+
+        layer = self.layers[idx]
+        outputs = [
+            lstm(
+                X,
+                self.get_weight(idx, direction + "_kernel"),
+                self.get_weight(idx, direction + "_recurrent_kernel"),
+                self.get_weight(idx, direction + "_bias"),
+                get_activation(layer.get("activation")),
+                get_activation(layer.get("recurrent_activation")),
+                direction == "backward",
+                layer.get("return_sequences"),
+                mask,
+            )
+            for direction in ["forward", "backward"]
+        ]
+
+        return np.concatenate(outputs, axis=-1)
+
+    def bidirectional_masked(self, X, genome, masked, idx=0, mask=None):
+        """
+        Run a Bidirectional LSTM layer over masked copies of a batch of sequences
+
+        :param X: unmasked input tensor of shape (batch, timesteps, features)
+        :param genome: array of the sequence each mask belongs to
+        :param masked: array of the timestep to mask in each copy
+        :param idx: index of the layer in the model
+        :param mask: boolean array of shape (batch, timesteps) where False marks padded timesteps of each sequence
+        :return: concatenated forward and backward outputs for each masked copy
+        """
+
+        layer = self.layers[idx]
+        outputs = [
+            lstm_masked(
+                X,
+                genome,
+                masked,
+                self.get_weight(idx, direction + "_kernel"),
+                self.get_weight(idx, direction + "_recurrent_kernel"),
+                self.get_weight(idx, direction + "_bias"),
+                get_activation(layer.get("activation")),
+                get_activation(layer.get("recurrent_activation")),
+                direction == "backward",
+                layer.get("return_sequences"),
+                mask,
+            )
+            for direction in ["forward", "backward"]
+        ]
+
+        return np.concatenate(outputs, axis=-1)
+
+    def apply_masking(self, X):
+        """
+        Find the padded timesteps of an input if the model starts with a Masking layer
+
+        :param X: input tensor of shape (batch, timesteps, features)
+        :return: input with the padded timesteps set to zero and the mask where False marks padded timesteps. The
+        mask is None if the model has no Masking layer
+        """
+
+        if self.layers[0].get("type") != "Masking":
+            return X, None
+
+        mask = ~np.all(X == self.layers[0].get("mask_value"), axis=-1)
+
+        return np.where(mask[..., None], X, 0).astype(np.float32), mask
+
+    def forward(self, X, start=0, mask=None):
+        """
+        Run a batch through every layer of the model
+
+        :param X: input tensor of shape (batch, timesteps, features)
+        :param start: index of the first layer to run
+        :param mask: boolean array of shape (batch, timesteps) where False marks padded timesteps if the Masking
+        layer has already been applied
+        :return: model output
+        """
+
+        for idx in range(start, len(self.layers)):
+            layer_type = self.layers[idx].get("type")
+
+            if layer_type == "Masking":
+                X, mask = self.apply_masking(X)
+
+            elif layer_type == "Bidirectional":
+                X = self.bidirectional(X, idx, mask)
+
+            elif layer_type == "Dense":
+                activation = get_activation(self.layers[idx].get("activation"))
+                X = activation(
+                    X @ self.get_weight(idx, "kernel") + self.get_weight(idx, "bias")
+                )
+
+        return X
+
+    def predict(self, X, batch_size=128):
+        """
+        Predict the output of the model in batches
+
+        :param X: input tensor of shape (batch, timesteps, features) or category integers of shape (batch, timesteps)
+        :param batch_size: number of examples to process at once
+        :return: model output for every example
+        """
+
+        X = np.asarray(X, dtype=self.input_dtype())
+
+        if len(X) == 0:
+            return np.zeros((0, self.output_size()), dtype=np.float32)
+
+        return np.concatenate(
+            [self.forward(X[i : i + batch_size]) for i in range(0, len(X), batch_size)]
+        )
+
+    def predict_masked(self, genomes, masked_idx, batch_size=128):
+        """
+        Predict the output of the model for every masked copy of a list of genomes.
+        The first layer reuses the states shared between masks of the same genome.
+
+        :param genomes: list of unmasked inputs of shape (timesteps, features)
+        :param masked_idx: list containing the timesteps to mask for each genome
+        :param batch_size: number of masked copies to process at once
+        :return: model output for every masked copy in order
+        """
+
+        # the states are reused in the first Bidirectional layer
+        first = 1 if self.layers[0].get("type") == "Masking" else 0
+        if self.layers[first].get("type") != "Bidirectional":
+            raise ValueError("The first layer of the model must be Bidirectional")
+
+        # split the genomes into chunks with roughly batch_size masks
+        chunks = []
+        chunk = []
+        num_masked = 0
+
+        for i in range(len(genomes)):
+            if len(masked_idx[i]) == 0:
+                continue
+
+            chunk.append(i)
+            num_masked += len(masked_idx[i])
+
+            if num_masked >= batch_size:
+                chunks.append(chunk)
+                chunk = []
+                num_masked = 0
+
+        if len(chunk) > 0:
+            chunks.append(chunk)
+
+        outputs = []
+
+        for chunk in chunks:
+            X = np.array([genomes[i] for i in chunk], dtype=self.input_dtype())
+            genome = np.repeat(
+                np.arange(len(chunk)), [len(masked_idx[i]) for i in chunk]
+            )
+            masked = np.array([m for i in chunk for m in masked_idx[i]], dtype=int)
+
+            X, mask = self.apply_masking(X)
+            outputs.append(
+                self.forward(
+                    self.bidirectional_masked(X, genome, masked, first, mask),
+                    start=first + 1,
+                    mask=None if mask is None else mask[genome],
+                )
+            )
+
+        if len(outputs) == 0:
+            return np.zeros((0, self.output_size()), dtype=np.float32)
+
+        return np.concatenate(outputs)
+
+    def input_dtype(self):
+        """
+        Type of the input of the model. Models with an input of shape (timesteps,) take category integers
+        """
+
+        return np.int64 if len(self.input_shape) == 2 else np.float32
+
+    def output_size(self):
+        """
+        Number of outputs of the model
+        """
+
+        return self.get_weight(len(self.layers) - 1, "bias").shape[0]
+
+
+def export_models(models, outdir):
+    """
+    Export every keras model in a directory to .npz
+
+    :param models: path of the directory containing the .h5 models
+    :param outdir: directory to save the exported models
+    :return: list of exported files
+    """
+
+    import tensorflow as tf
+
+    exported = []
+
+    for m in glob.glob(models + "/*.h5"):
+        # the fused ensemble contains the same weights as its members
+        if os.path.basename(m) == FUSED_MODEL:
+            continue
+
+        outfile = os.path.join(outdir, os.path.basename(m)[:-3] + ".npz")
+        export_weights(tf.keras.models.load_model(m), outfile)
+        logger.info(f"Exported {m} to {outfile}")
+        exported.append(outfile)
+
+    return exported
+
+
+def exported_files(models):
+    """
+    Get the models in a directory which were exported individually
+
+    :param models: path of the directory containing the models
+    :return: sorted list of paths
+    """
+
+    return sorted(
+        [m for m in glob.glob(models + "/*.npz") if os.path.basename(m) != MODEL_BUNDLE]
+    )
+
+
+def bundle_sources(models):
+    """
+    Get the models in a directory which are converted to a bundle. These are the keras models or if there are none
+    the exported models
+
+    :param models: path of the directory containing the models
+    :return: sorted list of paths
+    """
+
+    files = sorted(
+        [m for m in glob.glob(models + "/*.h5") if os.path.basename(m) != FUSED_MODEL]
+    )
+    if len(files) > 0:
+        return files
+
+    return exported_files(models)
+
+
+def file_sha256(path):
+    """
+    Hash a file
+
+    :param path: path of the file
+    :return: hexadecimal sha256 of the file
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def bundle_models(models):
+    """
+    Convert the models in a directory to a bundle of float32 weights and write its manifest
+
+    :param models: path of the directory containing the models
+    :return: path of the bundle
+    """
+
+    sources = bundle_sources(models)
+    if len(sources) == 0:
+        raise ValueError("No models were found in " + models)
+
+    if sources[0].endswith(".h5"):
+        import tensorflow as tf
+
+    arrays = {}
+    members = []
+
+    for i, path in enumerate(sources):
+        if path.endswith(".h5"):
+            config, weights = model_weights(tf.keras.models.load_model(path))
+        else:
+            config, weights = read_weights(path)
+
+        prefix = "member_" + str(i) + "_"
+        weights = {k: np.ascontiguousarray(v, dtype="<f4") for k, v in weights.items()}
+        arrays.update({prefix + k: v for k, v in weights.items()})
+
+        members.append(
+            {
+                "source": os.path.basename(path),
+                "size": os.path.getsize(path),
+                "mtime_ns": os.stat(path).st_mtime_ns,
+                "sha256": file_sha256(path),
+                "config": config,
+                "arrays": {
+                    k: {"shape": list(v.shape), "dtype": v.dtype.str}
+                    for k, v in weights.items()
+                },
+            }
+        )
+        logger.info(f"Added {path} to the model bundle")
+
+    # replace the previous bundle only once the new one is complete
+    bundle = os.path.join(models, MODEL_BUNDLE)
+    with open(bundle + ".tmp", "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(bundle + ".tmp", bundle)
+
+    manifest = {
+        "format_version": BUNDLE_VERSION,
+        "bundle": MODEL_BUNDLE,
+        "size": os.path.getsize(bundle),
+        "sha256": file_sha256(bundle),
+        "members": members,
+    }
+
+    manifest_path = os.path.join(models, BUNDLE_MANIFEST)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return bundle
+
+
+def read_manifest(models):
+    """
+    Read the manifest of the model bundle in a directory
+
+    :param models: path of the directory containing the models
+    :return: manifest or None if there is no bundle
+    """
+
+    manifest_path = os.path.join(models, BUNDLE_MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return None
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def bundle_is_current(models, manifest, verify=False):
+    """
+    Check the models a bundle was converted from are the models in the directory. By default only the names, sizes
+    and modification times of the files are compared such that the check is cheap enough to run every time the models
+    are loaded. Models which have been modified since the bundle was made are compared by their checksums
+
+    :param models: path of the directory containing the models
+    :param manifest: manifest of the bundle
+    :param verify: also compare the checksums of the bundle and the models
+    :return: whether the bundle is up to date
+    """
+
+    if manifest.get("format_version") != BUNDLE_VERSION:
+        return False
+
+    bundle = os.path.join(models, manifest.get("bundle"))
+    sources = bundle_sources(models)
+    members = manifest.get("members")
+
+    if not os.path.isfile(bundle) or os.path.getsize(bundle) != manifest.get("size"):
+        return False
+
+    # the bundle can be used without the models it was converted from
+    if len(sources) > 0:
+        if [os.path.basename(m) for m in sources] != [m.get("source") for m in members]:
+            return False
+        if [os.path.getsize(m) for m in sources] != [m.get("size") for m in members]:
+            return False
+
+        # a model retrained with the same architecture keeps the same size
+        for path, member in zip(sources, members):
+            if os.stat(path).st_mtime_ns == member.get("mtime_ns"):
+                continue
+            if file_sha256(path) != member.get("sha256"):
+                return False
+
+    if verify:
+        if file_sha256(bundle) != manifest.get("sha256"):
+            return False
+        if len(sources) > 0 and [file_sha256(m) for m in sources] != [
+            m.get("sha256") for m in members
+        ]:
+            return False
+
+    return True
+
+
+def check_bundle(models):
+    """
+    Check whether a directory has a bundle matching the checksums of its models
+
+    :param models: path of the directory containing the models
+    :return: whether the bundle exists and is up to date
+    """
+
+    manifest = read_manifest(models)
+
+    return manifest is not None and bundle_is_current(models, manifest, verify=True)
+
+
+def load_bundle(models, manifest):
+    """
+    Load the models in a bundle. The bundle is read in one go and checked against the checksum in its manifest
+
+    :param models: path of the directory containing the bundle
+    :param manifest: manifest of the bundle
+    :return: list of models
+    """
+
+    bundle = os.path.join(models, manifest.get("bundle"))
+    with open(bundle, "rb") as f:
+        data = f.read()
+
+    if hashlib.sha256(data).hexdigest() != manifest.get("sha256"):
+        raise ValueError(
+            f"{bundle} does not match the checksum in its manifest. Rebuild it with export_models --bundle"
+        )
+
+    loaded = []
+    with np.load(io.BytesIO(data)) as archive:
+        for i, member in enumerate(manifest.get("members")):
+            prefix = "member_" + str(i) + "_"
+            weights = {k: archive[prefix + k] for k in member.get("arrays")}
+
+            for k, layout in member.get("arrays").items():
+                if list(weights.get(k).shape) != layout.get("shape"):
+                    raise ValueError(
+                        f"{k} of {member.get('source')} in {bundle} does not match the shape in its manifest"
+                    )
+
+            loaded.append(
+                NumpyModel(
+                    os.path.join(models, member.get("source")),
+                    member.get("config"),
+                    weights,
+                )
+            )
+
+    return loaded
+
+
+def model_files(models):
+    """
+    Get the files load_models reads the models from
+
+    :param models: path of the directory containing the models
+    :return: list of paths. Either the model bundle or the exported models
+    """
+
+    manifest = read_manifest(models)
+    if manifest is not None and bundle_is_current(models, manifest):
+        return [os.path.join(models, manifest.get("bundle"))]
+
+    return exported_files(models)
+
+
+def load_models(models, threads=None):
+    """
+    Load the exported models in a directory. Uses the model bundle if it is up to date, otherwise the exported models
+    are read with a pool of threads
+
+    :param models: path of the directory containing the .npz models
+    :param threads: number of threads to read the exported models with. Defaults to one per model
+    :return: list of models
+    """
+
+    manifest = read_manifest(models)
+    if manifest is not None:
+        if bundle_is_current(models, manifest):
+            logger.info(f"Loading models from {os.path.join(models, MODEL_BUNDLE)}")
+            return load_bundle(models, manifest)
+
+        logger.warning(
+            "The model bundle does not match the models in the directory. Rebuild it with export_models --bundle"
+        )
+
+    files = exported_files(models)
+
+    if len(files) == 0:
+        logger.critical(
+            "No exported models were found in the models directory. Run export_models to export them from keras"
+        )
+        return []
+
+    # decompressing the archives releases the GIL so they are read at the same time
+    with ThreadPoolExecutor(max_workers=threads or len(files)) as executor:
+        return list(executor.map(NumpyModel, files))
@@ -0,0 +1,389 @@
+"""
+Module to annotate phages across multiple processes
+
+An uncompressed genbank file is split into ordered byte ranges which are parsed and annotated by a pool of worker
+processes, so no records are sent between processes. Each worker loads the models once and results are returned in
+the order of the input such that the output is the same as a serial run.
+"""
+
+# imports
+import io
+import os
+import bisect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+from Bio import SeqIO
+from phynteny_utils import predictor
+from phynteny_utils import handle_genbank
+from phynteny_utils import bgzf
+from phynteny_utils import results_db
+from phynteny_utils import columnar
+
+# thread pools which are capped in each worker to avoid oversubscribing the cores
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS",
+]
+
+# predictor loaded by each worker process
+WORKER = {}
+
+# number of shards per worker which may be running or waiting to be returned at once
+SHARDS_PER_WORKER = 2
+
+
+def init_worker(
+    predictor_args, categories, phrog_integer, batch_size, threads, columns=False
+):
+    """
+    Load the predictor of a worker process
+
+    :param predictor_args: arguments used to create the predictor object
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :param batch_size: number of masked genes to gather across phages before running the models
+    :param threads: number of threads each worker can use
+    :param columns: whether to generate the Parquet columns of each phage
+    """
+
+    # cap the TensorFlow thread pools before the models are loaded
+    if predictor_args.get("backend", "keras") == "keras":
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    WORKER["predictor"] = predictor.Predictor(**predictor_args)
+    WORKER["categories"] = categories
+    WORKER["phrog_integer"] = phrog_integer
+    WORKER["batch_size"] = batch_size
+    WORKER["columns"] = columns
+
+
+def annotate_shard(shard):
+    """
+    Annotate a shard of records in a worker process
+
+    :param shard: path, start and end of the byte range of the genbank file to parse
+    :return: list of phage names, records formatted as genbank, table rows, number of genes found, database rows
+    and Parquet columns
+    """
+
+    annotated = []
+
+    for key, record, phage, phage_predictions in predictor.annotate_records(
+        handle_genbank.read_range(*shard),
+        WORKER.get("predictor"),
+        WORKER.get("categories"),
+        WORKER.get("batch_size"),
+    ):
+        handle = io.StringIO()
+        SeqIO.write(record, handle, "genbank")
+        rows, found = predictor.annotation_table(
+            key,
+            str(record.seq),
+            phage,
+            phage_predictions,
+            WORKER.get("categories"),
+            WORKER.get("phrog_integer"),
+        )
+
+        # rows for the results database if the predictor keeps the raw scores
+        db_rows = None
+        if WORKER.get("predictor").raw_scores:
+            db_rows = results_db.gene_rows(
+                key,
+                phage,
+                phage_predictions,
+                WORKER.get("categories"),
+                WORKER.get("phrog_integer"),
+            )
+
+        # columns for the Parquet table
+        columns = None
+        if WORKER.get("columns"):
+            columns = columnar.gene_columns(
+                key,
+                str(record.seq),
+                phage,
+                phage_predictions,
+                WORKER.get("categories"),
+                WORKER.get("phrog_integer"),
+            )
+
+        annotated.append((key, handle.getvalue(), rows, found, db_rows, columns))
+
+    return annotated
+
+
+def make_shards(infile, num_shards):
+    """
+    Split an uncompressed genbank file into byte ranges which the workers parse themselves
+
+    :param infile: path to the genbank file
+    :param num_shards: number of shards to create
+    :return: list of the path, start and end of each shard
+    """
+
+    if not handle_genbank.can_split(infile):
+        raise ValueError(
+            f"{infile} can not be split between workers. Only uncompressed genbank files can be split"
+        )
+
+    return [
+        (infile, start, end)
+        for start, end in handle_genbank.split_offsets(
+            handle_genbank.index_genbank(infile), num_shards
+        )
+    ]
+
+
+def init_tracking(started, initializer, initargs):
+    """
+    Start a worker process which reports the shards it starts
+
+    :param started: queue to put the index of each shard on when it starts
+    :param initializer: function run once when each worker starts
+    :param initargs: arguments of the initializer
+    """
+
+    WORKER["started"] = started
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def run_tracked(function, i, shard):
+    """
+    Report that a shard has started and process it
+
+    :param function: function to apply to the shard
+    :param i: index of the shard
+    :param shard: shard to process
+    :return: result of the function
+    """
+
+    WORKER.get("started").put(i)
+
+    return function(shard)
+
+
+def run_shards(shards, function, workers, initializer=None, initargs=(), retries=2):
+    """
+    Run a function over shards in a process pool and yield the results in order.
+    Shards are retried if their worker crashes or raises an error. A crash is only counted against the shard whose
+    worker died. If several shards were running when a worker died they are run again one at a time to find it.
+    Only shards within SHARDS_PER_WORKER shards per worker of the next shard to return are submitted, so a slow shard
+    does not leave the results of every later shard waiting in memory.
+
+    :param shards: list of shards to process
+    :param function: function to apply to each shard
+    :param workers: number of worker processes
+    :param initializer: function run once when each worker starts
+    :param initargs: arguments of the initializer
+    :param retries: number of times a shard is retried before the run fails
+    :return: generator of the result of each shard in order
+    """
+
+    results = {}
+    window = max(workers, 1) * SHARDS_PER_WORKER
+    attempts = [0 for i in range(len(shards))]
+    pending = set(range(len(shards)))
+    next_shard = 0
+
+    # shards which were running when a worker died and are run one at a time
+    isolated = set()
+
+    # crashes which could not be matched to a shard such as a worker which failed to start
+    unmatched = 0
+
+    # spawn fresh processes rather than forking a parent which may have loaded TensorFlow
+    context = multiprocessing.get_context("spawn")
+
+    while len(pending) > 0:
+        # a simple queue is written to directly so the message is not lost if the worker dies
+        started = context.SimpleQueue()
+        submit = isolated if len(isolated) > 0 else pending
+        crashed = False
+
+        with ProcessPoolExecutor(
+            max_workers=1 if len(isolated) > 0 else workers,
+            mp_context=context,
+            initializer=init_tracking,
+            initargs=(started, initializer, initargs),
+        ) as pool:
+            queue = sorted(submit)
+            futures = {}
+
+            while (len(queue) > 0 and not crashed) or len(futures) > 0:
+                # a pool cannot take more shards once a worker has died
+                while len(queue) > 0 and queue[0] < next_shard + window and not crashed:
+                    i = queue.pop(0)
+                    futures[pool.submit(run_tracked, function, i, shards[i])] = i
+
+                done, not_done = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    i = futures.pop(future)
+
+                    try:
+                        results[i] = future.result()
+                        pending.discard(i)
+                        isolated.discard(i)
+
+                    except handle_genbank.DuplicateKeyError:
+                        # the input is invalid so retrying the shard would fail the same way
+                        raise
+
+                    except BrokenProcessPool:
+                        # every unfinished shard fails once a worker dies
+                        crashed = True
+
+                    except Exception as e:
+                        attempts[i] += 1
+                        logger.warning(f"Shard {i} failed: {e}")
+
+                        # retry the shard in the same pool
+                        bisect.insort(queue, i)
+
+                    if attempts[i] > retries:
+                        raise RuntimeError(
+                            f"Shard {i} failed after {retries} retries. Phynteny could not be completed"
+                        )
+
+                # return finished shards in order
+                while next_shard in results:
+                    yield results.pop(next_shard)
+                    next_shard += 1
+
+        if crashed:
+            # the shards which started but did not finish were running when the worker died
+            running = set()
+            while not started.empty():
+                running.add(started.get())
+            running = running & pending
+
+            if len(running) == 1:
+                i = running.pop()
+                attempts[i] += 1
+                logger.warning(f"Worker crashed while processing shard {i}")
+
+                if attempts[i] > retries:
+                    raise RuntimeError(
+                        f"Shard {i} failed after {retries} retries. Phynteny could not be completed"
+                    )
+
+            elif len(running) > 1:
+                logger.warning(
+                    f"A worker crashed while processing one of shards {sorted(running)}. Running them one at a time"
+                )
+                isolated |= running
+
+            else:
+                unmatched += 1
+                logger.warning("A worker crashed before it started a shard")
+
+                if unmatched > retries:
+                    raise RuntimeError(
+                        f"Workers crashed {unmatched} times before starting a shard. Phynteny could not be completed"
+                    )
+
+        if len(pending) > 0:
+            logger.info(f"Retrying {len(pending)} shards")
+
+
+def run_phynteny(
+    genbank_file,
+    table_file,
+    predictor_args,
+    shards,
+    categories,
+    phrog_integer,
+    batch_size=1024,
+    workers=2,
+    retries=2,
+    index=None,
+    db=None,
+    parquet=None,
+):
+    """
+    Run Phynteny across multiple processes
+
+    :param genbank_file: path to output genbank file
+    :param table_file: path to output table
+    :param predictor_args: arguments used to create the predictor object in each worker
+    :param shards: shards of the genbank file from make_shards
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :param batch_size: number of masked genes to gather across phages before running the models
+    :param workers: number of worker processes
+    :param retries: number of times a shard is retried if its worker crashes
+    :param index: index.IndexWriter to add the position of each phage and protein to
+    :param db: results_db.ResultsDB to add the results of each gene to. The predictor must keep its raw scores
+    :param parquet: columnar.ParquetWriter to add the rows of each phage to
+    :return: number of genes found with a confidence of at least 90%
+    """
+
+    threads = max(1, os.cpu_count() // workers)
+    logger.info(
+        f"Annotating {len(shards)} shards across {workers} workers with {threads} threads each"
+    )
+
+    # workers inherit the environment so cap their thread pools before they start
+    environment = {v: os.environ.get(v) for v in THREAD_VARIABLES}
+    for v in THREAD_VARIABLES:
+        os.environ[v] = str(threads) if v != "TF_NUM_INTEROP_THREADS" else "1"
+
+    # count the number of genes found
+    found = 0
+
+    # ids already seen in the file
+    seen = set()
+
+    try:
+        with bgzf.open_output(genbank_file) as handle, bgzf.open_output(
+            table_file
+        ) as f:
+            f.write(predictor.TABLE_HEADER)
+
+            for annotated in run_shards(
+                shards,
+                annotate_shard,
+                workers,
+                init_worker,
+                (
+                    predictor_args,
+                    categories,
+                    phrog_integer,
+                    batch_size,
+                    threads,
+                    parquet is not None,
+                ),
+                retries,
+            ):
+                for key, genbank, rows, shard_found, db_rows, columns in annotated:
+                    handle_genbank.check_key(key, seen)
+
+                    if index is not None:
+                        index.add(key, handle)
+                    handle.write(genbank)
+                    predictor.write_rows(f, key, rows, index)
+                    if db is not None:
+                        db.add(db_rows)
+                    if parquet is not None:
+                        parquet.add(columns)
+                    found += shard_found
+                    logger.info(f"Annotated the phage {key}")
+
+    finally:
+        for v in THREAD_VARIABLES:
+            if environment.get(v) is None:
+                os.environ.pop(v)
+            else:
+                os.environ[v] = environment.get(v)
+
+    return found
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+from phynteny_utils import handle_genbank
+from phynteny_utils import serve
+import click
+import gzip
+import json
+
+
+@click.command()
+@click.argument("infile", type=click.Path(exists=True))
+@click.option(
+    "-u",
+    "--url",
+    type=click.STRING,
+    help="Address of the Phynteny server",
+    default="http://127.0.0.1:8080",
+    show_default=True,
+)
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(),
+    help="Output file. Defaults to stdout",
+    default="-",
+)
+@click.option(
+    "-f",
+    "--format",
+    "input_format",
+    type=click.Choice(["genbank", "phrogs", "categories"]),
+    help="Format of the input file. phrogs and categories take a json file mapping each phage to its list of PHROGs or category encodings",
+    default="genbank",
+    show_default=True,
+)
+@click.option(
+    "--json",
+    "as_json",
+    is_flag=True,
+    help="Write the predictions as json lines. Always used for phrogs and categories input",
+)
+def main(infile, url, outfile, input_format, as_json):
+    """
+    Annotate a genbank file, or phages already encoded as PHROGs or categories, using a running Phynteny server
+    """
+
+    if handle_genbank.is_gzip_file(infile):
+        with gzip.open(infile, "rt") as handle:
+            text = handle.read()
+    else:
+        with open(infile, "rt") as handle:
+            text = handle.read()
+
+    if input_format == "genbank":
+        body = {"genbank": text}
+    else:
+        try:
+            body = {input_format: json.loads(text)}
+        except json.JSONDecodeError:
+            raise click.BadParameter(
+                "must be a json file when --format is " + input_format,
+                param_hint="INFILE",
+            )
+        as_json = True
+
+    with click.open_file(outfile, "wt") as out:
+        for result in serve.request_predictions(url, body):
+            if as_json:
+                result.pop("genbank", None)
+                out.write(json.dumps(result) + "\n")
+            else:
+                out.write(result.get("genbank"))
+
+
+if __name__ == "__main__":
+    main()
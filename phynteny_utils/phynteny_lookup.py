@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+from phynteny_utils import index
+import click
+import os
+import sys
+
+
+@click.command()
+@click.argument("ids", nargs=-1, required=True)
+@click.option(
+    "-o",
+    "--out",
+    type=click.Path(exists=True),
+    help="Phynteny output directory containing the index",
+    default=".",
+    show_default=True,
+)
+@click.option(
+    "--table",
+    is_flag=True,
+    help="Only return table rows",
+)
+@click.option(
+    "--genbank",
+    is_flag=True,
+    help="Only return genbank records",
+)
+def main(ids, out, table, genbank):
+    """
+    Fetch the predictions for phages or proteins from the indexed output of phynteny --index
+    """
+
+    index_path = os.path.join(out, index.INDEX_NAME)
+    if not os.path.exists(index_path):
+        click.echo(f"Error: no index found at {index_path}. Run phynteny with --index")
+        sys.exit(1)
+
+    missing = 0
+
+    for key in ids:
+        entries = index.search(index_path, key)
+
+        if table:
+            entries = [e for e in entries if ".tsv" in e[0]]
+        if genbank:
+            entries = [e for e in entries if ".gbk" in e[0]]
+
+        if len(entries) == 0:
+            click.echo(f"{key} was not found", err=True)
+            missing += 1
+
+        for name, offset in entries:
+            click.echo(index.fetch(out, name, offset, key), nl=False)
+
+    if missing > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
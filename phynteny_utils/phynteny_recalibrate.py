@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+from phynteny_utils import format_data
+from phynteny_utils import predictor
+from phynteny_utils import recalibrate
+from phynteny_utils import results_db
+from phynteny_utils import index
+from phynteny_utils import resources
+from loguru import logger
+import click
+import os
+import sqlite3
+import sys
+import time
+
+
+def find_output(directory, name):
+    """
+    Find an output of phynteny which may be compressed
+
+    :param directory: phynteny output directory
+    :param name: name of the uncompressed output
+    :return: name of the output or None if it does not exist
+    """
+
+    for filename in [name, name + ".gz"]:
+        if os.path.exists(os.path.join(directory, filename)):
+            return filename
+
+    return None
+
+
+@click.command()
+@click.argument("indir", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--db",
+    type=click.Path(exists=True),
+    help="Results database written by phynteny --db. The confidence column is updated in place",
+    required=True,
+)
+@click.option(
+    "-c",
+    "--confidence_path",
+    type=click.Path(exists=True),
+    help="Resource bundle, compiled confidence curves (.npz) or dictionary of kernel desnity estimators to use for predicting confidence",
+    default=resources.BUNDLE_PATH,
+)
+@click.option(
+    "-o",
+    "--out",
+    type=click.STRING,
+    help="output directory for the recalibrated genbank file and table",
+    required=True,
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Overwrite output directory",
+)
+@click.option(
+    "--index",
+    "make_index",
+    is_flag=True,
+    help="Write an index of the recalibrated outputs which can be searched with phynteny_lookup",
+)
+def main(indir, db, confidence_path, out, force, make_index):
+    """
+    Recompute the confidence of the predictions in a phynteny output directory with a new confidence model
+    using the scores kept in the results database rather than running the models again
+    """
+
+    start_time = time.time()
+
+    if os.path.abspath(out) == os.path.abspath(indir):
+        click.echo("Error: the output directory must differ from the input directory")
+        sys.exit(1)
+
+    format_data.instantiate_dir(out, force)
+    logger.add(out + "/phynteny.log", level="DEBUG")
+    logger.info("Starting Phynteny recalibration")
+
+    connection = sqlite3.connect(db)
+    categories = results_db.read_categories(connection)
+
+    # recompute the confidence of every gene at once
+    logger.info(f"Reading scores from {db}")
+    rowids, records, genes, scores = results_db.read_scores(connection)
+    logger.info(f"Confidence object located at {confidence_path}")
+    predictions, scores, confidence = recalibrate.recalibrate(
+        scores, predictor.get_confidence(confidence_path), categories
+    )
+    phage_dict = recalibrate.group_predictions(
+        records, genes, predictions, scores, confidence
+    )
+    logger.info(f"Recalibrated {len(rowids)} predictions")
+
+    output_index = (
+        index.IndexWriter(out + "/" + index.INDEX_NAME) if make_index else None
+    )
+
+    # rewrite the outputs which are present in the input directory
+    genbank_file = find_output(indir, "phynteny.gbk")
+    if genbank_file is not None:
+        recalibrate.recalibrate_genbank(
+            os.path.join(indir, genbank_file),
+            os.path.join(out, genbank_file),
+            phage_dict,
+            categories,
+            output_index,
+        )
+        logger.info(f"Recalibrated genbank file written to {out}/{genbank_file}")
+
+    table_file = find_output(indir, "phynteny.tsv")
+    if table_file is not None:
+        recalibrate.recalibrate_table(
+            os.path.join(indir, table_file),
+            os.path.join(out, table_file),
+            phage_dict,
+            categories,
+            output_index,
+        )
+        logger.info(f"Recalibrated table written to {out}/{table_file}")
+
+    if output_index is not None:
+        output_index.close()
+
+    # the database is only updated once the outputs have been written
+    results_db.update_confidence(connection, rowids, confidence)
+    connection.close()
+
+    found = int(sum(confidence > 0.9))
+    logger.info(f"Phynteny found {found} genes with a confidence of at least 90%")
+    logger.info(f"Recalibration took {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
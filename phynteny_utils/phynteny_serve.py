@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+from phynteny_utils import format_data
+from phynteny_utils import predictor
+from phynteny_utils import serve
+from phynteny_utils import resources
+from loguru import logger
+import click
+
+
+@click.command()
+@click.option(
+    "-m",
+    "--models",
+    type=click.Path(exists=True),
+    help="Path to directory containing phynteny models",
+    default=resources.MODEL_DIR,
+)
+@click.option(
+    "-c",
+    "--confidence_path",
+    type=click.Path(exists=True),
+    help="Resource bundle, compiled confidence curves (.npz) or dictionary of kernel desnity estimators to use for predicting confidence",
+    default=resources.BUNDLE_PATH,
+)
+@click.option("--host", type=click.STRING, default="127.0.0.1", show_default=True)
+@click.option("-p", "--port", type=click.INT, default=8080, show_default=True)
+@click.option(
+    "-b",
+    "--batch_size",
+    type=click.INT,
+    help="Number of masked genes which triggers a batch to run immediately",
+    default=1024,
+    show_default=True,
+)
+@click.option(
+    "-l",
+    "--latency",
+    type=click.FLOAT,
+    help="Maximum milliseconds a request waits for other requests to join its batch",
+    default=50,
+    show_default=True,
+)
+@click.option(
+    "--fused",
+    is_flag=True,
+    help="Run the ensemble as a single fused graph. Uses the ensemble saved by fuse_models if it matches the models in the directory",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["auto", "keras", "numpy"]),
+    help="Library used to run the models. The numpy backend requires models exported with export_models. auto uses numpy if the models have been converted to a bundle by install_models or export_models --bundle",
+    default="auto",
+    show_default=True,
+)
+@click.option(
+    "--reuse_states",
+    is_flag=True,
+    help="Compute the LSTM states shared by the unknown genes of a phage once. Requires the numpy backend",
+)
+@click.option(
+    "--sliding_window",
+    is_flag=True,
+    help="Annotate phages with more genes than the models take by scoring each unknown gene in a window of genes centred on it. Otherwise these phages are skipped",
+)
+def main(
+    models,
+    confidence_path,
+    host,
+    port,
+    batch_size,
+    latency,
+    fused,
+    backend,
+    reuse_states,
+    sliding_window,
+):
+    """
+    Serve Phynteny predictions from a warm predictor
+    """
+
+    categories = predictor.get_categories(resources.BUNDLE_PATH)
+
+    gene_predictor = predictor.Predictor(
+        models,
+        resources.BUNDLE_PATH,
+        confidence_path,
+        resources.BUNDLE_PATH,
+        fused,
+        backend,
+        reuse_states,
+        sliding_window=sliding_window,
+    )
+
+    server = serve.make_server(
+        gene_predictor, categories, host, port, batch_size, latency / 1000
+    )
+    logger.info(f"Serving Phynteny predictions at http://{host}:{port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping Phynteny server")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
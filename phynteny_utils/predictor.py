@@ -5,18 +5,38 @@ Is an option to parse an custom dictionary for the confidence kde if the user tr
 """
 
 # imports
-import tensorflow as tf
 import pickle
+import contextlib
+import json
 from phynteny_utils import format_data
 import numpy as np
 import glob
+import os
 import sys
 from loguru import logger
 from phynteny_utils import statistics
 from phynteny_utils import handle_genbank
-from Bio import SeqIO
+from phynteny_utils import numpy_models
+from phynteny_utils import bgzf
+from phynteny_utils import results_db
+from phynteny_utils import columnar
+from phynteny_utils import cache
+from phynteny_utils import resources
+from phynteny_utils.models import FUSED_MODEL, FUSED_MANIFEST, BUNDLE_MANIFEST
 import click
 
+# maximum number of genes in a phage the models were trained on. Models with a masking layer take any length
+MAX_LENGTH = 120
+
+# number of genes spanned by each length bucket of models with a masking layer
+BUCKET_WIDTH = 10
+
+# maximum number of phages held while masked genes are gathered into a batch
+MAX_BATCH_PHAGES = 256
+
+# columns of the output table
+TABLE_HEADER = "ID\tstart\tend\tstrand\tphrog_id\tphrog_category\tphynteny_category\tphynteny_score\tconfidence\tsequence\tphage\n"
+
 
 def get_dict(dict_path):
     """
@@ -34,14 +54,115 @@ def get_dict(dict_path):
     return dictionary
 
 
-def get_models(models):
+def get_phrog_integer(phrog_categories_path):
+    """
+    Load the mapping of PHROGs to their category integer
+
+    :param phrog_categories_path: path to a resource bundle or a pickled dictionary
+    :return: dictionary or array backed mapping of PHROGs to categories
+    """
+
+    if resources.is_bundle(phrog_categories_path):
+        return resources.load_bundle(phrog_categories_path).phrog_integer
+
+    return get_dict(phrog_categories_path)
+
+
+def get_categories(category_names_path):
+    """
+    Load the names of the PHROG categories
+
+    :param category_names_path: path to a resource bundle or a pickled dictionary
+    :return: dictionary mapping each category integer to its name
+    """
+
+    if resources.is_bundle(category_names_path):
+        return resources.load_bundle(category_names_path).categories
+
+    return get_dict(category_names_path)
+
+
+def get_confidence(confidence_path):
+    """
+    Load the object used to compute confidence
+
+    :param confidence_path: path to a resource bundle, compiled confidence curves (.npz) or a pickled dictionary of kernel density estimators
+    :return: confidence dictionary
+    """
+
+    if resources.is_bundle(confidence_path):
+        return resources.load_bundle(confidence_path).confidence
+
+    if confidence_path.endswith(".npz"):
+        with np.load(confidence_path) as compiled:
+            return {"grid": compiled["grid"], "curves": compiled["curves"]}
+
+    return get_dict(confidence_path)
+
+
+def resolve_backend(models, backend):
+    """
+    Choose the library used to run the models
+
+    :param models: path of directory where model obejects are located
+    :param backend: one of ['auto', 'keras', 'numpy']. auto uses numpy if the models have been converted to a bundle
+    which is up to date
+    :return: library used to run the models
+    """
+
+    if backend != "auto":
+        return backend
+
+    manifest = numpy_models.read_manifest(models)
+    if manifest is None:
+        return "keras"
+    if numpy_models.bundle_is_current(models, manifest):
+        return "numpy"
+
+    # fall back to the keras models rather than the exported models they replace
+    if any([m.endswith(".h5") for m in numpy_models.bundle_sources(models)]):
+        logger.warning(
+            "The model bundle does not match the models in the directory. Using the keras models instead. Rebuild it with export_models --bundle"
+        )
+        return "keras"
+
+    return "numpy"
+
+
+def get_models(models, fused=False, backend="keras"):
     """
     Load in genbank models
 
     :param models: path of directory where model obejects are located
+    :param fused: whether to combine the models into a single ensemble graph
+    :param backend: library used to run the models. One of ['auto', 'keras', 'numpy']
     :return: list of models to iterate over
     """
-    files = glob.glob(models + "/*")
+
+    backend = resolve_backend(models, backend)
+
+    if backend == "numpy":
+        if fused:
+            logger.warning(
+                "The numpy backend does not fuse the ensemble. Each model is run in turn"
+            )
+        return numpy_models.load_models(models)
+    elif backend != "keras":
+        raise ValueError("Invalid backend. Must be one of ['auto', 'keras', 'numpy']")
+
+    import tensorflow as tf
+
+    fused_path = os.path.join(models, FUSED_MODEL)
+    files = keras_files(models)
+
+    if fused and os.path.isfile(fused_path):
+        if fused_is_current(models):
+            logger.info(f"Loading fused ensemble from {fused_path}")
+            return [tf.keras.models.load_model(fused_path)]
+
+        logger.warning(
+            f"{fused_path} does not match the models in the directory. Fusing the models again. Rebuild it with fuse_models"
+        )
 
     if len(files) == 0:
         logger.critical("Models directory is empty")
@@ -54,10 +175,241 @@ def get_models(models):
             "there are files in your models directory which are not tensorflow models"
         )
 
-    return [tf.keras.models.load_model(m) for m in files if "h5" in m]
+    members = [tf.keras.models.load_model(m) for m in files if "h5" in m]
+
+    if fused:
+        return [fuse_models(members)]
+
+    return members
+
+
+def keras_files(models):
+    """
+    Get the files in a models directory which may be members of the ensemble
+
+    :param models: path of directory where model obejects are located
+    :return: list of paths
+    """
+
+    # a previously fused ensemble, exported weights or the model bundle are not members of the ensemble
+    return [
+        m
+        for m in glob.glob(models + "/*")
+        if os.path.basename(m) not in [FUSED_MODEL, FUSED_MANIFEST, BUNDLE_MANIFEST]
+        and not m.endswith(".npz")
+    ]
+
+
+def member_files(models):
+    """
+    Get the keras models in a directory which are members of the ensemble
+
+    :param models: path of directory where model obejects are located
+    :return: sorted list of paths
+    """
+
+    return sorted([m for m in keras_files(models) if "h5" in m])
+
+
+def member_stats(models):
+    """
+    Get the names, sizes and modification times of the members of the ensemble
+
+    :param models: path of directory where model obejects are located
+    :return: list of dictionaries describing each member
+    """
+
+    return [
+        {
+            "source": os.path.basename(m),
+            "size": os.path.getsize(m),
+            "mtime_ns": os.stat(m).st_mtime_ns,
+        }
+        for m in member_files(models)
+    ]
+
+
+def write_fused_manifest(models):
+    """
+    Record the models an ensemble saved to the models directory was fused from
+
+    :param models: path of directory where model obejects are located
+    :return: path of the manifest
+    """
+
+    manifest_path = os.path.join(models, FUSED_MANIFEST)
+    with open(manifest_path, "w") as f:
+        json.dump({"members": member_stats(models)}, f, indent=2)
+
+    return manifest_path
+
+
+def fused_is_current(models):
+    """
+    Check the fused ensemble in a directory was fused from the models in the directory. Only the names, sizes and
+    modification times of the files are compared such that the check is cheap enough to run every time the models
+    are loaded
+
+    :param models: path of directory where model obejects are located
+    :return: whether the fused ensemble is up to date
+    """
+
+    members = member_stats(models)
+
+    # the fused ensemble can be used without the models it was fused from
+    if len(members) == 0:
+        return True
+
+    manifest_path = os.path.join(models, FUSED_MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return False
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    return members == manifest.get("members")
+
+
+def model_files(models, fused=False, backend="keras"):
+    """
+    Get the files get_models reads the models from
+
+    :param models: path of directory where model obejects are located
+    :param fused: whether to combine the models into a single ensemble graph
+    :param backend: library used to run the models. One of ['auto', 'keras', 'numpy']
+    :return: sorted list of paths
+    """
+
+    backend = resolve_backend(models, backend)
+
+    if backend == "numpy":
+        return numpy_models.model_files(models)
+
+    fused_path = os.path.join(models, FUSED_MODEL)
+    if fused and os.path.isfile(fused_path) and fused_is_current(models):
+        return [fused_path]
+
+    return member_files(models)
+
+
+def fuse_models(models):
+    """
+    Combine an ensemble of models into a single graph which returns the summed softmax of each model
+
+    :param models: list of models which have already been read in
+    :return: fused model
+    """
+
+    import tensorflow as tf
+
+    inputs = tf.keras.Input(
+        shape=models[0].input_shape[1:], dtype=models[0].inputs[0].dtype
+    )
+
+    # give each member a unique name so they can be nested in the same graph
+    outputs = []
+    for i in range(len(models)):
+        models[i]._name = "member_" + str(i)
+        outputs.append(models[i](inputs))
+
+    if len(outputs) > 1:
+        outputs = tf.keras.layers.Add(name="phynteny_score")(outputs)
+    else:
+        outputs = outputs[0]
+
+    return tf.keras.Model(inputs=inputs, outputs=outputs, name="phynteny_ensemble")
+
+
+def is_integer_model(model):
+    """
+    Check whether a model takes category integers rather than one-hot encoded categories
+
+    :param model: keras or numpy model
+    :return: whether the input of the model has shape (batch, max_length)
+    """
+
+    return len(model.input_shape) == 2
+
+
+def is_masking_model(model):
+    """
+    Check whether a model starts with a masking layer which skips the padding after the end of each genome
+
+    :param model: keras or numpy model
+    :return: whether the model takes genomes of any length
+    """
+
+    return model.input_shape[1] is None
+
+
+def integer_input_model(model):
+    """
+    Rewrite a model which takes one-hot encoded categories into an equivalent model which takes category integers.
+    A frozen embedding with the one-hot encoding of each category replaces the one-hot input, and the mask token
+    num_functions maps to a row of zeros like a masked gene
+
+    :param model: model with input shape (batch, max_length, num_functions) built from a stack of layers
+    :return: model with input shape (batch, max_length)
+    """
+
+    import tensorflow as tf
+
+    if is_masking_model(model):
+        raise ValueError("Models with a masking layer can not be converted")
+
+    max_length, num_functions = model.input_shape[1:]
+    table = np.vstack([np.eye(num_functions), np.zeros((1, num_functions))])
+
+    inputs = tf.keras.Input(shape=(max_length,), dtype="int32")
+    embedding = tf.keras.layers.Embedding(
+        num_functions + 1, num_functions, trainable=False, name="category_one_hot"
+    )
+    X = embedding(inputs)
+    embedding.set_weights([table])
+
+    for layer in model.layers:
+        if layer.__class__.__name__ != "InputLayer":
+            X = layer(X)
 
+    return tf.keras.Model(inputs=inputs, outputs=X, name=model.name + "_integer")
 
-def run_phynteny(outfile, gene_predictor, gb_dict, categories):
+
+def verify_integer_model(model, integer_model, num_examples=1000, seed=42):
+    """
+    Compare the outputs of a model and its integer input version on random masked genomes
+
+    :param model: model which takes one-hot encoded categories
+    :param integer_model: model from integer_input_model
+    :param num_examples: number of genomes to compare
+    :param seed: random seed used to generate the genomes
+    :return: largest absolute difference between the outputs of the models
+    """
+
+    max_length, num_functions = model.input_shape[1:]
+    rng = np.random.default_rng(seed)
+
+    # genomes of every length with a random gene masked
+    sequences = [
+        list(rng.integers(0, num_functions, size=rng.integers(1, max_length + 1)))
+        for i in range(num_examples)
+    ]
+    masked_idx = [[rng.integers(0, len(s))] for s in sequences]
+
+    expected = model.predict(
+        format_data.generate_masked(sequences, masked_idx, num_functions, max_length),
+        verbose=0,
+    )
+    observed = integer_model.predict(
+        format_data.generate_masked_integer(
+            sequences, masked_idx, num_functions, max_length
+        ),
+        verbose=0,
+    )
+
+    return float(np.max(np.abs(expected - observed)))
+
+
+def run_phynteny(outfile, gene_predictor, gb_dict, categories, batch_size=1024):
     """
     Run Phynteny
 
@@ -65,51 +417,153 @@ def run_phynteny(outfile, gene_predictor, gb_dict, categories):
     :param gene_predictor: gene_predictor obejct to use for predictions
     :param gb_dict: dictionary of phages and their annotations
     :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param batch_size: number of masked genes to gather across phages before running the models
     :return: annotated dictionary
     """
 
-    # get the list of phages to loop through
-    keys = list(gb_dict.keys())
+    from Bio import SeqIO
 
     # Run Phynteny
-    with open(outfile, "wt") if outfile != ".gbk" else sys.stdout as handle:
-        for key in keys:
-            # print the phage
-            print("Annotating the phage: " + key, flush=True)
+    with bgzf.open_output(outfile) if outfile != ".gbk" else sys.stdout as handle:
+        for key, record, phage, phage_predictions in annotate_records(
+            gb_dict.items(), gene_predictor, categories, batch_size
+        ):
+            # write to genbank file
+            SeqIO.write(record, handle, "genbank")
+            logger.info(f"Annotated the phage {key}")
 
-            # get current phage
-            phages = {key: handle_genbank.extract_features(gb_dict.get(key))}
+    return gb_dict
 
-            # get phrog annotations
-            phages[key]["phrogs"] = [
-                0 if i == "No_PHROG" else int(i) for i in phages[key]["phrogs"]
-            ]
 
-            # make predictions
-            (
-                unk_idx,
-                predictions,
-                scores,
-                confidence,
-            ) = gene_predictor.predict_annotations(phages)
-
-            if len(predictions) > 0:
-                # update with these annotations
-                cds = [i for i in gb_dict.get(key).features if i.type == "CDS"]
-
-                # return everything back
-                for i in range(len(unk_idx)):
-                    cds[unk_idx[i]].qualifiers["phynteny"] = categories.get(
-                        predictions[i]
-                    )
-                    round_score = str(np.max(scores[i]))
-                    cds[unk_idx[i]].qualifiers["phynteny_score"] = round_score
-                    cds[unk_idx[i]].qualifiers["phynteny_confidence"] = confidence[i]
+def annotate_records(records, gene_predictor, categories, batch_size=1024):
+    """
+    Annotate phages in order. Masked genes are gathered across phages such that the models are run in batches
 
-            # write to genbank file
-            SeqIO.write(gb_dict.get(key), handle, "genbank")
-            logger.info(f"Annotated the phage {key}")
-    return gb_dict
+    :param records: iterable of phage names and their genbank records
+    :param gene_predictor: gene_predictor obejct to use for predictions
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param batch_size: number of masked genes to gather across phages before running the models
+    :return: generator of phage names, annotated records, extracted features and predictions
+    """
+
+    phages = ((key, record, get_phage_features(record)) for key, record in records)
+
+    for key, record, phage, phage_predictions in predict_phages(
+        phages, gene_predictor, batch_size
+    ):
+        annotate_record(record, phage_predictions, categories)
+
+        yield key, record, phage, phage_predictions
+
+
+def predict_phages(phages, gene_predictor, batch_size=1024):
+    """
+    Predict the unknown genes of phages in order. Masked genes are gathered across phages such that the models are run in batches.
+    At most MAX_BATCH_PHAGES phages are held at once, and phages with no genes to mask are passed straight through when no
+    batch is waiting, so memory stays bounded whatever the number of unknown genes
+
+    :param phages: iterable of phage names, their genbank records and their extracted features. Records may be None
+    :param gene_predictor: gene_predictor obejct to use for predictions
+    :param batch_size: number of masked genes to gather across phages before running the models
+    :return: generator of phage names, records, extracted features and predictions
+    """
+
+    # phages waiting to be annotated and the number of masked genes they contribute
+    batch = {}
+    batch_records = {}
+    num_masked = 0
+
+    for key, record, phage in phages:
+        # print the phage
+        print("Annotating the phage: " + key, flush=True)
+
+        phage_masked = gene_predictor.count_masked(phage)
+
+        # phages with nothing to predict do not wait for a batch to fill
+        if phage_masked == 0 and len(batch) == 0:
+            yield from predict_phage_batch(gene_predictor, {key: record}, {key: phage})
+            continue
+
+        # get current phage
+        batch[key] = phage
+        batch_records[key] = record
+        num_masked += phage_masked
+
+        # only run the models once enough masked genes or phages have been gathered
+        if num_masked >= batch_size or len(batch) >= MAX_BATCH_PHAGES:
+            yield from predict_phage_batch(gene_predictor, batch_records, batch)
+            batch = {}
+            batch_records = {}
+            num_masked = 0
+
+    # annotate any remaining phages
+    if len(batch) > 0:
+        yield from predict_phage_batch(gene_predictor, batch_records, batch)
+
+
+def predict_phage_batch(gene_predictor, batch_records, batch):
+    """
+    Predict the unknown genes of a batch of phages
+
+    :param gene_predictor: gene_predictor obejct to use for predictions
+    :param batch_records: dictionary of the genbank records of the phages in the batch
+    :param batch: dictionary of extracted features for the phages in the batch
+    :return: generator of phage names, records, extracted features and predictions
+    """
+
+    # make predictions for every phage in the batch at once
+    batch_predictions = gene_predictor.predict_batch(batch)
+
+    for key in list(batch.keys()):
+        yield key, batch_records.get(key), batch.get(key), batch_predictions.get(key)
+
+
+def get_phage_features(record):
+    """
+    Extract the features of a phage required to make predictions
+
+    :param record: genbank record of the phage
+    :return: dictionary of features with the PHROG annotations as integers
+    """
+
+    return format_features(handle_genbank.extract_features(record))
+
+
+def format_features(phage):
+    """
+    Convert the PHROG annotations of extracted features to integers
+
+    :param phage: dictionary of features from extract_features or scan_genbank
+    :return: dictionary of features with the PHROG annotations as integers
+    """
+
+    # get phrog annotations
+    phage["phrogs"] = [0 if i == "No_PHROG" else int(i) for i in phage["phrogs"]]
+
+    return phage
+
+
+def annotate_record(record, phage_predictions, categories):
+    """
+    Add phynteny predictions to the CDS qualifiers of a genbank record
+
+    :param record: genbank record of the phage
+    :param phage_predictions: unknown indexes, predictions, scores and confidence of the phage
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    """
+
+    unk_idx, predictions, scores, confidence = phage_predictions
+
+    if len(predictions) > 0:
+        # update with these annotations
+        cds = [i for i in record.features if i.type == "CDS"]
+
+        # return everything back
+        for i in range(len(unk_idx)):
+            cds[unk_idx[i]].qualifiers["phynteny"] = categories.get(predictions[i])
+            round_score = str(np.max(scores[i]))
+            cds[unk_idx[i]].qualifiers["phynteny_score"] = round_score
+            cds[unk_idx[i]].qualifiers["phynteny_confidence"] = confidence[i]
 
 
 def generate_table(outfile, gb_dict, categories, phrog_integer):
@@ -124,76 +578,317 @@ def generate_table(outfile, gb_dict, categories, phrog_integer):
     found = 0
 
     # convert annotations made to a text file
-    with click.open_file(outfile, "wt") if outfile != ".tsv" else sys.stdout as f:
-        f.write(
-            "ID\tstart\tend\tstrand\tphrog_id\tphrog_category\tphynteny_category\tphynteny_score\tconfidence\tsequence\tphage\n"
-        )
+    with bgzf.open_output(outfile) if outfile != ".tsv" else sys.stdout as f:
+        f.write(TABLE_HEADER)
 
         for k in keys:
-            # obtain the sequence
-            seq = gb_dict.get(k).seq
+            rows, record_found = table_rows(k, gb_dict.get(k), categories, phrog_integer)
+            f.writelines(rows)
+            found += record_found
 
-            # get the genes
-            cds = [f for f in gb_dict.get(k).features if f.type == "CDS"]
+    return found
 
-            # extract the features for the cds
-            start = [c.location.start for c in cds]
-            end = [c.location.end for c in cds]
-            seq = [str(seq[start[i] : end[i]]) for i in range(len(cds))]
 
-            strand = [c.strand for c in cds]
+def table_rows(k, record, categories, phrog_integer):
+    """
+    Generate the table rows of a single phage
 
-            # generate list of protein ids
-            ID = [
-                c.qualifiers.get("protein_id")[0]
-                if "protein_id" in c.qualifiers
-                else ""
-                for c in cds
-            ]
+    :param k: name of the phage
+    :param record: annotated genbank record of the phage
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :return: list of rows and the number of genes found with a confidence of at least 90%
+    """
 
-            if len(ID) == 0:
-                ID = [
-                    c.qualifiers.get("ID")[0] if "ID" in c.qualifiers else ""
-                    for c in cds
-                ]
-
-            # lists to iterate through
-            phrog = []
-            phynteny_category = []
-            phynteny_score = []
-            phynteny_confidence = []
-
-            # extract details for genes
-            for c in cds:
-                if "phrog" in c.qualifiers.keys():
-                    phrog.append(c.qualifiers.get("phrog")[0])
-                else:
-                    phrog.append("No_PHROG")
-
-                if "phynteny" in c.qualifiers.keys():
-                    phynteny_category.append(c.qualifiers.get("phynteny"))
-                    phynteny_score.append(c.qualifiers.get("phynteny_score"))
-                    phynteny_confidence.append(c.qualifiers.get("phynteny_confidence"))
-
-                    # update the number of genes found
-                    if float(c.qualifiers.get("phynteny_confidence")) > 0.9:
-                        found += 1
-
-                else:
-                    phynteny_category.append(np.nan)
-                    phynteny_score.append(np.nan)
-                    phynteny_confidence.append(np.nan)
-
-            phrog = [int(p) if p != "No_PHROG" else p for p in phrog]
-            known_category = [categories.get(phrog_integer.get(p)) for p in phrog]
-            known_category = [
-                "unknown function" if c == None else c for c in known_category
-            ]
+    # count the number of genes found
+    found = 0
+
+    # obtain the sequence
+    seq = record.seq
+
+    # get the genes
+    cds = [f for f in record.features if f.type == "CDS"]
+
+    # extract the features for the cds
+    start = [c.location.start for c in cds]
+    end = [c.location.end for c in cds]
+    seq = [str(seq[start[i] : end[i]]) for i in range(len(cds))]
+
+    strand = [c.strand for c in cds]
+
+    # generate list of protein ids
+    ID = [
+        c.qualifiers.get("protein_id")[0] if "protein_id" in c.qualifiers else ""
+        for c in cds
+    ]
+
+    if len(ID) == 0:
+        ID = [c.qualifiers.get("ID")[0] if "ID" in c.qualifiers else "" for c in cds]
+
+    # lists to iterate through
+    phrog = []
+    phynteny_category = []
+    phynteny_score = []
+    phynteny_confidence = []
+
+    # extract details for genes
+    for c in cds:
+        if "phrog" in c.qualifiers.keys():
+            phrog.append(c.qualifiers.get("phrog")[0])
+        else:
+            phrog.append("No_PHROG")
+
+        if "phynteny" in c.qualifiers.keys():
+            phynteny_category.append(c.qualifiers.get("phynteny"))
+            phynteny_score.append(c.qualifiers.get("phynteny_score"))
+            phynteny_confidence.append(c.qualifiers.get("phynteny_confidence"))
+
+            # update the number of genes found
+            if float(c.qualifiers.get("phynteny_confidence")) > 0.9:
+                found += 1
+
+        else:
+            phynteny_category.append(np.nan)
+            phynteny_score.append(np.nan)
+            phynteny_confidence.append(np.nan)
+
+    phrog = [int(p) if p != "No_PHROG" else p for p in phrog]
+    known_category = [categories.get(phrog_integer.get(p)) for p in phrog]
+    known_category = ["unknown function" if c == None else c for c in known_category]
+
+    rows = [
+        f"{ID[i]}\t{start[i]}\t{end[i]}\t{strand[i]}\t{phrog[i]}\t{known_category[i]}\t{phynteny_category[i]}\t{phynteny_score[i]}\t{phynteny_confidence[i]}\t{seq[i]}\t{k}\n"
+        for i in range(len(cds))
+    ]
+
+    return rows, found
+
+
+def annotation_table(key, sequence, phage, phage_predictions, categories, phrog_integer):
+    """
+    Generate the table rows of a phage at annotation time from its extracted features and predictions
+    rather than by reading the annotations back from the genbank record
+
+    :param key: name of the phage
+    :param sequence: sequence of the phage as a string
+    :param phage: dictionary of features extracted from the phage
+    :param phage_predictions: unknown indexes, predictions, scores and confidence of the phage
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :return: list of rows and the number of genes found with a confidence of at least 90%
+    """
+
+    unk_idx, predictions, scores, confidence = phage_predictions
+    num_genes = len(phage.get("phrogs"))
+
+    # columns which are only filled for the genes phynteny made predictions for
+    phynteny_category = np.full(num_genes, "nan", dtype=object)
+    phynteny_score = np.full(num_genes, "nan", dtype=object)
+    phynteny_confidence = np.full(num_genes, "nan", dtype=object)
+
+    if len(predictions) > 0:
+        phynteny_category[unk_idx] = [categories.get(p) for p in predictions]
+        phynteny_score[unk_idx] = [str(np.max(s)) for s in scores]
+        phynteny_confidence[unk_idx] = [str(c) for c in confidence]
+
+    # count the number of genes found
+    found = int(np.sum(np.asarray(confidence) > 0.9))
+
+    # known annotations of each gene
+    phrog = np.array(phage.get("phrogs"), dtype=object)
+    phrog[phrog == 0] = "No_PHROG"
+    known_category = [categories.get(phrog_integer.get(p)) for p in phrog]
+    known_category = ["unknown function" if c == None else c for c in known_category]
+
+    # location of each gene
+    position = np.array(phage.get("position"), dtype=int).reshape(-1, 2)
+    strand = np.where(np.array(phage.get("sense")) == "+", 1, -1)
+    ID = ["" if p is None else p for p in phage.get("protein_id")]
+
+    rows = [
+        f"{ID[i]}\t{position[i, 0]}\t{position[i, 1]}\t{strand[i]}\t{phrog[i]}\t{known_category[i]}\t{phynteny_category[i]}\t{phynteny_score[i]}\t{phynteny_confidence[i]}\t{sequence[position[i, 0] : position[i, 1]]}\t{key}\n"
+        for i in range(num_genes)
+    ]
+
+    return rows, found
+
+
+def write_rows(f, key, rows, index=None):
+    """
+    Write the table rows of a phage and add the phage and its proteins to the index
+
+    :param f: open handle of the output table
+    :param key: name of the phage
+    :param rows: table rows of the phage
+    :param index: index.IndexWriter to add the rows to
+    """
+
+    if index is None:
+        f.writelines(rows)
+        return
+
+    if len(rows) > 0:
+        index.add(key, f)
+    index.write_rows(f, rows)
+
+
+def stream_phynteny(
+    genbank_file,
+    table_file,
+    gene_predictor,
+    records,
+    categories,
+    phrog_integer,
+    batch_size=1024,
+    index=None,
+    db=None,
+    parquet=None,
+):
+    """
+    Annotate phages as they are read and write each one to the genbank file and table before it is dropped.
+    Only the phages of the current batch are held in memory
+
+    :param genbank_file: path to output genbank file
+    :param table_file: path to output table
+    :param gene_predictor: gene_predictor obejct to use for predictions
+    :param records: iterable of phage names and their genbank records
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :param batch_size: number of masked genes to gather across phages before running the models
+    :param index: index.IndexWriter to add the position of each phage and protein to
+    :param db: results_db.ResultsDB to add the results of each gene to
+    :param parquet: columnar.ParquetWriter to add the rows of each phage to
+    :return: number of genes found with a confidence of at least 90%
+    """
+
+    from Bio import SeqIO
+
+    # count the number of genes found
+    found = 0
+
+    with bgzf.open_output(genbank_file) as handle, bgzf.open_output(table_file) as f:
+        f.write(TABLE_HEADER)
+
+        for key, record, phage, phage_predictions in annotate_records(
+            records, gene_predictor, categories, batch_size
+        ):
+            # write the genbank record and its table rows in the same pass
+            if index is not None:
+                index.add(key, handle)
+            SeqIO.write(record, handle, "genbank")
+            logger.info(f"Annotated the phage {key}")
+
+            rows, record_found = annotation_table(
+                key,
+                str(record.seq),
+                phage,
+                phage_predictions,
+                categories,
+                phrog_integer,
+            )
+            write_rows(f, key, rows, index)
+            found += record_found
+
+            if db is not None:
+                db.add(
+                    results_db.gene_rows(
+                        key, phage, phage_predictions, categories, phrog_integer
+                    )
+                )
+
+            if parquet is not None:
+                parquet.add(
+                    columnar.gene_columns(
+                        key,
+                        str(record.seq),
+                        phage,
+                        phage_predictions,
+                        categories,
+                        phrog_integer,
+                    )
+                )
+
+    return found
+
+
+def scan_phynteny(
+    genbank_file,
+    table_file,
+    gene_predictor,
+    phages,
+    categories,
+    phrog_integer,
+    batch_size=1024,
+    index=None,
+    db=None,
+    parquet=None,
+):
+    """
+    Annotate phages scanned with scan_genbank without building genbank records.
+    The original text of each record is copied to the genbank file with the phynteny qualifiers inserted
+
+    :param genbank_file: path to output genbank file. Use None to only write the table
+    :param table_file: path to output table
+    :param gene_predictor: gene_predictor obejct to use for predictions
+    :param phages: iterable of phage names and their features from scan_genbank
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :param batch_size: number of masked genes to gather across phages before running the models
+    :param index: index.IndexWriter to add the position of each phage and protein to
+    :param db: results_db.ResultsDB to add the results of each gene to
+    :param parquet: columnar.ParquetWriter to add the rows of each phage to
+    :return: number of genes found with a confidence of at least 90%
+    """
+
+    # count the number of genes found
+    found = 0
 
-            # write to table
-            for i in range(len(cds)):
-                f.write(
-                    f"{ID[i]}\t{start[i]}\t{end[i]}\t{strand[i]}\t{phrog[i]}\t{known_category[i]}\t{phynteny_category[i]}\t{phynteny_score[i]}\t{phynteny_confidence[i]}\t{seq[i]}\t{k}\n"
+    phages = ((key, None, format_features(phage)) for key, phage in phages)
+
+    with bgzf.open_output(table_file) as f, (
+        bgzf.open_output(genbank_file)
+        if genbank_file is not None
+        else contextlib.nullcontext()
+    ) as handle:
+        f.write(TABLE_HEADER)
+
+        for key, record, phage, phage_predictions in predict_phages(
+            phages, gene_predictor, batch_size
+        ):
+            if handle is not None:
+                if index is not None:
+                    index.add(key, handle)
+                handle_genbank.write_raw(handle, phage, phage_predictions, categories)
+            logger.info(f"Annotated the phage {key}")
+
+            rows, record_found = annotation_table(
+                key,
+                phage.get("sequence"),
+                phage,
+                phage_predictions,
+                categories,
+                phrog_integer,
+            )
+            write_rows(f, key, rows, index)
+            found += record_found
+
+            if db is not None:
+                db.add(
+                    results_db.gene_rows(
+                        key, phage, phage_predictions, categories, phrog_integer
+                    )
+                )
+
+            if parquet is not None:
+                parquet.add(
+                    columnar.gene_columns(
+                        key,
+                        phage.get("sequence"),
+                        phage,
+                        phage_predictions,
+                        categories,
+                        phrog_integer,
+                    )
                 )
 
     return found
@@ -205,79 +900,384 @@ class Predictor:
     """
 
     def __init__(
-        self, models, phrog_categories_path, confidence_dict, category_names_path
+        self,
+        models,
+        phrog_categories_path,
+        confidence_dict,
+        category_names_path,
+        fused=False,
+        backend="keras",
+        reuse_states=False,
+        raw_scores=False,
+        cache_path=None,
+        cache_size=1000000,
+        sliding_window=False,
     ):
-        self.models = get_models(models)
-        self.max_length = (
-            self.models[0]
-            .get_config()
-            .get("layers")[0]
-            .get("config")
-            .get("batch_input_shape")[1]
-        )
+        backend = resolve_backend(models, backend)
+        if reuse_states and backend != "numpy":
+            raise ValueError("Reusing LSTM states requires the numpy backend")
+
+        self.models = get_models(models, fused, backend)
+        if len(self.models) == 0:
+            raise ValueError(
+                f"No models could be loaded from {models} with the {backend} backend"
+            )
+        self.reuse_states = reuse_states
+        self.fused = fused
+        self.raw_scores = raw_scores
+        self.sliding_window = sliding_window
+        self.max_length = self.models[0].input_shape[1] or MAX_LENGTH
 
-        self.phrog_categories = get_dict(phrog_categories_path)
-        self.confidence_dict = get_dict(confidence_dict)
-        self.category_names = get_dict(category_names_path)
+        self.phrog_categories = get_phrog_integer(phrog_categories_path)
+        self.confidence_dict = get_confidence(confidence_dict)
+        self.category_names = get_categories(category_names_path)
         self.num_functions = len(self.category_names)
 
-    def predict_annotations(self, phage_dict):
-        """ """
+        # every model of the ensemble must take the same input
+        self.integer_input = is_integer_model(self.models[0])
+        if any([is_integer_model(m) != self.integer_input for m in self.models]):
+            raise ValueError(
+                "The ensemble mixes models with integer and one-hot encoded inputs"
+            )
+
+        self.masking = is_masking_model(self.models[0])
+        if any([is_masking_model(m) != self.masking for m in self.models]):
+            raise ValueError("The ensemble mixes models with and without masking")
+
+        # scores of masked genes which have been seen before
+        self.cache = None
+        if cache_path is not None:
+            self.cache = cache.PredictionCache(
+                cache_path,
+                cache.model_fingerprint(
+                    model_files(models, fused, backend), backend, fused, reuse_states
+                ),
+                cache_size,
+            )
 
-        encodings = [
-            [self.phrog_categories.get(p) for p in phage_dict.get(q).get("phrogs")]
-            for q in list(phage_dict.keys())
-        ]
+    def encode(self, phrogs):
+        """
+        Integer encode the PHROG categories of a phage
 
-        if len(encodings[0]) == 0:
-            logger.info(f"your phage {list(phage_dict.keys())[0]}  has zero genes!")
+        :param phrogs: list of PHROG annotations of the phage where 0 is an unknown gene
+        :return: list of category integers
+        """
 
-        unk_idx = [i for i, x in enumerate(encodings[0]) if x == 0]
+        return [self.phrog_categories.get(p) for p in phrogs]
+
+    def get_unknowns(self, key, encoding):
+        """
+        Get the index of the genes which can be masked and predicted in a phage
+
+        :param key: name of the phage
+        :param encoding: integer encoding of the phage
+        :return: list of indexes of the unknown genes. Empty if no predictions can be made
+        """
+
+        if len(encoding) == 0:
+            logger.info(f"your phage {key}  has zero genes!")
+
+        unk_idx = [i for i, x in enumerate(encoding) if x == 0]
 
         if len(unk_idx) == 0:
+            logger.info(f"Phage {str(key)} is already completely annotated!")
+
+        elif len(encoding) > self.max_length and not self.sliding_window:
             logger.info(
-                f"Phage {str(list(phage_dict.keys())[0])} is already completely annotated!"
+                f"Your phage {str(key)} has more genes than the maximum of {self.max_length}! Use --sliding_window to annotate it"
             )
 
-            predictions = []
-            scores = []
-            confidence = []
+            return []
 
-        elif len(encodings[0]) > 120:
-            logger.info(
-                f"Your phage + {str(list(phage_dict.keys())[0])} has more genes than the maximum of 120!"
+        return unk_idx
+
+    def encode_phage(self, phage):
+        """
+        Get the integer encoding of a phage
+
+        :param phage: dictionary of the features of a phage containing either its PHROG annotations or categories
+        :return: list of category integers
+        """
+
+        if "categories" in phage:
+            return list(phage.get("categories"))
+
+        return self.encode(phage.get("phrogs"))
+
+    def count_masked(self, phage):
+        """
+        Count the number of masked examples a phage contributes to a batch
+
+        :param phage: dictionary of the features of a phage
+        :return: number of unknown genes which will be predicted
+        """
+
+        encoding = self.encode_phage(phage)
+
+        if len(encoding) > self.max_length and not self.sliding_window:
+            return 0
+
+        return len([x for x in encoding if x == 0])
+
+    def predict_batch(self, phage_dict):
+        """
+        Predict the function of the unknown genes of many phages at once.
+        Masked examples from every phage are stacked such that each model is only called once for the batch.
+        If raw_scores is set the unrounded scores and the softmax of each model are added to each phage as
+        'scores' and 'member_scores'
+
+        :param phage_dict: dictionary of phages with their extracted features or category encodings
+        :return: dictionary mapping each phage to its unknown indexes, predictions, scores and confidence
+        """
+
+        keys = list(phage_dict.keys())
+
+        # get the unknown genes of each phage
+        encodings = [self.encode_phage(phage_dict.get(k)) for k in keys]
+        unk_idx = [self.get_unknowns(keys[i], encodings[i]) for i in range(len(keys))]
+
+        num_masked = sum([len(u) for u in unk_idx])
+
+        if num_masked > 0 and self.cache is not None:
+            yhat, members = self.cached_score(*self.tile(encodings, unk_idx))
+
+        elif num_masked > 0:
+            yhat, members = self.score(*self.tile(encodings, unk_idx))
+
+        if num_masked > 0:
+            # confidence is computed independently for each gene so can be done for the whole batch
+            all_predictions, all_confidence = statistics.compute_confidence(
+                [yhat[i] for i in range(num_masked)],
+                self.confidence_dict,
+                self.category_names,
             )
 
-            predictions = []
-            scores = []
-            confidence = []
+        # scatter the predictions back to their phage
+        batch_predictions = {}
+        start = 0
 
-        else:
-            # make data with the categories masked
-            X = [
-                format_data.generate_prediction(
-                    encodings,
-                    self.num_functions,
-                    self.max_length,
-                    i,
+        for i in range(len(keys)):
+            end = start + len(unk_idx[i])
+
+            if len(unk_idx[i]) == 0:
+                predictions = []
+                scores = []
+                confidence = []
+
+            else:
+                scores = [yhat[j] for j in range(start, end)]
+                predictions = all_predictions[start:end]
+                confidence = all_confidence[start:end]
+
+            if self.raw_scores:
+                phage_dict.get(keys[i])["scores"] = (
+                    yhat[start:end] if len(unk_idx[i]) > 0 else None
                 )
-                for i in unk_idx
+
+                # the members of a fused ensemble can not be separated
+                phage_dict.get(keys[i])["member_scores"] = (
+                    members[:, start:end]
+                    if len(unk_idx[i]) > 0 and not self.fused
+                    else None
+                )
+
+            # round the scores
+            scores_round = np.round(scores, decimals=3)
+            confidence_round = np.round(confidence, decimals=4)
+
+            batch_predictions[keys[i]] = (
+                unk_idx[i],
+                predictions,
+                scores_round,
+                confidence_round,
+            )
+            start = end
+
+        return batch_predictions
+
+    def tile(self, encodings, unk_idx):
+        """
+        Split the phages with more genes than the models take into windows of max_length genes centred on each
+        unknown gene. Windows are clamped to the ends of the phage and consecutive unknown genes with the same window
+        share it, so the number of windows grows linearly with the length of the phage. Each unknown gene is only
+        masked in its own window: where windows overlap, the score of a gene comes from the window centred on it
+        rather than from a window where it is close to the edge.
+
+        :param encodings: integer encoding of each phage
+        :param unk_idx: indexes of the unknown genes of each phage
+        :return: encoding of each window and the indexes to mask in each window. The masked genes are in the same
+        order as unk_idx such that the scores of the windows line up with the scores of whole phages
+        """
+
+        window_encodings = []
+        window_idx = []
+
+        for encoding, idx in zip(encodings, unk_idx):
+            if len(encoding) <= self.max_length:
+                window_encodings.append(encoding)
+                window_idx.append(idx)
+                continue
+
+            last = None
+            for i in idx:
+                start = min(
+                    max(i - self.max_length // 2, 0), len(encoding) - self.max_length
+                )
+
+                if start != last:
+                    window_encodings.append(encoding[start : start + self.max_length])
+                    window_idx.append([])
+                    last = start
+
+                window_idx[-1].append(i - start)
+
+        return window_encodings, window_idx
+
+    def score(self, encodings, unk_idx):
+        """
+        Run the models over every masked gene. Phages are padded to max_length genes unless the models have a
+        masking layer, in which case phages are grouped into buckets of similar length and each bucket is only
+        padded to its longest phage
+
+        :param encodings: integer encoding of each phage
+        :param unk_idx: indexes of the genes to mask in each phage
+        :return: summed scores and the softmax of each model
+        """
+
+        if not self.masking:
+            return self.run_models(encodings, unk_idx, self.max_length)
+
+        # bucket of each phage with genes to mask
+        buckets = {}
+        for i in range(len(encodings)):
+            if len(unk_idx[i]) > 0:
+                length = min(len(encodings[i]), self.max_length)
+                bucket = min(-(-length // BUCKET_WIDTH) * BUCKET_WIDTH, self.max_length)
+                buckets.setdefault(bucket, []).append(i)
+
+        # rows of the masked genes of each phage in the batch
+        offsets = np.cumsum([0] + [len(u) for u in unk_idx])
+        yhat = None
+
+        for bucket, phages in sorted(buckets.items()):
+            bucket_yhat, bucket_members = self.run_models(
+                [encodings[i] for i in phages], [unk_idx[i] for i in phages], bucket
+            )
+
+            if yhat is None:
+                yhat = np.zeros(
+                    (offsets[-1],) + bucket_yhat.shape[1:], dtype=np.float32
+                )
+                members = np.zeros(
+                    bucket_members.shape[:1] + yhat.shape, dtype=np.float32
+                )
+
+            rows = np.concatenate(
+                [np.arange(offsets[i], offsets[i + 1]) for i in phages]
+            )
+            yhat[rows] = bucket_yhat
+            members[:, rows] = bucket_members
+
+        return yhat, members
+
+    def run_models(self, encodings, unk_idx, length):
+        """
+        Run the models over the masked genes of phages padded to the same length
+
+        :param encodings: integer encoding of each phage
+        :param unk_idx: indexes of the genes to mask in each phage
+        :param length: number of genes to pad or cut each phage to
+        :return: summed scores and the softmax of each model
+        """
+
+        # models with an integer input take the category of each gene rather than its one-hot encoding
+        if self.reuse_states and self.integer_input:
+            # compute the states shared between masks of the same phage once
+            genomes = [format_data.pad_sequence(e, length) for e in encodings]
+            members = statistics.member_softmax_masked(genomes, unk_idx, self.models)
+
+        elif self.reuse_states:
+            genomes = [
+                format_data.encode_genome(e, self.num_functions, length)
+                for e in encodings
             ]
 
-            yhat = statistics.phynteny_score(
-                np.array(X).reshape(len(X), self.max_length, self.num_functions),
+            # models with a masking layer skip the rows after the end of each genome
+            if self.masking:
+                padding = format_data.pad_rows([len(e) for e in encodings], length)
+                for i in range(len(genomes)):
+                    genomes[i][padding[i]] = format_data.PAD_VALUE
+
+            members = statistics.member_softmax_masked(genomes, unk_idx, self.models)
+
+        elif self.integer_input:
+            X = format_data.generate_masked_integer(
+                encodings, unk_idx, self.num_functions, length
+            )
+            members = statistics.member_softmax(X, self.num_functions, self.models)
+
+        else:
+            # make data with the categories masked for every phage
+            X = format_data.generate_masked(
+                encodings,
+                unk_idx,
                 self.num_functions,
-                self.models,
+                length,
+                format_data.PAD_VALUE if self.masking else None,
             )
+            members = statistics.member_softmax(X, self.num_functions, self.models)
 
-            scores = [yhat[i] for i in range(len(unk_idx))]
+        return members.sum(axis=0), members
 
-            predictions, confidence = statistics.compute_confidence(
-                scores, self.confidence_dict, self.category_names
+    def cached_score(self, encodings, unk_idx):
+        """
+        Look up the scores of each masked gene in the cache and only run the models over the genes which are missing.
+        Genes which are repeated within the batch are only run once
+
+        :param encodings: integer encoding of each phage
+        :param unk_idx: indexes of the genes to mask in each phage
+        :return: summed scores and the softmax of each model
+        """
+
+        keys = [self.cache.keys(encodings[i], unk_idx[i]) for i in range(len(unk_idx))]
+        all_keys = [k for phage_keys in keys for k in phage_keys]
+        found = self.cache.get(all_keys)
+
+        # genes to run the models over
+        missing_keys = []
+        missing_idx = [[] for i in range(len(unk_idx))]
+        seen = set(found.keys())
+        for i in range(len(unk_idx)):
+            for j in range(len(unk_idx[i])):
+                if keys[i][j] not in seen:
+                    seen.add(keys[i][j])
+                    missing_keys.append(keys[i][j])
+                    missing_idx[i].append(unk_idx[i][j])
+
+        if len(missing_keys) > 0:
+            yhat, members = self.score(encodings, missing_idx)
+            self.cache.put(missing_keys, yhat, members)
+            found.update(
+                {missing_keys[i]: (yhat[i], members[:, i]) for i in range(len(yhat))}
             )
 
-        # round the scores
-        scores_round = np.round(scores, decimals=3)
-        confidence_round = np.round(confidence, decimals=4)
+        logger.info(
+            f"Prediction cache: {self.cache.hits} hits and {self.cache.misses} misses"
+        )
+
+        yhat = np.array([found.get(k)[0] for k in all_keys])
+        members = np.stack([found.get(k)[1] for k in all_keys], axis=1)
+
+        return yhat, members
+
+    def predict_annotations(self, phage_dict):
+        """
+        Predict the function of the unknown genes of a single phage
+
+        :param phage_dict: dictionary containing a single phage with its extracted features
+        :return: unknown indexes, predictions, scores and confidence of the phage
+        """
+
+        key = list(phage_dict.keys())[0]
 
-        return unk_idx, predictions, scores_round, confidence_round
+        return self.predict_batch({key: phage_dict.get(key)}).get(key)
@@ -0,0 +1,134 @@
+"""
+Module to recompute the confidence of existing phynteny predictions
+
+The confidence of a prediction only depends on its score vector, so a new confidence model can be applied to the
+scores kept in a results database without running the models again. The outputs are rewritten in a single pass
+with only the phynteny qualifiers and the confidence column replaced.
+"""
+
+# imports
+import numpy as np
+from phynteny_utils import statistics
+from phynteny_utils import handle_genbank
+from phynteny_utils import predictor
+from phynteny_utils import bgzf
+
+
+def recalibrate(scores, confidence_dict, categories):
+    """
+    Compute the predictions and confidence of a matrix of scores in a single call
+
+    :param scores: matrix of the phynteny scores of each gene
+    :param confidence_dict: compiled confidence curves or dictionary of kernel density estimators
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :return: predictions, rounded scores and rounded confidence of each gene
+    """
+
+    if len(scores) == 0:
+        return np.zeros(0, dtype=int), scores, np.zeros(0)
+
+    predictions, confidence = statistics.compute_confidence(
+        scores, confidence_dict, categories
+    )
+
+    return (
+        predictions.astype(int),
+        np.round(scores, decimals=3),
+        np.round(confidence, decimals=4),
+    )
+
+
+def group_predictions(records, genes, predictions, scores, confidence):
+    """
+    Group the predictions of each gene by phage in the same format as Predictor.predict_batch
+
+    :param records: name of the phage of each gene
+    :param genes: index of each gene within its phage
+    :param predictions: prediction of each gene
+    :param scores: scores of each gene
+    :param confidence: confidence of each gene
+    :return: dictionary mapping each phage to its unknown indexes, predictions, scores and confidence
+    """
+
+    positions = {}
+    for i, key in enumerate(records):
+        positions.setdefault(key, []).append(i)
+
+    return {
+        key: (
+            list(genes[p]),
+            list(predictions[p]),
+            scores[p],
+            list(confidence[p]),
+        )
+        for key, p in positions.items()
+    }
+
+
+def recalibrate_genbank(infile, outfile, phage_dict, categories, index=None):
+    """
+    Rewrite the phynteny qualifiers of a genbank file. Other lines are copied unchanged
+
+    :param infile: path to the genbank file written by phynteny
+    :param outfile: path to the recalibrated genbank file
+    :param phage_dict: dictionary of predictions from group_predictions
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param index: index.IndexWriter to add the position of each phage to
+    """
+
+    unchanged = ([], [], [], [])
+
+    with bgzf.open_output(outfile) as handle:
+        for key, phage in handle_genbank.scan_genbank(infile, sequence=False, raw=True):
+            if index is not None:
+                index.add(key, handle)
+            handle_genbank.write_raw(
+                handle, phage, phage_dict.get(key, unchanged), categories
+            )
+
+
+def recalibrate_table(infile, outfile, phage_dict, categories, index=None):
+    """
+    Rewrite the phynteny columns of a table. Other columns are copied unchanged
+
+    :param infile: path to the table written by phynteny
+    :param outfile: path to the recalibrated table
+    :param phage_dict: dictionary of predictions from group_predictions
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param index: index.IndexWriter to add the position of each phage and protein to
+    """
+
+    with handle_genbank.open_genbank(infile) as f, bgzf.open_output(outfile) as out:
+        out.write(f.readline())
+
+        key = None
+        rows = []
+
+        for line in f:
+            row = line.rstrip("\n").split("\t")
+
+            # the rows of each phage are written together
+            if row[-1] != key:
+                predictor.write_rows(out, key, rows, index)
+                key = row[-1]
+                rows = []
+                annotated = dict()
+
+                if key in phage_dict:
+                    unk_idx, predictions, scores, confidence = phage_dict.get(key)
+                    annotated = {
+                        unk_idx[i]: [
+                            categories.get(predictions[i]),
+                            str(np.max(scores[i])),
+                            str(confidence[i]),
+                        ]
+                        for i in range(len(unk_idx))
+                    }
+
+            if len(rows) in annotated:
+                row[6:9] = annotated.get(len(rows))
+                line = "\t".join(row) + "\n"
+
+            rows.append(line)
+
+        predictor.write_rows(out, key, rows, index)
@@ -0,0 +1,228 @@
+"""
+Module to locate the files shipped with phynteny and to read the compiled resource bundle
+
+The bundle holds everything needed to make predictions apart from the models: a dense array mapping each PHROG to
+its category, the category names and the compiled confidence curves. Its arrays are memory-mapped rather than read
+such that loading it does not depend on the size of the data the confidence was estimated from, and processes which
+load the same bundle share its pages.
+
+Layout of the bundle:
+    magic bytes, format version and header length
+    JSON header with the version, category names and the dtype, shape and offset of each array
+    arrays aligned to ALIGNMENT bytes
+"""
+
+# imports
+import os
+import json
+import mmap
+import struct
+import numbers
+
+# files shipped with phynteny
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+ANNOTATION_DIR = os.path.join(PACKAGE_DIR, "phrog_annotation_info")
+MODEL_DIR = os.path.join(PACKAGE_DIR, "models")
+BUNDLE_PATH = os.path.join(ANNOTATION_DIR, "phynteny_resources.bin")
+
+MAGIC = b"PHYNTENY"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# bundles already loaded by this process
+LOADED = {}
+
+
+def resource_path(*parts):
+    """
+    Get the path of a file shipped with phynteny
+
+    :param parts: path of the file within the phynteny_utils package
+    :return: absolute path of the file
+    """
+
+    return os.path.join(PACKAGE_DIR, *parts)
+
+
+class CategoryArray:
+    """
+    Read-only mapping of PHROGs to their category backed by a dense array. Behaves like the dictionary it was
+    compiled from such that it can be used in its place
+    """
+
+    def __init__(self, array):
+        """
+        :param array: category of each PHROG where -1 marks PHROGs without a category
+        """
+
+        self.array = array
+
+    def get(self, phrog, default=None):
+        if (
+            isinstance(phrog, numbers.Integral)
+            and not isinstance(phrog, bool)
+            and 0 <= phrog < len(self.array)
+            and self.array[phrog] >= 0
+        ):
+            return int(self.array[phrog])
+
+        return default
+
+    def __getitem__(self, phrog):
+        category = self.get(phrog)
+        if category is None:
+            raise KeyError(phrog)
+
+        return category
+
+    def __contains__(self, phrog):
+        return self.get(phrog) is not None
+
+    def __len__(self):
+        return int((self.array >= 0).sum())
+
+
+class Bundle:
+    """
+    Resources loaded from a bundle
+    """
+
+    def __init__(self, version, categories, arrays):
+        """
+        :param version: version of the bundle
+        :param categories: dictionary mapping each category integer to its name
+        :param arrays: dictionary of the arrays of the bundle
+        """
+
+        self.version = version
+        self.categories = categories
+        self.phrog_integer = CategoryArray(arrays.get("phrog_category"))
+        self.confidence = {"grid": arrays.get("grid"), "curves": arrays.get("curves")}
+
+
+def compile_bundle(outfile, phrog_integer, categories, compiled, version):
+    """
+    Write a resource bundle
+
+    :param outfile: path of the bundle to write
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param compiled: compiled confidence curves from statistics.compile_confidence
+    :param version: version to record in the bundle
+    """
+
+    import numpy as np
+
+    phrogs = [p for p in phrog_integer.keys() if isinstance(p, int) and p >= 0]
+    phrog_category = np.full(max(phrogs) + 1, -1, dtype=np.int8)
+    phrog_category[phrogs] = [phrog_integer.get(p) for p in phrogs]
+
+    arrays = {
+        "phrog_category": phrog_category,
+        "grid": np.ascontiguousarray(compiled.get("grid"), dtype="<f8"),
+        "curves": np.ascontiguousarray(compiled.get("curves"), dtype="<f8"),
+    }
+
+    header = {
+        "version": version,
+        "categories": {str(k): v for k, v in categories.items()},
+        "arrays": {},
+    }
+
+    # offset of each array from the start of the data
+    offset = 0
+    relative = {}
+    for name, array in arrays.items():
+        relative[name] = -(-offset // ALIGNMENT) * ALIGNMENT
+        offset = relative.get(name) + array.nbytes
+
+    # the data starts after the header but the length of the header depends on the offsets it holds
+    start = 0
+    while True:
+        header["arrays"] = {
+            name: {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": start + relative.get(name),
+            }
+            for name, array in arrays.items()
+        }
+        encoded = json.dumps(header).encode()
+        end = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+
+        if end <= start:
+            break
+        start = end
+
+    encoded = encoded.ljust(start - len(MAGIC) - 8)
+
+    with open(outfile, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", FORMAT_VERSION, len(encoded)) + encoded)
+
+        for name, array in arrays.items():
+            f.write(b"\0" * (header.get("arrays").get(name).get("offset") - f.tell()))
+            f.write(array.tobytes())
+
+
+def is_bundle(path):
+    """
+    Check whether a file is a resource bundle
+
+    :param path: path of the file
+    :return: whether the file starts with the bundle magic bytes
+    """
+
+    if not os.path.isfile(path):
+        return False
+
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_bundle(path=BUNDLE_PATH):
+    """
+    Memory-map a resource bundle. Each bundle is only loaded once per process
+
+    :param path: path of the bundle
+    :return: Bundle object
+    """
+
+    import numpy as np
+
+    path = os.path.abspath(path)
+    if path in LOADED:
+        return LOADED.get(path)
+
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a phynteny resource bundle")
+
+    format_version, header_length = struct.unpack_from("<II", buffer, len(MAGIC))
+    if format_version != FORMAT_VERSION:
+        raise ValueError(
+            f"{path} has format version {format_version} but only version {FORMAT_VERSION} is supported. "
+            "Recompile it with compile_resources"
+        )
+
+    header = json.loads(
+        bytes(buffer[len(MAGIC) + 8 : len(MAGIC) + 8 + header_length]).decode()
+    )
+
+    arrays = {}
+    for name, layout in header.get("arrays").items():
+        dtype = np.dtype(layout.get("dtype"))
+        shape = tuple(layout.get("shape"))
+        arrays[name] = np.frombuffer(
+            buffer, dtype=dtype, count=int(np.prod(shape)), offset=layout.get("offset")
+        ).reshape(shape)
+
+    bundle = Bundle(
+        header.get("version"),
+        {int(k): v for k, v in header.get("categories").items()},
+        arrays,
+    )
+    LOADED[path] = bundle
+
+    return bundle
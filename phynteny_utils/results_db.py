@@ -0,0 +1,246 @@
+"""
+Module to store phynteny results in an SQLite database
+
+Each CDS is stored as a row of the genes table. Genes which phynteny made a prediction for also store the full
+summed score vector and the softmax of each model in the ensemble as float32 blobs which can be read with
+decode_scores.
+"""
+
+# imports
+import sqlite3
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE genes (
+    record TEXT NOT NULL,
+    gene INTEGER NOT NULL,
+    protein_id TEXT,
+    start INTEGER,
+    end INTEGER,
+    strand INTEGER,
+    phrog INTEGER,
+    phrog_category TEXT,
+    phynteny_category TEXT,
+    phynteny_score REAL,
+    confidence REAL,
+    scores BLOB,
+    member_scores BLOB
+);
+CREATE TABLE metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+INDEXES = """
+CREATE INDEX genes_record ON genes (record);
+CREATE INDEX genes_protein_id ON genes (protein_id);
+CREATE INDEX genes_phynteny_category ON genes (phynteny_category);
+"""
+
+
+class ResultsDB:
+    """
+    SQLite database of phynteny results which is filled with batched inserts
+    """
+
+    def __init__(self, path, categories, batch_size=10000):
+        """
+        :param path: path of the database to create
+        :param categories: dictionary mapping PHROG categories to their corresponding integer
+        :param batch_size: number of rows to insert in each transaction
+        """
+
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = []
+
+        self.connection = sqlite3.connect(path)
+
+        # the database is written once so durability is not needed until it is closed
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.executescript(SCHEMA)
+
+        # record which column of the score vectors belongs to each category
+        self.connection.executemany(
+            "INSERT INTO metadata VALUES (?, ?)",
+            [
+                ("num_categories", str(len(categories))),
+                (
+                    "categories",
+                    "\t".join([categories.get(i) for i in range(len(categories))]),
+                ),
+            ],
+        )
+
+    def add(self, rows):
+        """
+        Add rows to the database
+
+        :param rows: list of rows from gene_rows
+        """
+
+        self.rows.extend(rows)
+
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Insert the waiting rows in a single transaction
+        """
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO genes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self.rows,
+            )
+
+        self.rows = []
+
+    def close(self):
+        """
+        Insert any remaining rows and build the indexes. Building the indexes once at the end is much faster than
+        updating them with each insert
+        """
+
+        self.flush()
+        self.connection.executescript(INDEXES)
+        self.connection.commit()
+        self.connection.close()
+
+
+def gene_rows(key, phage, phage_predictions, categories, phrog_integer):
+    """
+    Generate the database rows of a phage
+
+    :param key: name of the phage
+    :param phage: dictionary of features extracted from the phage with the scores added by the predictor
+    :param phage_predictions: unknown indexes, predictions, scores and confidence of the phage
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param phrog_integer: dictionary mapping PHROGs to their category integer
+    :return: list of rows
+    """
+
+    unk_idx, predictions, scores, confidence = phage_predictions
+    num_genes = len(phage.get("phrogs"))
+
+    # columns which are only filled for the genes phynteny made predictions for
+    phynteny_category = [None] * num_genes
+    phynteny_score = [None] * num_genes
+    phynteny_confidence = [None] * num_genes
+    score_blobs = [None] * num_genes
+    member_blobs = [None] * num_genes
+
+    raw_scores = phage.get("scores")
+    member_scores = phage.get("member_scores")
+
+    for i in range(len(unk_idx)):
+        phynteny_category[unk_idx[i]] = categories.get(predictions[i])
+        phynteny_confidence[unk_idx[i]] = float(confidence[i])
+
+        if raw_scores is not None:
+            phynteny_score[unk_idx[i]] = float(np.max(raw_scores[i]))
+            score_blobs[unk_idx[i]] = raw_scores[i].astype("<f4").tobytes()
+        else:
+            phynteny_score[unk_idx[i]] = float(np.max(scores[i]))
+
+        if member_scores is not None:
+            member_blobs[unk_idx[i]] = member_scores[:, i].astype("<f4").tobytes()
+
+    phrogs = phage.get("phrogs")
+    known_category = [
+        categories.get(phrog_integer.get(p if p != 0 else "No_PHROG")) for p in phrogs
+    ]
+    known_category = ["unknown function" if c is None else c for c in known_category]
+
+    return [
+        (
+            key,
+            i,
+            phage.get("protein_id")[i],
+            int(phage.get("position")[i][0]),
+            int(phage.get("position")[i][1]),
+            1 if phage.get("sense")[i] == "+" else -1,
+            phrogs[i] if phrogs[i] != 0 else None,
+            known_category[i],
+            phynteny_category[i],
+            phynteny_score[i],
+            phynteny_confidence[i],
+            score_blobs[i],
+            member_blobs[i],
+        )
+        for i in range(num_genes)
+    ]
+
+
+def decode_scores(blob, num_categories):
+    """
+    Read a score vector or the softmax of each model from the database
+
+    :param blob: scores or member_scores column of the genes table
+    :param num_categories: number of categories from the metadata table
+    :return: array of scores with one row for scores and one row per model for member_scores
+    """
+
+    if blob is None:
+        return None
+
+    return np.frombuffer(blob, dtype="<f4").reshape(-1, num_categories)
+
+
+def read_categories(connection):
+    """
+    Read the categories of the score vectors from the metadata table
+
+    :param connection: open connection to a results database
+    :return: dictionary mapping each column of the score vectors to its category
+    """
+
+    value = connection.execute(
+        "SELECT value FROM metadata WHERE key = 'categories'"
+    ).fetchone()[0]
+
+    return dict(enumerate(value.split("\t")))
+
+
+def read_scores(connection):
+    """
+    Read the score vectors of every gene phynteny made a prediction for
+
+    :param connection: open connection to a results database
+    :return: row ids, record names, gene indexes and a matrix of the scores of each gene
+    """
+
+    num_categories = len(read_categories(connection))
+    rows = connection.execute(
+        "SELECT rowid, record, gene, scores FROM genes WHERE scores IS NOT NULL ORDER BY rowid"
+    ).fetchall()
+
+    rowids = np.array([r[0] for r in rows], dtype=int)
+    records = [r[1] for r in rows]
+    genes = np.array([r[2] for r in rows], dtype=int)
+
+    # decode every blob at once rather than one gene at a time
+    scores = np.frombuffer(b"".join([r[3] for r in rows]), dtype="<f4").reshape(
+        -1, num_categories
+    )
+
+    return rowids, records, genes, scores
+
+
+def update_confidence(connection, rowids, confidence):
+    """
+    Replace the confidence of genes in a single transaction
+
+    :param connection: open connection to a results database
+    :param rowids: row ids of the genes from read_scores
+    :param confidence: new confidence of each gene
+    """
+
+    with connection:
+        connection.executemany(
+            "UPDATE genes SET confidence = ? WHERE rowid = ?",
+            zip([float(c) for c in confidence], [int(r) for r in rowids]),
+        )
@@ -0,0 +1,344 @@
+"""
+Module to keep a Phynteny predictor warm behind a local HTTP endpoint
+
+Concurrent requests are merged into micro-batches such that the models are run once for many small requests
+"""
+
+# imports
+import io
+import json
+import numbers
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urllib_request
+import numpy as np
+from loguru import logger
+from Bio import SeqIO
+from phynteny_utils import predictor
+
+
+class InvalidRequest(ValueError):
+    """
+    Raised when a request cannot be annotated. The message only describes the request so it is sent back to the client
+    """
+
+
+class MicroBatcher:
+    """
+    Merge the phages of concurrent requests into batches for a predictor
+    """
+
+    def __init__(self, gene_predictor, max_batch=1024, max_latency=0.05):
+        """
+        :param gene_predictor: predictor object to use for predictions
+        :param max_batch: number of masked genes which triggers a batch to run immediately
+        :param max_latency: maximum time in seconds to wait for other requests to join a batch
+        """
+
+        self.gene_predictor = gene_predictor
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.jobs = queue.Queue()
+
+        # run the batches in the background
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, phages):
+        """
+        Submit phages for prediction and wait for the batch they join to finish
+
+        :param phages: dictionary of phages with their extracted features or category encodings
+        :return: dictionary mapping each phage to its unknown indexes, predictions, scores and confidence
+        """
+
+        job = {"phages": phages, "done": threading.Event()}
+        self.jobs.put(job)
+        job.get("done").wait()
+
+        if "error" in job:
+            raise job.get("error")
+
+        return job.get("predictions")
+
+    def count_masked(self, job):
+        return sum(
+            [self.gene_predictor.count_masked(p) for p in job.get("phages").values()]
+        )
+
+    def run(self):
+        """
+        Collect jobs until the batch is full or the oldest job reaches the latency deadline
+        """
+
+        while True:
+            jobs = [self.jobs.get()]
+            num_masked = self.count_masked(jobs[0])
+            deadline = time.monotonic() + self.max_latency
+
+            while num_masked < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                try:
+                    job = self.jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+                jobs.append(job)
+                num_masked += self.count_masked(job)
+
+            self.predict(jobs)
+
+    def predict(self, jobs):
+        """
+        Make predictions for a batch of jobs and return them to each job
+
+        :param jobs: list of jobs in the batch
+        """
+
+        logger.debug(f"Running a batch of {len(jobs)} requests")
+
+        # phages from different requests may share a name
+        batch = {}
+        for i in range(len(jobs)):
+            for key, phage in jobs[i].get("phages").items():
+                batch[(i, key)] = phage
+
+        try:
+            batch_predictions = self.gene_predictor.predict_batch(batch)
+
+            for i in range(len(jobs)):
+                jobs[i]["predictions"] = {
+                    key: batch_predictions.get((i, key))
+                    for key in jobs[i].get("phages").keys()
+                }
+
+        except Exception as e:
+            # run the jobs one at a time such that only the request which caused the error fails
+            if len(jobs) > 1:
+                logger.warning(
+                    f"Batch of {len(jobs)} requests failed: {e}. Running them one at a time"
+                )
+                for job in jobs:
+                    self.predict([job])
+                return
+
+            logger.error(f"Request failed: {e}")
+            jobs[0]["error"] = e
+
+        for job in jobs:
+            job.get("done").set()
+
+
+def check_phages(phages, gene_predictor):
+    """
+    Check each phage of a request can be encoded by the predictor. Requests are checked before they join a batch
+    such that a malformed request does not fail the other requests in its batch
+
+    :param phages: dictionary of phages with their extracted features or category encodings
+    :param gene_predictor: predictor object which will make the predictions
+    """
+
+    for key, phage in phages.items():
+        if "phrogs" in phage:
+            unknown = [
+                p
+                for p in phage.get("phrogs")
+                if p not in gene_predictor.phrog_categories
+            ]
+            if len(unknown) > 0:
+                raise InvalidRequest(f"Phage {key} has unknown PHROGs {unknown[:5]}")
+
+        encoding = gene_predictor.encode_phage(phage)
+        invalid = [
+            c
+            for c in encoding
+            if not isinstance(c, numbers.Integral)
+            or isinstance(c, bool)
+            or not 0 <= c < gene_predictor.num_functions
+        ]
+        if len(invalid) > 0:
+            raise InvalidRequest(
+                f"Phage {key} has categories {invalid[:5]} which are not integers from 0 to {gene_predictor.num_functions - 1}"
+            )
+
+
+def parse_request(body, gene_predictor):
+    """
+    Get the phages to annotate from the body of a request
+
+    :param body: dictionary containing either a genbank file as text, PHROG annotations or category encodings
+    :param gene_predictor: predictor object which will make the predictions
+    :return: dictionary of phage features and dictionary of genbank records if a genbank file was sent
+    """
+
+    records = None
+
+    if "genbank" in body:
+        records = SeqIO.to_dict(SeqIO.parse(io.StringIO(body.get("genbank")), "gb"))
+        phages = {k: predictor.get_phage_features(records.get(k)) for k in records}
+
+    elif "phrogs" in body:
+        phages = {
+            k: {"phrogs": [0 if i == "No_PHROG" else int(i) for i in v]}
+            for k, v in body.get("phrogs").items()
+        }
+
+    elif "categories" in body:
+        phages = {k: {"categories": list(v)} for k, v in body.get("categories").items()}
+
+    else:
+        raise InvalidRequest(
+            "Request must contain one of 'genbank', 'phrogs' or 'categories'"
+        )
+
+    check_phages(phages, gene_predictor)
+
+    return phages, records
+
+
+def format_result(key, phage_predictions, categories, record=None):
+    """
+    Format the predictions of a phage as a dictionary which can be sent as json
+
+    :param key: name of the phage
+    :param phage_predictions: unknown indexes, predictions, scores and confidence of the phage
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param record: genbank record of the phage to return annotated
+    :return: dictionary of the predictions
+    """
+
+    unk_idx, predictions, scores, confidence = phage_predictions
+
+    result = {
+        "id": key,
+        "unknown_idx": [int(i) for i in unk_idx],
+        "phynteny": [categories.get(p) for p in predictions],
+        "phynteny_score": [str(np.max(s)) for s in scores],
+        "phynteny_confidence": [float(c) for c in confidence],
+    }
+
+    if record is not None:
+        predictor.annotate_record(record, phage_predictions, categories)
+        handle = io.StringIO()
+        SeqIO.write(record, handle, "genbank")
+        result["genbank"] = handle.getvalue()
+
+    return result
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    Handle requests to the prediction server
+    """
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.end_headers()
+        self.wfile.write(b"ok\n")
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.send_error(404)
+            return
+
+        # only messages written for the client are sent back. Other errors may contain paths or internal state
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            phages, records = parse_request(
+                json.loads(self.rfile.read(length)),
+                self.server.batcher.gene_predictor,
+            )
+
+        except InvalidRequest as e:
+            logger.warning(f"Rejected request: {e}")
+            self.send_error(400, str(e))
+            return
+
+        except Exception as e:
+            logger.warning(f"Rejected malformed request: {e!r}")
+            self.send_error(400, "Malformed request")
+            return
+
+        try:
+            batch_predictions = self.server.batcher.submit(phages)
+
+        except Exception:
+            logger.exception("Prediction failed")
+            self.send_error(500, "Prediction failed")
+            return
+
+        # stream the results back with one phage per line
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        for key in list(phages.keys()):
+            result = format_result(
+                key,
+                batch_predictions.get(key),
+                self.server.categories,
+                records.get(key) if records is not None else None,
+            )
+            self.wfile.write((json.dumps(result) + "\n").encode())
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def make_server(
+    gene_predictor,
+    categories,
+    host="127.0.0.1",
+    port=8080,
+    max_batch=1024,
+    max_latency=0.05,
+):
+    """
+    Create a server which makes predictions with a warm predictor
+
+    :param gene_predictor: predictor object to use for predictions
+    :param categories: dictionary mapping PHROG categories to their corresponding integer
+    :param host: address to bind the server to
+    :param port: port to listen on. Use 0 to pick a free port
+    :param max_batch: number of masked genes which triggers a batch to run immediately
+    :param max_latency: maximum time in seconds to wait for other requests to join a batch
+    :return: server object
+    """
+
+    server = ThreadingHTTPServer((host, port), PredictionHandler)
+    server.daemon_threads = True
+    server.batcher = MicroBatcher(gene_predictor, max_batch, max_latency)
+    server.categories = categories
+
+    return server
+
+
+def request_predictions(url, body):
+    """
+    Send phages to a prediction server and stream back the results
+
+    :param url: url of the server
+    :param body: dictionary containing either a genbank file as text, PHROG annotations or category encodings
+    :return: generator of the predictions for each phage
+    """
+
+    req = urllib_request.Request(
+        url.rstrip("/") + "/predict",
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+
+    with urllib_request.urlopen(req) as response:
+        for line in response:
+            yield json.loads(line)
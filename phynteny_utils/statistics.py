@@ -5,9 +5,6 @@ This module uses code snippets from PHaNNs https://github.com/Adrian-Cantu/PhANN
 """
 
 import numpy as np
-import pandas as pd
-from sklearn.neighbors import KernelDensity
-from sklearn.metrics import roc_auc_score, roc_curve
 
 
 def phynteny_score(X_encodings, num_categories, models):
@@ -19,16 +16,62 @@ def phynteny_score(X_encodings, num_categories, models):
     :return: per-class phynteny score for the test instance
     """
 
+    return member_softmax(X_encodings, num_categories, models).sum(axis=0)
+
+
+def member_softmax(X_encodings, num_categories, models):
+    """
+    calculate the softmax of each model in the ensemble
+
+    :param X_encodings: list of encoding matrices to generate predictions for
+    :param num_categories: number of categories
+    :param models: list of models which have already been read in
+    :return: softmax of each model with shape (models, examples, categories)
+    """
+
     # obtain the yhat values
     scores_list = [
         predict_softmax(X_encodings, num_categories, models[i])
         for i in range(len(models))
     ]
 
-    return np.array(scores_list).sum(axis=0)
+    return np.array(scores_list)
+
+
+def phynteny_score_masked(genomes, masked_idx, models):
+    """
+    calculate the phynteny score of every masked gene in a list of genomes.
+    Reuses the LSTM states which are shared between masks of the same genome
+
+    :param genomes: list of unmasked one-hot encoded genomes
+    :param masked_idx: list containing the indexes of the masked genes of each genome
+    :param models: list of numpy models which have already been read in
+    :return: per-class phynteny score for each masked gene
+    """
+
+    return member_softmax_masked(genomes, masked_idx, models).sum(axis=0)
+
+
+def member_softmax_masked(genomes, masked_idx, models):
+    """
+    calculate the softmax of each model in the ensemble for every masked gene in a list of genomes
+
+    :param genomes: list of unmasked one-hot encoded genomes
+    :param masked_idx: list containing the indexes of the masked genes of each genome
+    :param models: list of numpy models which have already been read in
+    :return: softmax of each model with shape (models, masked genes, categories)
+    """
+
+    scores_list = [
+        models[i].predict_masked(genomes, masked_idx) for i in range(len(models))
+    ]
+
+    return np.array(scores_list)
 
 
 def build_confidence_dict(label, prediction, scores, bandwidth, categories):
+    from sklearn.neighbors import KernelDensity
+
     # range over values to compute kernel density over
     vals = np.arange(1.5, 10, 0.001)
 
@@ -124,6 +167,9 @@ def build_roc(scores, known_categories, category_names):
     :return: dataframe for plotting the ROC curve
     """
 
+    import pandas as pd
+    from sklearn.metrics import roc_curve
+
     # normalise the scores such that ROC can be computed
     normed_scores = norm_scores(scores)
     known_categories = np.array(known_categories)
@@ -174,6 +220,8 @@ def per_category_auc(scores, known_categories, category_names, method="ovr"):
     :return: AUC score for each category
     """
 
+    from sklearn.metrics import roc_auc_score
+
     # dictionary to store AUC
     auc_dict = {}
 
@@ -239,6 +287,8 @@ def class_scores(tt, scores, is_real, prot_class, df):
     :param df: dataframe to append to
     """
 
+    import pandas as pd
+
     is_predicted = [x >= tt - 0.05 for x in scores]
 
     # TODO check that this here is correct
@@ -290,6 +340,8 @@ def threshold_metrics(scores, known_categories, category_names):
     :param category_names: dictionary of category labels
     """
 
+    import pandas as pd
+
     d = {
         "class": [],
         "precision": [],
@@ -338,6 +390,8 @@ def confidence_metrics(scores, confidence_out, known_categories, category_names)
     :param category_names: dictionary of category labels
     """
 
+    import pandas as pd
+
     d = {
         "class": [],
         "precision": [],
@@ -385,6 +439,10 @@ def compute_confidence(scores, confidence_dict, categories):
     Input is a vector of Phynteny scores
     """
 
+    # confidence curves compiled from the kernel density estimators
+    if "curves" in confidence_dict:
+        return interpolate_confidence(scores, confidence_dict)
+
     # get the prediction for each score
     score_predictions = np.array([np.argmax(score) for idx, score in enumerate(scores)])
 
@@ -398,27 +456,115 @@ def compute_confidence(scores, confidence_dict, categories):
         cat_scores = np.array(scores)[score_predictions == i]
 
         if len(cat_scores) > 0:
-            # compute the kernel density estimates
-            e_TP = np.exp(
-                confidence_dict.get(categories.get(i))
-                .get("kde_TP")
-                .score_samples(cat_scores[:, i].reshape(-1, 1))
-            )
-            e_FP = np.exp(
-                confidence_dict.get(categories.get(i))
-                .get("kde_FP")
-                .score_samples(cat_scores[:, i].reshape(-1, 1))
-            )
-
-            # fetch the number of TP and FP
-            num_TP = confidence_dict.get(categories.get(i)).get("num_TP")
-            num_FP = confidence_dict.get(categories.get(i)).get("num_FP")
-
             # compute the confidence scores
-            conf_kde = (e_TP * num_TP) / (e_TP * num_TP + e_FP * num_FP)
+            conf_kde = kde_confidence(
+                cat_scores[:, i], confidence_dict.get(categories.get(i))
+            )
 
             # save the scores to the output vector
             confidence_out[score_predictions == i] = conf_kde
             predictions_out[score_predictions == i] = [i for k in range(len(conf_kde))]
 
     return predictions_out, confidence_out
+
+
+def kde_confidence(cat_scores, category_kde):
+    """
+    Compute the confidence of predictions to a category from its kernel density estimators
+
+    :param cat_scores: phynteny score of the predicted category for each prediction
+    :param category_kde: dictionary containing the kernel density estimators of the category
+    :return: confidence of each prediction
+    """
+
+    # compute the kernel density estimates
+    e_TP = np.exp(category_kde.get("kde_TP").score_samples(cat_scores.reshape(-1, 1)))
+    e_FP = np.exp(category_kde.get("kde_FP").score_samples(cat_scores.reshape(-1, 1)))
+
+    # fetch the number of TP and FP
+    num_TP = category_kde.get("num_TP")
+    num_FP = category_kde.get("num_FP")
+
+    return (e_TP * num_TP) / (e_TP * num_TP + e_FP * num_FP)
+
+
+def compile_confidence(confidence_dict, categories, vals=np.arange(0, 10.0005, 0.001)):
+    """
+    Evaluate the kernel density estimators of each category over a grid of phynteny scores.
+    The curves can be interpolated to compute confidence without the estimators.
+
+    :param confidence_dict: dictionary of kernel density estimators for each category
+    :param categories: dictionary of category labels
+    :param vals: evenly spaced phynteny scores to evaluate the confidence at
+    :return: dictionary containing the grid and the confidence curve of each category
+    """
+
+    curves = np.zeros((len(categories), len(vals)))
+
+    for i in range(1, 10):
+        curves[i] = kde_confidence(vals, confidence_dict.get(categories.get(i)))
+
+    return {"grid": vals, "curves": curves}
+
+
+def interpolate_confidence(scores, compiled):
+    """
+    Compute the confidence of Phynteny predictions by linear interpolation of compiled confidence curves.
+    Scores outside of the grid take the confidence at the nearest end of the grid.
+
+    :param scores: phynteny scores for each prediction
+    :param compiled: dictionary containing the grid and the confidence curve of each category
+    :return: predictions and the confidence associated with each
+    """
+
+    scores = np.array(scores).reshape(len(scores), -1)
+    grid = compiled.get("grid")
+    curves = compiled.get("curves")
+
+    # get the prediction for each score
+    predictions = np.argmax(scores, axis=1)
+    best = scores[np.arange(len(scores)), predictions]
+
+    # position of each score on the evenly spaced grid
+    position = np.clip((best - grid[0]) / (grid[1] - grid[0]), 0, len(grid) - 1)
+    lower = np.minimum(np.floor(position).astype(int), len(grid) - 2)
+    fraction = position - lower
+
+    confidence_out = (
+        curves[predictions, lower] * (1 - fraction)
+        + curves[predictions, lower + 1] * fraction
+    )
+
+    # predictions of unknown function are not given a confidence
+    confidence_out[predictions == 0] = 0
+    predictions_out = predictions.astype(float)
+
+    return predictions_out, confidence_out
+
+
+def check_confidence(confidence_dict, compiled, categories, num_samples=10000):
+    """
+    Compare compiled confidence curves to the kernel density estimators they were compiled from
+
+    :param confidence_dict: dictionary of kernel density estimators for each category
+    :param compiled: dictionary containing the grid and the confidence curve of each category
+    :param categories: dictionary of category labels
+    :param num_samples: number of random scores to compare for each category
+    :return: maximum absolute difference in confidence
+    """
+
+    grid = compiled.get("grid")
+    rng = np.random.default_rng(42)
+    max_error = 0
+
+    for i in range(1, 10):
+        # scores which are predictions of this category
+        scores = np.zeros((num_samples, len(categories)))
+        scores[:, i] = rng.uniform(grid[0], grid[-1], num_samples)
+
+        expected = kde_confidence(scores[:, i], confidence_dict.get(categories.get(i)))
+        observed = interpolate_confidence(scores, compiled)[1]
+
+        max_error = max(max_error, np.nanmax(np.abs(expected - observed)))
+
+    return max_error
@@ -1,10 +1,11 @@
 # imports
 from tensorflow.keras import Sequential
-from tensorflow.keras.layers import Bidirectional, TimeDistributed, Dense, LSTM
+from tensorflow.keras.layers import Bidirectional, TimeDistributed, Dense, LSTM, Masking
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
 import tensorflow.keras.optimizers as optimizers
 import tensorflow.keras.initializers as initializers
 from tensorflow.keras.regularizers import L1L2
+from tensorflow.keras.utils import Sequence
 from sklearn.model_selection import train_test_split, StratifiedKFold
 import pickle5
 from phynteny_utils import format_data
@@ -84,6 +85,71 @@ def get_initializer(initializer_function):
     return kernel_initializer
 
 
+class LengthBuckets(Sequence):
+    """
+    Batches of training examples grouped into buckets by the length of their genome. Each batch is cut to the
+    longest genome it contains, so a model with a masking layer only runs over the genes in the batch rather than
+    every example being padded to max_length
+    """
+
+    def __init__(self, X, y, lengths, batch_size, bucket_width=10, shuffle=True):
+        """
+        :param X: padded examples of shape (examples, max_length, num_functions)
+        :param y: labels of each example
+        :param lengths: number of genes in the genome of each example
+        :param batch_size: maximum number of examples in a batch
+        :param bucket_width: number of genes spanned by each bucket
+        :param shuffle: whether to shuffle the examples in each bucket and the order of the batches every epoch
+        """
+
+        self.X = X
+        self.y = y
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_width = bucket_width
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(42)
+        self.batches = self.make_batches()
+
+    def make_batches(self):
+        """
+        Split the examples of each bucket into batches
+
+        :return: list of arrays containing the indexes of the examples in each batch
+        """
+
+        buckets = -(-self.lengths // self.bucket_width)
+        batches = []
+
+        for bucket in np.unique(buckets):
+            idx = np.where(buckets == bucket)[0]
+            if self.shuffle:
+                idx = self.rng.permutation(idx)
+
+            batches += [
+                idx[i : i + self.batch_size]
+                for i in range(0, len(idx), self.batch_size)
+            ]
+
+        if self.shuffle:
+            batches = [batches[i] for i in self.rng.permutation(len(batches))]
+
+        return batches
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __getitem__(self, i):
+        idx = self.batches[i]
+        length = self.lengths[idx].max()
+
+        return self.X[idx, :length], self.y[idx]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.batches = self.make_batches()
+
+
 class Model:
     def __init__(
         self,
@@ -103,6 +169,7 @@ class Model:
         l1_regularizer=0,
         l2_regularizer=0,
         kernel_initializer="zeros",
+        masking=False,
     ):
         """
         :param phrog_categories_path: location of the dictionary describing the phrog_categories :param
@@ -117,6 +184,8 @@ class Model:
         :param learning_rate: learning rate for training
         :param patience: number of epochs with no improvement after which training will be stopped
         :param min_delta: minimum change in validation loss considered an improvement
+        :param masking: whether to build the model with a masking layer which skips the padding after each genome.
+        Examples are then batched by the length of their genome
         """
 
         # set general information for the model
@@ -140,10 +209,12 @@ class Model:
         # set early stopping conditions
         self.patience = patience
         self.min_delta = min_delta
+        self.masking = masking
 
         # placeholder variables
         self.X = []
         self.y = []
+        self.lengths = None
 
     def fit_data(self, data_path):
         """
@@ -157,6 +228,13 @@ class Model:
         self.X, self.y = format_data.generate_dataset(
             data, self.num_functions, self.max_length
         )
+        self.lengths = np.array([len(data.get(k).get("categories")) for k in data])
+
+        # mark the padding such that the masking layer can skip it
+        if self.masking:
+            self.X[format_data.pad_rows(self.lengths, self.max_length)] = (
+                format_data.PAD_VALUE
+            )
 
     def parse_masked_data(self, X_path, y_path):
         """
@@ -220,6 +298,14 @@ class Model:
         # get the kernel initializer
         kernel_initializer = get_initializer(self.kernel_intializer)
 
+        # models with a masking layer take genomes of any length
+        input_shape = (self.max_length, self.num_functions)
+        if self.masking:
+            input_shape = (None, self.num_functions)
+            model.add(
+                Masking(mask_value=format_data.PAD_VALUE, input_shape=input_shape)
+            )
+
         print("Number of layers: " + str(self.layers))
 
         # loop to add layers to the model
@@ -237,7 +323,7 @@ class Model:
                             kernel_initializer=kernel_initializer,
                             activation=self.activation,
                         ),
-                        input_shape=(self.max_length, self.num_functions),
+                        input_shape=input_shape,
                     )
                 )
 
@@ -254,7 +340,7 @@ class Model:
                             kernel_initializer=kernel_initializer,
                             activation=self.activation,
                         ),
-                        input_shape=(self.max_length, self.num_functions),
+                        input_shape=input_shape,
                     )
                 )
 
@@ -281,6 +367,8 @@ class Model:
         history_out="history",
         epochs=140,
         save=True,
+        lengths_1=None,
+        lengths_val=None,
     ):
         """
         Function to train the LSTM model and save the trained model
@@ -293,20 +381,40 @@ class Model:
         :param history_out: string - prefix of history dictionary output
         :param epochs: number of epochs to train the model for
         :param save: whether to save the model - default = True
+        :param lengths_1: number of genes in the genome of each training example. Required for masking
+        :param lengths_val: number of genes in the genome of each validation example. Required for masking
         """
 
         # model with the best validation set accuracy therefore maximise
         model = self.generate_LSTM()
 
-        history = model.fit(
-            X_1,
-            y_1,
-            epochs=epochs,
-            batch_size=self.batch_size,
-            callbacks=self.get_callbacks(model_out),
-            validation_data=(X_val, y_val),
-            verbose=1,
-        )
+        if self.masking:
+            if lengths_1 is None or lengths_val is None:
+                raise ValueError(
+                    "Models with a masking layer need the length of each genome. Load the data with fit_data"
+                )
+
+            # batches of genomes of similar length
+            history = model.fit(
+                LengthBuckets(X_1, y_1, lengths_1, self.batch_size),
+                epochs=epochs,
+                callbacks=self.get_callbacks(model_out),
+                validation_data=LengthBuckets(
+                    X_val, y_val, lengths_val, self.batch_size, shuffle=False
+                ),
+                verbose=1,
+            )
+
+        else:
+            history = model.fit(
+                X_1,
+                y_1,
+                epochs=epochs,
+                batch_size=self.batch_size,
+                callbacks=self.get_callbacks(model_out),
+                validation_data=(X_val, y_val),
+                verbose=1,
+            )
 
         # save the model
         if save:
@@ -388,6 +496,16 @@ class Model:
                 history_out=history_out + ".rep_" + str(counter) + ".",
                 epochs=epochs,
                 save=save,
+                lengths_1=(
+                    self.lengths[train_index_kfold[k]]
+                    if self.lengths is not None
+                    else None
+                ),
+                lengths_val=(
+                    self.lengths[val_index_kfold[k]]
+                    if self.lengths is not None
+                    else None
+                ),
             )
 
             # update counter
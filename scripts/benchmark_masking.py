@@ -0,0 +1,130 @@
+"""
+Benchmark models with a masking layer against models which see every genome padded to 120 genes
+
+Two models are built by train_model.Model with random weights, one of them with a masking layer. Each phage in
+the training data has one gene masked, as in training, and the masked genes are scored by a Predictor for each model.
+The speedup depends on the length distribution of the phages, which is read from the training data.
+"""
+
+# imports
+import argparse
+import os
+import pickle
+import random
+import tempfile
+import time
+import numpy as np
+from phynteny_utils import numpy_models
+from phynteny_utils import predictor
+from phynteny_utils import resources
+from phynteny_utils import train_model
+
+parser = argparse.ArgumentParser(
+    description="benchmark length-bucketed masking models against padded models"
+)
+parser.add_argument(
+    "-d", "--data", help="pickle file containing the training prophages", required=True
+)
+parser.add_argument(
+    "-n", "--sample", help="number of prophages to score", type=int, default=2000
+)
+parser.add_argument(
+    "-l", "--layers", help="number of hidden layers", type=int, default=2
+)
+parser.add_argument(
+    "-m",
+    "--neurons",
+    help="number of memory cells in each layer",
+    type=int,
+    default=400,
+)
+parser.add_argument(
+    "-b",
+    "--backend",
+    help="backend to run the models with",
+    default="numpy",
+    choices=["keras", "numpy"],
+)
+parser.add_argument(
+    "--batch_size", help="number of prophages scored at once", type=int, default=256
+)
+args = vars(parser.parse_args())
+
+
+def time_predictor(models, phages, backend, batch_size):
+    """score every masked gene and return the number of seconds taken"""
+
+    gene_predictor = predictor.Predictor(
+        models,
+        resources.BUNDLE_PATH,
+        resources.resource_path("phrog_annotation_info", "confidence_curves.npz"),
+        resources.BUNDLE_PATH,
+        backend=backend,
+    )
+
+    keys = list(phages.keys())
+    start = time.perf_counter()
+    for i in range(0, len(keys), batch_size):
+        gene_predictor.predict_batch(
+            {k: phages.get(k) for k in keys[i : i + batch_size]}
+        )
+
+    return time.perf_counter() - start
+
+
+# read the length distribution of the training data
+with open(args.get("data"), "rb") as handle:
+    data = pickle.load(handle)
+
+random.seed(42)
+keys = random.sample(list(data.keys()), min(args.get("sample"), len(data)))
+
+# mask one known gene of each prophage as in training
+phages = {}
+for k in keys:
+    categories = list(data.get(k).get("categories"))[: predictor.MAX_LENGTH]
+    known = [i for i, c in enumerate(categories) if c != 0]
+    if len(known) == 0:
+        continue
+
+    categories = [1 if c == 0 else c for c in categories]
+    categories[random.choice(known)] = 0
+    phages[k] = {"categories": categories}
+
+lengths = np.array([len(p.get("categories")) for p in phages.values()])
+buckets = np.minimum(
+    -(-lengths // predictor.BUCKET_WIDTH) * predictor.BUCKET_WIDTH, predictor.MAX_LENGTH
+)
+print(f"Prophages: {len(lengths)}")
+print(
+    f"Genes per prophage: mean {lengths.mean():.1f}, median {np.median(lengths):.0f}, max {lengths.max()}"
+)
+print(
+    f"LSTM timesteps relative to padding to {predictor.MAX_LENGTH}: {buckets.sum() / (len(buckets) * predictor.MAX_LENGTH):.3f}"
+)
+
+times = {}
+with tempfile.TemporaryDirectory() as tmp:
+    for name, masking in [("padded", False), ("masking", True)]:
+        models = os.path.join(tmp, name)
+        os.mkdir(models)
+        model = train_model.Model(
+            layers=args.get("layers"),
+            neurons=args.get("neurons"),
+            kernel_initializer="random_normal",
+            masking=masking,
+        ).generate_LSTM()
+
+        if args.get("backend") == "numpy":
+            numpy_models.export_weights(model, os.path.join(models, "model.npz"))
+        else:
+            model.save(os.path.join(models, "model.h5"))
+
+        times[name] = time_predictor(
+            models, phages, args.get("backend"), args.get("batch_size")
+        )
+        print(
+            f"{name}: {times.get(name):.2f} s ({len(phages) / times.get(name):.1f} masked genes per second)"
+        )
+
+print(f"Speedup: {times.get('padded') / times.get('masking'):.2f}x")
@@ -84,6 +84,15 @@ setuptools.setup(
             "train_model=train_phynteny.train_phyntenty:main",
             "compute_confidence=train_phynteny.compute_confidence:main",
             "install_models=phynteny_utils.install_models:main",
+            "fuse_models=phynteny_utils.fuse_models:main",
+            "export_models=phynteny_utils.export_models:main",
+            "convert_models=phynteny_utils.convert_models:main",
+            "compile_confidence=phynteny_utils.compile_confidence:main",
+            "compile_resources=phynteny_utils.compile_resources:main",
+            "phynteny_serve=phynteny_utils.phynteny_serve:main",
+            "phynteny_client=phynteny_utils.phynteny_client:main",
+            "phynteny_lookup=phynteny_utils.phynteny_lookup:main",
+            "phynteny_recalibrate=phynteny_utils.phynteny_recalibrate:main",
         ],
     },
     classifiers=[
@@ -95,5 +104,6 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     install_requires=install_requires,
+    extras_require={"parquet": ["pyarrow"]},
     python_requires="<3.11",
 )
@@ -0,0 +1,87 @@
+"""
+Models and predictors shared by the tests
+"""
+
+# imports
+import json
+import numpy as np
+import pytest
+from phynteny_utils import format_data
+from phynteny_utils import predictor
+from phynteny_utils import resources
+
+
+def write_random_model(outfile, seed, units=8, num_functions=10, max_length=120):
+    """write a random single layer model in the format exported for the numpy backend"""
+
+    rng = np.random.default_rng(seed)
+    config = {
+        "input_shape": [max_length, num_functions],
+        "layers": [
+            {
+                "type": "Bidirectional",
+                "activation": "tanh",
+                "recurrent_activation": "sigmoid",
+                "return_sequences": False,
+            },
+            {"type": "Dense", "activation": "softmax"},
+        ],
+    }
+
+    weights = {}
+    for direction in ["forward", "backward"]:
+        weights["layer_0_" + direction + "_kernel"] = rng.normal(
+            size=(num_functions, 4 * units)
+        )
+        weights["layer_0_" + direction + "_recurrent_kernel"] = rng.normal(
+            size=(units, 4 * units)
+        )
+        weights["layer_0_" + direction + "_bias"] = rng.normal(size=4 * units)
+    weights["layer_1_kernel"] = rng.normal(size=(2 * units, num_functions))
+    weights["layer_1_bias"] = rng.normal(size=num_functions)
+
+    np.savez(outfile, config=np.array(json.dumps(config)), **weights)
+
+
+def build_model(
+    max_length=120, num_functions=10, neurons=16, layers=2, masking=False, seed=42
+):
+    """build a small keras model with the same architecture as train_model.Model. Skips the test without tensorflow"""
+
+    tf = pytest.importorskip("tensorflow")
+    tf.random.set_seed(seed)
+    model = tf.keras.Sequential()
+
+    input_shape = (max_length, num_functions)
+    if masking:
+        input_shape = (None, num_functions)
+        model.add(
+            tf.keras.layers.Masking(
+                mask_value=format_data.PAD_VALUE, input_shape=input_shape
+            )
+        )
+
+    for layer in range(layers):
+        model.add(
+            tf.keras.layers.Bidirectional(
+                tf.keras.layers.LSTM(neurons, return_sequences=layer < layers - 1),
+                input_shape=input_shape,
+            )
+        )
+
+    model.add(tf.keras.layers.Dense(num_functions, activation="softmax"))
+
+    return model
+
+
+def make_predictor(models, backend="numpy", **kwargs):
+    """create a predictor using the resources shipped with phynteny"""
+
+    return predictor.Predictor(
+        str(models),
+        resources.BUNDLE_PATH,
+        resources.resource_path("phrog_annotation_info", "confidence_curves.npz"),
+        resources.BUNDLE_PATH,
+        backend=backend,
+        **kwargs,
+    )
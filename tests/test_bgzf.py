@@ -0,0 +1,32 @@
+"""
+Test the threaded BGZF writer
+"""
+
+import gzip
+import random
+from Bio import bgzf as bio_bgzf
+from phynteny_utils import bgzf
+
+
+def test_bgzf_writer(tmp_path):
+    random.seed(0)
+    lines = [f"record_{i}\t{random.random()}\n" for i in range(50000)]
+    filename = str(tmp_path / "test.tsv.gz")
+
+    # remember where every 1000th line starts
+    marks = []
+    with bgzf.BgzfWriter(filename, threads=4) as handle:
+        for i in range(len(lines)):
+            if i % 1000 == 0:
+                marks.append((i, handle.mark()))
+            handle.write(lines[i])
+
+    # the file can be read as a normal gzip file
+    with gzip.open(filename, "rt") as f:
+        assert f.read() == "".join(lines)
+
+    # and lines can be read directly from their virtual offsets
+    reader = bio_bgzf.BgzfReader(filename, "rt")
+    for i, mark in marks:
+        reader.seek(handle.virtual_offset(mark))
+        assert reader.readline() == lines[i]
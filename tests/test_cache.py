@@ -0,0 +1,109 @@
+"""
+Test the cache of the scores of masked genes
+"""
+
+import numpy as np
+import pytest
+from phynteny_utils import cache
+from phynteny_utils.models import FUSED_MODEL
+from helpers import make_predictor, write_random_model
+
+
+@pytest.fixture
+def models(tmp_path):
+    models = tmp_path / "models"
+    models.mkdir()
+    for i in range(2):
+        write_random_model(str(models / ("model_" + str(i) + ".npz")), i)
+
+    return models
+
+
+def test_predictor_cache(tmp_path, models):
+    # the second phage has the same synteny as the first
+    phages = {
+        "a": {"categories": [1, 0, 3, 4, 0, 2]},
+        "b": {"categories": [1, 0, 3, 4, 0, 2]},
+        "c": {"categories": [5, 0, 7]},
+    }
+
+    expected = make_predictor(models, raw_scores=True).predict_batch(phages)
+    cached = make_predictor(
+        models, raw_scores=True, cache_path=str(tmp_path / "cache.sqlite")
+    )
+
+    for run in range(2):
+        predictions = cached.predict_batch(phages)
+        for key in phages:
+            for e, p in zip(expected.get(key), predictions.get(key)):
+                np.testing.assert_array_equal(e, p)
+
+        assert phages.get("a").get("member_scores").shape == (2, 2, 10)
+
+    assert cached.cache.hits == 5
+    assert cached.cache.misses == 5
+
+
+def test_eviction(tmp_path):
+    prediction_cache = cache.PredictionCache(
+        str(tmp_path / "cache.sqlite"), b"models", max_entries=2
+    )
+    keys = [prediction_cache.keys([0, 1, 2], [i])[0] for i in range(3)]
+    scores = np.eye(3, dtype=np.float32)
+
+    prediction_cache.put(keys[:2], scores[:2], scores[None, :2])
+    prediction_cache.get(keys[:1])
+    prediction_cache.put(keys[2:], scores[2:], scores[None, 2:])
+
+    # the least recently used gene is removed
+    found = prediction_cache.get(keys)
+    assert sorted(found) == sorted([keys[0], keys[2]])
+    np.testing.assert_array_equal(found.get(keys[2])[0], scores[2])
+    assert found.get(keys[0])[1].shape == (1, 3)
+
+
+def test_running_count(tmp_path):
+    prediction_cache = cache.PredictionCache(
+        str(tmp_path / "cache.sqlite"), b"models", max_entries=3
+    )
+    keys = [prediction_cache.keys([0, 1, 2], [i])[0] for i in range(4)]
+    scores = np.eye(4, dtype=np.float32)[:, :3]
+
+    statements = []
+    prediction_cache.connection.set_trace_callback(statements.append)
+
+    # genes already in the cache are replaced rather than counted again
+    prediction_cache.put(keys[:2], scores[:2], scores[None, :2])
+    prediction_cache.put(keys[1:3], scores[1:3], scores[None, 1:3])
+    assert prediction_cache.count == 3
+    assert not any(["COUNT" in s for s in statements])
+
+    prediction_cache.put(keys[3:], scores[3:], scores[None, 3:])
+    assert prediction_cache.count == 3
+    assert sorted(prediction_cache.get(keys)) == sorted(keys[1:])
+
+    # the count is read again when the cache is opened
+    reopened = cache.PredictionCache(
+        str(tmp_path / "cache.sqlite"), b"models", max_entries=3
+    )
+    assert reopened.count == 3
+
+
+def test_fingerprint_of_loaded_models(tmp_path, models):
+    def fingerprint(**kwargs):
+        return make_predictor(
+            models, cache_path=str(tmp_path / "cache.sqlite"), **kwargs
+        ).cache.fingerprint
+
+    expected = fingerprint()
+
+    # files which are not loaded by the backend do not change the fingerprint
+    (models / "model_0.h5").write_bytes(b"keras model")
+    (models / FUSED_MODEL).write_bytes(b"fused ensemble")
+    assert fingerprint() == expected
+
+    # settings which change the scores do
+    assert fingerprint(reuse_states=True) != expected
+
+    write_random_model(str(models / "model_1.npz"), 5)
+    assert fingerprint() != expected
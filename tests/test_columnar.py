@@ -0,0 +1,65 @@
+"""
+Test the Parquet table
+"""
+
+import numpy as np
+import pytest
+from phynteny_utils import columnar
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+CATEGORIES = {0: "unknown function", 1: "lysis", 2: "tail"}
+PHROG_INTEGER = {"No_PHROG": 0, 10: 1, 20: 2}
+
+
+def make_columns(key):
+    phage = {
+        "phrogs": [10, 0, 20, 0],
+        "protein_id": ["a", "b", None, "d"],
+        "sense": ["+", "-", "+", "-"],
+        "position": [(0, 2), (2, 4), (4, 6), (6, 8)],
+    }
+    phage_predictions = (
+        [1, 3],
+        [1, 2],
+        np.array([[0.5, 2.0, 0.5], [0.1, 0.2, 2.7]]),
+        [0.5, 0.9],
+    )
+
+    return columnar.gene_columns(
+        key, "AACCGGTT", phage, phage_predictions, CATEGORIES, PHROG_INTEGER
+    )
+
+
+@pytest.mark.parametrize("sequences", columnar.SEQUENCE_MODES)
+def test_parquet_writer(tmp_path, sequences):
+    path = str(tmp_path / columnar.PARQUET_NAME)
+    writer = columnar.ParquetWriter(path, CATEGORIES, sequences, row_group_size=6)
+    for key in ["phage_1", "phage_2", "phage_3"]:
+        writer.add(make_columns(key))
+    writer.close()
+
+    # phages are written in row groups as they are added
+    assert pq.ParquetFile(path).metadata.num_row_groups == 2
+
+    table = pq.read_table(path).to_pydict()
+    assert table.get("ID")[:4] == ["a", "b", None, "d"]
+    assert table.get("phrog_id")[:2] == [10, None]
+    assert table.get("phrog_category")[:4] == [
+        "lysis",
+        "unknown function",
+        "tail",
+        "unknown function",
+    ]
+    assert table.get("phynteny_category")[:4] == [None, "lysis", None, "tail"]
+    assert table.get("phynteny_score")[:2] == [None, 2.0]
+    assert table.get("confidence")[3] == pytest.approx(0.9)
+    assert table.get("phage")[-1] == "phage_3"
+
+    if sequences == "none":
+        assert "sequence" not in table
+    else:
+        assert table.get("sequence")[:2] == ["AA", "CC"]
+
+    # only the requested columns need to be read
+    assert pq.read_table(path, columns=["confidence"]).num_columns == 1
@@ -0,0 +1,45 @@
+# imports
+import numpy as np
+import pytest
+from phynteny_utils import statistics
+
+pytest.importorskip("sklearn")
+
+CATEGORIES = dict(zip(range(10), ["category_" + str(i) for i in range(10)]))
+
+
+def fit_confidence_dict():
+    """fit kernel density estimators to random phynteny scores"""
+
+    rng = np.random.default_rng(42)
+    label = rng.integers(1, 10, size=2000)
+    scores = rng.dirichlet(np.ones(10), size=2000) * 10
+    scores[np.arange(2000), label] += rng.uniform(0, 10, size=2000)
+    scores = scores / scores.sum(axis=1)[:, np.newaxis] * 10
+    prediction = np.argmax(scores, axis=1)
+
+    return statistics.build_confidence_dict(
+        label, prediction, scores, [0.3], CATEGORIES
+    )
+
+
+def test_compiled_confidence_matches_kde():
+    """
+    Test confidence interpolated from compiled curves is within 1e-4 of the kernel density estimators
+    """
+
+    confidence_dict = fit_confidence_dict()
+    compiled = statistics.compile_confidence(confidence_dict, CATEGORIES)
+
+    assert statistics.check_confidence(confidence_dict, compiled, CATEGORIES) < 1e-4
+
+    scores = np.random.default_rng(1).dirichlet(np.ones(10), size=500) * 10
+    kde_predictions, kde_confidence = statistics.compute_confidence(
+        scores, confidence_dict, CATEGORIES
+    )
+    predictions, confidence = statistics.compute_confidence(
+        scores, compiled, CATEGORIES
+    )
+
+    np.testing.assert_array_equal(predictions, kde_predictions)
+    np.testing.assert_allclose(confidence, kde_confidence, atol=1e-4, rtol=0)
@@ -0,0 +1,46 @@
+"""
+Test building the masked tensors passed to the models
+"""
+
+import numpy as np
+from phynteny_utils import format_data
+
+
+def reference_masked(sequence, idx, num_functions, max_length):
+    """mask one gene of a genome by one-hot encoding each padded gene in turn"""
+
+    padded = list(sequence) + [0] * (max_length - len(sequence))
+
+    X = []
+    for i in range(max_length):
+        vector = [0.0 for j in range(num_functions)]
+        if i != idx:
+            vector[padded[i]] = 1.0
+        X.append(vector)
+
+    return np.array(X)
+
+
+def test_generate_masked_matches_reference():
+    rng = np.random.default_rng(3)
+    full_length = [int(i) for i in rng.integers(0, 10, size=120)]
+    short = [int(i) for i in rng.integers(0, 10, size=17)]
+
+    sequences = [short, [4, 1, 2], full_length, [0], short]
+    masked_idx = [[0, 5, 16], [], [0, 60, 119], [0], [16]]
+
+    X = format_data.generate_masked(sequences, masked_idx, 10, 120)
+    assert X.shape == (8, 120, 10)
+    assert X.dtype == np.float32
+
+    # genomes without unknowns contribute no rows
+    expected = [
+        reference_masked(s, i, 10, 120)
+        for s, m in zip(sequences, masked_idx)
+        for i in m
+    ]
+    np.testing.assert_array_equal(X, np.array(expected))
+
+    # a batch of genomes without unknowns is empty
+    empty = format_data.generate_masked([[1, 2], [3]], [[], []], 10, 120)
+    assert empty.shape == (0, 120, 10)
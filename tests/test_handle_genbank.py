@@ -0,0 +1,122 @@
+"""
+Test the streaming genbank reader
+"""
+
+import io
+import gzip
+import shutil
+from pathlib import Path
+import pytest
+import numpy as np
+from Bio import SeqIO
+from phynteny_utils import handle_genbank
+from phynteny_utils import predictor
+
+TEST_DATA = Path(__file__).parent / "data" / "test_phage.gbk"
+
+
+def test_stream_matches_dict(tmp_path):
+    gb_dict = handle_genbank.get_genbank(str(TEST_DATA))
+
+    # the same records should be read from a gzipped file
+    gzipped = tmp_path / "test_phage.gbk.gz"
+    with open(TEST_DATA, "rb") as f_in, gzip.open(gzipped, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+    for path in [TEST_DATA, gzipped]:
+        records = list(handle_genbank.stream_genbank(str(path)))
+        assert [k for k, r in records] == list(gb_dict.keys())
+
+
+def test_stream_duplicate_ids(tmp_path):
+    duplicated = tmp_path / "duplicated.gbk"
+    duplicated.write_text(TEST_DATA.read_text() * 2)
+
+    # the duplicate is reported with its id rather than as an invalid file
+    key = next(handle_genbank.stream_genbank(str(TEST_DATA)))[0]
+    for reader in [handle_genbank.stream_genbank, handle_genbank.scan_genbank]:
+        with pytest.raises(handle_genbank.DuplicateKeyError) as e:
+            list(reader(str(duplicated)))
+
+        assert e.value.key == key
+        assert isinstance(e.value, ValueError)
+
+
+def test_scan_matches_biopython():
+    records = dict(handle_genbank.stream_genbank(str(TEST_DATA)))
+    scanned = dict(handle_genbank.scan_genbank(str(TEST_DATA)))
+
+    assert list(scanned.keys()) == list(records.keys())
+
+    for key, record in records.items():
+        phage = scanned.get(key)
+        features = handle_genbank.extract_features(record)
+
+        for k in features:
+            assert phage.get(k) == features.get(k)
+        assert phage.get("sequence") == str(record.seq)
+
+
+@pytest.mark.parametrize(
+    "location, expected",
+    [
+        ("1..10", (0, 10, "+")),
+        ("complement(5..20)", (4, 20, "-")),
+        ("join(1..10,20..30)", (0, 30, "+")),
+        ("complement(join(1..10,20..30))", (0, 30, "-")),
+        ("join(complement(20..30),complement(1..10))", (0, 30, "-")),
+        ("<1..>100", (0, 100, "+")),
+        ("join(90..100,1..5)", (0, 100, "+")),
+    ],
+)
+def test_parse_location(location, expected):
+    assert handle_genbank.parse_location(location) == expected
+
+
+def test_read_range():
+    offsets = handle_genbank.index_genbank(str(TEST_DATA))
+    gb_dict = handle_genbank.get_genbank(str(TEST_DATA))
+
+    assert len(offsets) == len(gb_dict)
+
+    # each byte range should hold exactly one record
+    for (start, end), key in zip(offsets, gb_dict.keys()):
+        assert [
+            k for k, r in handle_genbank.read_range(str(TEST_DATA), start, end)
+        ] == [key]
+
+
+def test_write_raw():
+    categories = {
+        1: "integration and excision",
+        6: "moron, auxiliary metabolic gene and host takeover",
+    }
+    records = dict(handle_genbank.stream_genbank(str(TEST_DATA)))
+    scanned = dict(handle_genbank.scan_genbank(str(TEST_DATA), raw=True))
+
+    for key, phage in scanned.items():
+        # records without predictions are copied verbatim
+        handle = io.StringIO()
+        handle_genbank.write_raw(handle, phage, ([], [], [], []), categories)
+        assert handle.getvalue() == "".join(phage.get("lines"))
+
+        # annotated records should read back the same as records annotated with Biopython
+        unk_idx = [0, len(phage.get("phrogs")) - 1]
+        phage_predictions = (
+            unk_idx,
+            [1, 6],
+            np.array([[0.5, 9.5], [1.25, 2.0]]),
+            np.array([0.9, 0.0001]),
+        )
+        handle = io.StringIO()
+        handle_genbank.write_raw(handle, phage, phage_predictions, categories)
+        predictor.annotate_record(records.get(key), phage_predictions, categories)
+
+        written = io.StringIO()
+        SeqIO.write(records.get(key), written, "genbank")
+
+        raw = SeqIO.read(io.StringIO(handle.getvalue()), "gb")
+        biopython = SeqIO.read(io.StringIO(written.getvalue()), "gb")
+        assert [f.qualifiers for f in raw.features] == [
+            f.qualifiers for f in biopython.features
+        ]
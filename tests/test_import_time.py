@@ -0,0 +1,83 @@
+"""
+Test that the command line starts without loading the heavy dependencies of phynteny
+"""
+
+# imports
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+
+EXEC_ROOTDIR = Path(__file__).parent.parent
+
+# modules which must not be imported to print the help or version
+HEAVY_MODULES = [
+    "tensorflow",
+    "keras",
+    "sklearn",
+    "pandas",
+    "scipy",
+    "Bio",
+    "numpy",
+    "pkg_resources",
+]
+
+# budget for the total time spent importing modules in microseconds. Printing the help takes a fraction of this,
+# the margin keeps the test stable on loaded machines while still catching a heavy import
+IMPORT_BUDGET = 2000000
+
+
+def import_times(*args):
+    """
+    Run python with -X importtime
+
+    :param args: arguments to pass to python
+    :return: dictionary mapping each imported module to its own import time in microseconds
+    """
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(EXEC_ROOTDIR)] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=str(EXEC_ROOTDIR),
+    )
+    assert process.returncode == 0, process.stderr
+
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+
+        self_time, _, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(self_time)
+
+    return times
+
+
+@pytest.mark.parametrize("flag", ["--help", "--version"])
+def test_cli_imports(flag):
+    times = import_times(str(EXEC_ROOTDIR / "phynteny"), flag)
+
+    loaded = [m for m in times if m.split(".")[0] in HEAVY_MODULES]
+    assert loaded == []
+    assert sum(times.values()) < IMPORT_BUDGET
+
+
+def test_predictor_imports():
+    """the models are only loaded by the backend which runs them"""
+
+    times = import_times("-c", "from phynteny_utils import predictor")
+
+    loaded = [
+        m
+        for m in times
+        if m.split(".")[0] in ["tensorflow", "keras", "sklearn", "pandas"]
+    ]
+    assert loaded == []
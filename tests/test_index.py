@@ -0,0 +1,46 @@
+"""
+Test indexing and looking up entries in the phynteny outputs
+"""
+
+import random
+import pytest
+from phynteny_utils import bgzf
+from phynteny_utils import index
+
+
+@pytest.mark.parametrize("suffix", [".tsv", ".tsv.gz"])
+def test_index_lookup(tmp_path, suffix):
+    random.seed(0)
+    phages = [f"phage_{random.randint(0, 10**6)}" for i in range(500)]
+    phages = list(dict.fromkeys(phages))
+
+    # small chunks such that the index is merged from several files
+    writer = index.IndexWriter(str(tmp_path / index.INDEX_NAME), chunk_size=100)
+
+    with bgzf.open_output(str(tmp_path / ("phynteny" + suffix))) as f:
+        for phage in phages:
+            rows = [f"{phage}_protein_{i}\t{i}\t{phage}\n" for i in range(3)]
+            writer.add(phage, f)
+            writer.write_rows(f, rows)
+
+    writer.close()
+
+    for phage in random.sample(phages, 50):
+        entries = index.search(str(tmp_path / index.INDEX_NAME), phage)
+        assert len(entries) == 1
+
+        name, offset = entries[0]
+        assert index.fetch(str(tmp_path), name, offset, phage) == "".join(
+            [f"{phage}_protein_{i}\t{i}\t{phage}\n" for i in range(3)]
+        )
+
+        name, offset = index.search(
+            str(tmp_path / index.INDEX_NAME), phage + "_protein_1"
+        )[0]
+        assert index.fetch(str(tmp_path), name, offset, phage + "_protein_1") == (
+            f"{phage}_protein_1\t1\t{phage}\n"
+        )
+
+    assert index.search(str(tmp_path / index.INDEX_NAME), "missing") == []
+    assert index.search(str(tmp_path / index.INDEX_NAME), "") == []
+    assert index.search(str(tmp_path / index.INDEX_NAME), "zzz") == []
@@ -0,0 +1,64 @@
+"""
+Test models with a masking layer and batching by genome length
+"""
+
+import numpy as np
+import pytest
+from phynteny_utils import format_data
+from phynteny_utils import numpy_models
+from phynteny_utils import predictor
+from helpers import build_model, make_predictor
+
+
+def test_masking_model(tmp_path):
+    model = build_model(masking=True)
+    numpy_models.export_weights(model, str(tmp_path / "model.npz"))
+
+    phages = {
+        "a": {"categories": [1, 0, 3]},
+        "b": {"categories": [0, 5, 0, 9, 2] * 6},
+        "c": {"categories": [4, 4, 0, 8] * 10},
+        "d": {"categories": [4, 1, 2]},
+    }
+
+    # the padding is skipped so each phage scores the same as on its own without padding
+    expected = {}
+    for key in ["a", "b", "c"]:
+        sequence = phages.get(key).get("categories")
+        unk_idx = [i for i, x in enumerate(sequence) if x == 0]
+        expected[key] = model.predict(
+            format_data.generate_masked([sequence], [unk_idx], 10, len(sequence))
+        )
+
+    for reuse_states in [False, True]:
+        gene_predictor = make_predictor(
+            tmp_path, reuse_states=reuse_states, raw_scores=True
+        )
+        assert gene_predictor.masking
+        assert gene_predictor.max_length == predictor.MAX_LENGTH
+
+        gene_predictor.predict_batch(phages)
+        for key in ["a", "b", "c"]:
+            np.testing.assert_allclose(
+                phages.get(key).get("scores"), expected.get(key), atol=1e-5
+            )
+        assert phages.get("d").get("scores") is None
+
+
+def test_length_buckets():
+    train_model = pytest.importorskip("phynteny_utils.train_model")
+
+    lengths = np.array([3, 25, 4, 120, 11, 19, 7])
+    X = np.zeros((len(lengths), 120, 10))
+    buckets = train_model.LengthBuckets(X, np.arange(len(lengths)), lengths, 2)
+
+    seen = []
+    for i in range(len(buckets)):
+        X_batch, y_batch = buckets[i]
+
+        # every batch comes from a single bucket and is cut to its longest genome
+        assert len(set((lengths[y_batch] - 1) // 10)) == 1
+        assert X_batch.shape[1] == lengths[y_batch].max()
+        seen += list(y_batch)
+
+    assert sorted(seen) == list(range(len(lengths)))
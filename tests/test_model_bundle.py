@@ -0,0 +1,111 @@
+"""
+Test the bundle of models converted for the numpy backend
+"""
+
+import json
+import os
+import numpy as np
+import pytest
+from phynteny_utils import format_data
+from phynteny_utils import numpy_models
+from phynteny_utils import predictor
+from phynteny_utils.models import MODEL_BUNDLE, BUNDLE_MANIFEST
+from helpers import build_model, make_predictor, write_random_model
+
+
+@pytest.fixture
+def models(tmp_path):
+    models = tmp_path / "models"
+    models.mkdir()
+    for i in range(3):
+        write_random_model(str(models / ("model_" + str(i) + ".npz")), i)
+
+    return str(models)
+
+
+def test_bundle_matches_exported_models(models):
+    expected = numpy_models.load_models(models)
+    assert predictor.resolve_backend(models, "auto") == "keras"
+
+    numpy_models.bundle_models(models)
+    assert numpy_models.check_bundle(models)
+    assert predictor.resolve_backend(models, "auto") == "numpy"
+
+    with open(models + "/" + BUNDLE_MANIFEST) as f:
+        manifest = json.load(f)
+    assert [m.get("source") for m in manifest.get("members")] == [
+        "model_0.npz",
+        "model_1.npz",
+        "model_2.npz",
+    ]
+    assert manifest.get("members")[0].get("arrays").get("layer_1_kernel") == {
+        "shape": [16, 10],
+        "dtype": "<f4",
+    }
+
+    X = format_data.generate_masked([[1, 0, 3, 4, 0, 2]], [[1, 4]], 10, 120)
+    bundled = numpy_models.load_models(models)
+    assert len(bundled) == 3
+    for e, b in zip(expected, bundled):
+        np.testing.assert_array_equal(e.predict(X), b.predict(X))
+
+
+def test_stale_bundle(models):
+    numpy_models.bundle_models(models)
+
+    # models which change after the bundle was made are loaded individually
+    write_random_model(models + "/model_1.npz", 5, units=4)
+    assert not numpy_models.check_bundle(models)
+    assert numpy_models.load_models(models)[1].get_weight(1, "kernel").shape == (8, 10)
+
+
+def test_retrained_model_of_same_size(models):
+    numpy_models.bundle_models(models)
+    manifest = numpy_models.read_manifest(models)
+
+    # touching a model without changing it keeps the bundle
+    os.utime(models + "/model_0.npz", ns=(0, 0))
+    assert numpy_models.bundle_is_current(models, manifest)
+
+    # a model retrained with the same architecture has the same size
+    write_random_model(models + "/model_1.npz", 5)
+    assert os.path.getsize(models + "/model_1.npz") == manifest.get("members")[1].get(
+        "size"
+    )
+    assert not numpy_models.bundle_is_current(models, manifest)
+    assert numpy_models.model_files(models) == numpy_models.exported_files(models)
+
+
+def test_corrupt_bundle(models):
+    numpy_models.bundle_models(models)
+
+    with open(models + "/" + MODEL_BUNDLE, "r+b") as f:
+        f.seek(-100, 2)
+        f.write(b"\0" * 10)
+
+    assert not numpy_models.check_bundle(models)
+    with pytest.raises(ValueError):
+        numpy_models.load_models(models)
+
+
+def test_stale_bundle_uses_keras(tmp_path):
+    models = str(tmp_path)
+    for i in range(2):
+        build_model(neurons=4, layers=1, seed=i).save(
+            models + "/model_" + str(i) + ".h5"
+        )
+    numpy_models.bundle_models(models)
+    assert predictor.resolve_backend(models, "auto") == "numpy"
+
+    # replacing a keras model makes the bundle stale so auto falls back to keras
+    build_model(neurons=8, layers=1).save(models + "/model_1.h5")
+    assert predictor.resolve_backend(models, "auto") == "keras"
+
+    gene_predictor = make_predictor(models, backend="auto")
+    assert len(gene_predictor.models) == 2
+    assert gene_predictor.models[1].layers[0].forward_layer.units == 8
+
+
+def test_no_models(tmp_path):
+    with pytest.raises(ValueError, match="No models could be loaded"):
+        make_predictor(str(tmp_path))
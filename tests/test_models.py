@@ -0,0 +1,41 @@
+"""
+Test installing the models
+"""
+
+import os
+from phynteny_utils import models
+from phynteny_utils.models import MODEL_BUNDLE, BUNDLE_MANIFEST
+from helpers import build_model
+
+
+def test_incomplete_download_is_not_bundled(tmp_path, monkeypatch, capsys):
+    # the download fails without raising
+    monkeypatch.setattr(models, "get_model_zenodo", lambda db_dir: None)
+    db_dir = str(tmp_path / "models")
+    models.instantiate_install(db_dir)
+
+    assert "install failed" in capsys.readouterr().err
+    assert not os.path.exists(os.path.join(db_dir, MODEL_BUNDLE))
+
+    # only some of the models arrived
+    open(os.path.join(db_dir, models.PHYNTENY_MODEL_NAMES[0]), "w").close()
+    models.instantiate_install(db_dir)
+
+    assert "install failed" in capsys.readouterr().err
+    assert not os.path.exists(os.path.join(db_dir, BUNDLE_MANIFEST))
+
+
+def test_complete_download_is_bundled(tmp_path, monkeypatch):
+    names = ["model_0.h5", "model_1.h5"]
+    monkeypatch.setattr(models, "PHYNTENY_MODEL_NAMES", names)
+
+    def download(db_dir):
+        for i, name in enumerate(names):
+            build_model(neurons=4, layers=1, seed=i).save(os.path.join(db_dir, name))
+
+    monkeypatch.setattr(models, "get_model_zenodo", download)
+    db_dir = str(tmp_path)
+    models.instantiate_install(db_dir)
+
+    assert os.path.isfile(os.path.join(db_dir, MODEL_BUNDLE))
+    assert os.path.isfile(os.path.join(db_dir, BUNDLE_MANIFEST))
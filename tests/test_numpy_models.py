@@ -0,0 +1,92 @@
+# imports
+import numpy as np
+import pytest
+from phynteny_utils import format_data
+from phynteny_utils import numpy_models
+from phynteny_utils import predictor
+from helpers import build_model
+
+tf = pytest.importorskip("tensorflow")
+
+
+def test_numpy_backend_matches_keras(tmp_path):
+    """
+    Test the numpy backend agrees with keras
+    """
+
+    model = build_model()
+    outfile = str(tmp_path / "model.npz")
+    numpy_models.export_weights(model, outfile)
+
+    # mask each unknown in a batch of random genomes
+    rng = np.random.default_rng(42)
+    sequences = [list(rng.integers(0, 10, size=n)) for n in [5, 60, 120]]
+    masked_idx = [[i for i, x in enumerate(s) if x == 0] + [1] for s in sequences]
+    X = format_data.generate_masked(sequences, masked_idx, 10, 120)
+
+    expected = model.predict(X)
+    observed = numpy_models.NumpyModel(outfile).predict(X, batch_size=4)
+
+    assert observed.shape == expected.shape
+    np.testing.assert_allclose(observed, expected, atol=1e-5, rtol=0)
+
+
+@pytest.mark.parametrize("layers", [1, 2])
+def test_reused_states_match_full_masking(tmp_path, layers):
+    """
+    Test reusing the states shared between masks gives the same scores as masking each gene separately
+    """
+
+    outfile = str(tmp_path / "model.npz")
+    numpy_models.export_weights(build_model(layers=layers), outfile)
+    model = numpy_models.NumpyModel(outfile)
+
+    sequences = [[1, 0, 3], [0, 5, 0, 9, 2] * 24, [4, 4, 0, 8]]
+    masked_idx = [[1], [0, 2, 119, 60], []]
+
+    expected = model.predict(
+        format_data.generate_masked(sequences, masked_idx, 10, 120)
+    )
+    observed = model.predict_masked(
+        [format_data.encode_genome(s, 10, 120) for s in sequences],
+        masked_idx,
+        batch_size=2,
+    )
+
+    np.testing.assert_allclose(observed, expected, atol=1e-6, rtol=0)
+
+
+def test_integer_input_model(tmp_path):
+    """
+    Test a model converted to take category integers agrees with the original in keras and numpy
+    """
+
+    model = build_model()
+    outfile = str(tmp_path / "model.h5")
+    predictor.integer_input_model(model).save(outfile)
+    integer_model = tf.keras.models.load_model(outfile)
+
+    assert predictor.is_integer_model(integer_model)
+    assert predictor.verify_integer_model(model, integer_model, num_examples=50) < 1e-6
+
+    # the embedding is folded into the first layer of the exported model
+    numpy_model = str(tmp_path / "model.npz")
+    numpy_models.export_weights(integer_model, numpy_model)
+    numpy_model = numpy_models.NumpyModel(numpy_model)
+    assert numpy_model.get_weight(0, "forward_kernel").shape == (11, 64)
+
+    sequences = [[1, 0, 3], [0, 5, 0, 9, 2] * 24, [4, 4, 0, 8]]
+    masked_idx = [[1], [0, 2, 119, 60], [2]]
+
+    expected = model.predict(
+        format_data.generate_masked(sequences, masked_idx, 10, 120)
+    )
+    observed = numpy_model.predict(
+        format_data.generate_masked_integer(sequences, masked_idx, 10, 120)
+    )
+    np.testing.assert_allclose(observed, expected, atol=1e-5, rtol=0)
+
+    observed = numpy_model.predict_masked(
+        [format_data.pad_sequence(s, 120) for s in sequences], masked_idx
+    )
+    np.testing.assert_allclose(observed, expected, atol=1e-5, rtol=0)
@@ -0,0 +1,139 @@
+"""
+Test running shards across worker processes
+"""
+
+import gzip
+import os
+import time
+from pathlib import Path
+import pytest
+from phynteny_utils import handle_genbank
+from phynteny_utils import parallel
+
+TEST_DATA = Path(__file__).parent / "data" / "test_phage.gbk"
+
+
+def crash_once(shard):
+    """
+    Kill the worker the first time a shard is processed
+    """
+
+    marker, value = shard
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+
+    return value * 2
+
+
+def fail_once(shard):
+    """
+    Raise an error the first time a shard is processed
+    """
+
+    marker, value = shard
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        raise RuntimeError("failed once")
+
+    return value * 2
+
+
+def always_crash(shard):
+    os._exit(1)
+
+
+def slow_first_shard(shard):
+    """
+    Hold the first shard back and count the shards which started while it was running
+    """
+
+    directory, i = shard
+    if i == 0:
+        time.sleep(1)
+        return len(os.listdir(directory))
+
+    open(os.path.join(directory, str(i)), "w").close()
+
+    return i
+
+
+def read_keys(shard):
+    return [k for k, r in handle_genbank.read_range(*shard)]
+
+
+def test_retry_crashed_shards(tmp_path):
+    shards = [(str(tmp_path / f"shard_{i}"), i) for i in range(6)]
+
+    results = list(parallel.run_shards(shards, crash_once, workers=2, retries=6))
+
+    assert results == [i * 2 for i in range(6)]
+
+
+def test_crashes_only_count_against_their_shard(tmp_path):
+    # each shard crashes once which would exhaust the retries if every running shard was charged for a crash
+    shards = [(str(tmp_path / f"shard_{i}"), i) for i in range(4)]
+
+    results = list(parallel.run_shards(shards, crash_once, workers=2, retries=1))
+
+    assert results == [i * 2 for i in range(4)]
+
+
+def test_retry_failed_shards(tmp_path):
+    # the first shard holds back the rest until it is retried
+    shards = [(str(tmp_path / f"shard_{i}"), i) for i in range(12)]
+
+    results = list(parallel.run_shards(shards, fail_once, workers=2, retries=1))
+
+    assert results == [i * 2 for i in range(12)]
+
+
+def test_slow_shard_limits_shards_ahead(tmp_path):
+    shards = [(str(tmp_path), i) for i in range(20)]
+
+    results = list(parallel.run_shards(shards, slow_first_shard, workers=2))
+
+    # later shards are not started while the first is holding up the results
+    assert results[1:] == list(range(1, 20))
+    assert results[0] < 2 * parallel.SHARDS_PER_WORKER
+
+
+def test_fail_after_retries():
+    with pytest.raises(RuntimeError):
+        list(parallel.run_shards([0, 1], always_crash, workers=2, retries=1))
+
+
+def test_make_shards(tmp_path):
+    shards = parallel.make_shards(str(TEST_DATA), 4)
+
+    # the byte ranges cover every record in order
+    assert shards[0][1] == 0
+    assert all([a[2] == b[1] for a, b in zip(shards, shards[1:])])
+    assert shards[-1][2] == os.path.getsize(TEST_DATA)
+
+    # records of compressed files would have to be sent to the workers
+    compressed = tmp_path / "test_phage.gbk.gz"
+    with open(TEST_DATA, "rb") as f, gzip.open(compressed, "wb") as g:
+        g.write(f.read())
+
+    assert not handle_genbank.can_split(str(compressed))
+    assert not handle_genbank.can_split("-")
+    with pytest.raises(ValueError):
+        parallel.make_shards(str(compressed), 4)
+
+
+def test_duplicate_in_byte_range(tmp_path):
+    # repeat the second record next to itself
+    with open(TEST_DATA, "rb") as f:
+        text = f.read()
+    records = [text[s:e] for s, e in handle_genbank.index_genbank(str(TEST_DATA))]
+    duplicated = tmp_path / "duplicated.gbk"
+    duplicated.write_bytes(b"".join(records[:2] + records[1:]))
+
+    # duplicates across ranges are found as the results arrive so read both copies in one range
+    shards = parallel.make_shards(str(duplicated), 1)
+    assert len(shards) == 1
+
+    with pytest.raises(handle_genbank.DuplicateKeyError) as e:
+        list(parallel.run_shards(shards, read_keys, workers=2))
+    assert e.value.key == list(handle_genbank.stream_genbank(str(TEST_DATA)))[1][0]
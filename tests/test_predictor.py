@@ -0,0 +1,257 @@
+"""
+Test predicting unknown genes across phages, with a fused ensemble and writing the results table
+"""
+
+import os
+import numpy as np
+import pytest
+from phynteny_utils import format_data
+from phynteny_utils import handle_genbank
+from phynteny_utils import predictor
+from phynteny_utils import resources
+from phynteny_utils.models import FUSED_MODEL
+from helpers import build_model, make_predictor, write_random_model
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), "data", "test_phage.gbk")
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    models = tmp_path_factory.mktemp("models")
+    for i in range(3):
+        write_random_model(str(models / ("model_" + str(i) + ".npz")), i)
+
+    return str(models)
+
+
+@pytest.fixture(scope="module")
+def keras_models(tmp_path_factory):
+    models = tmp_path_factory.mktemp("keras_models")
+    for i in range(3):
+        build_model(neurons=4, layers=1, seed=i).save(
+            str(models / ("model_" + str(i) + ".h5"))
+        )
+
+    return str(models)
+
+
+@pytest.fixture(scope="module")
+def categories():
+    return format_data.get_dict(
+        resources.resource_path("phrog_annotation_info", "integer_category.pkl")
+    )
+
+
+def make_phages():
+    rng = np.random.default_rng(7)
+    phages = {
+        "no_unknowns": {"categories": [1, 2, 3, 4]},
+        "no_genes": {"categories": []},
+        "one_gene": {"categories": [0]},
+        "too_long": {"categories": [0] * 130},
+    }
+    for n in [3, 20, 60, 120]:
+        phages["random_" + str(n)] = {
+            "categories": [int(i) for i in rng.integers(0, 10, size=n)]
+        }
+
+    return phages
+
+
+@pytest.mark.parametrize(
+    "backend, reuse_states", [("keras", False), ("numpy", False), ("numpy", True)]
+)
+def test_batching_matches_single_phages(request, backend, reuse_states):
+    """
+    Test gathering masked genes across phages gives the same predictions as predicting each phage alone
+    """
+
+    if backend == "keras":
+        models = request.getfixturevalue("keras_models")
+    else:
+        models = request.getfixturevalue("models")
+
+    gene_predictor = make_predictor(models, backend, reuse_states=reuse_states)
+
+    results = {}
+    for batch_size in [1, 1024]:
+        phages = make_phages()
+        results[batch_size] = {
+            key: phage_predictions
+            for key, record, phage, phage_predictions in predictor.predict_phages(
+                [(k, None, p) for k, p in phages.items()], gene_predictor, batch_size
+            )
+        }
+
+    assert list(results.get(1).keys()) == list(make_phages().keys())
+    assert list(results.get(1024).keys()) == list(make_phages().keys())
+    assert len(results.get(1).get("no_unknowns")[0]) == 0
+    assert len(results.get(1).get("random_120")[0]) > 0
+
+    # unknown indexes, predictions, scores and confidence are identical
+    for key in results.get(1):
+        for single, batched in zip(results.get(1).get(key), results.get(1024).get(key)):
+            np.testing.assert_array_equal(single, batched)
+
+
+def test_phages_without_unknowns_are_not_held(models):
+    """
+    Test phages with nothing to mask come out before the input is exhausted rather than waiting for a batch to fill
+    """
+
+    gene_predictor = make_predictor(models)
+    read = []
+
+    def phages(num_phages, unknown_every):
+        for i in range(num_phages):
+            read.append(i)
+            categories = [1, 2, 3, 4]
+            if unknown_every is not None and i % unknown_every == 0:
+                categories[1] = 0
+            yield "phage_" + str(i), None, {"categories": categories}
+
+    # none of the phages has a gene to mask
+    predicted = predictor.predict_phages(phages(1000, None), gene_predictor)
+    for i, (key, record, phage, phage_predictions) in enumerate(predicted):
+        assert key == "phage_" + str(i)
+        assert len(read) == i + 1
+
+    # a phage with a gene to mask is waiting for the batch to fill
+    read.clear()
+    predicted = predictor.predict_phages(phages(1000, 100), gene_predictor)
+    keys = []
+    for key, record, phage, phage_predictions in predicted:
+        assert len(read) - len(keys) <= predictor.MAX_BATCH_PHAGES
+        keys.append(key)
+
+    assert keys == ["phage_" + str(i) for i in range(1000)]
+
+
+def test_fused_ensemble(tmp_path):
+    """
+    Test the fused ensemble scores the sum of its members whether it is fused when the models are loaded or read
+    from the ensemble saved by fuse_models
+    """
+
+    models = str(tmp_path)
+    for i in range(3):
+        build_model(neurons=4, layers=1, seed=i).save(
+            models + "/model_" + str(i) + ".h5"
+        )
+
+    members = make_predictor(models, backend="keras", raw_scores=True)
+    X = format_data.generate_masked([[1, 0, 3, 0], [5] * 120], [[1, 3], [119]], 10, 120)
+    expected = sum([m.predict(X, verbose=0) for m in members.models])
+
+    phages = make_phages()
+    members.predict_batch(phages)
+    expected_scores = {k: phages.get(k).get("scores") for k in phages}
+
+    fused = make_predictor(models, backend="keras", fused=True, raw_scores=True)
+    assert len(fused.models) == 1
+    np.testing.assert_allclose(
+        fused.models[0].predict(X, verbose=0), expected, atol=1e-6
+    )
+
+    # the ensemble saved by fuse_models is loaded in place of the members
+    fused.models[0].save(os.path.join(models, FUSED_MODEL))
+    predictor.write_fused_manifest(models)
+    assert predictor.model_files(models, True) == [os.path.join(models, FUSED_MODEL)]
+    for i in range(3):
+        os.remove(models + "/model_" + str(i) + ".h5")
+    saved = make_predictor(models, backend="keras", fused=True, raw_scores=True)
+    assert len(saved.models) == 1
+    np.testing.assert_allclose(
+        saved.models[0].predict(X, verbose=0), expected, atol=1e-6
+    )
+
+    for gene_predictor in [fused, saved]:
+        phages = make_phages()
+        gene_predictor.predict_batch(phages)
+        for key in phages:
+            if expected_scores.get(key) is None:
+                assert phages.get(key).get("scores") is None
+            else:
+                np.testing.assert_allclose(
+                    phages.get(key).get("scores"), expected_scores.get(key), atol=1e-6
+                )
+
+
+def test_stale_fused_ensemble(tmp_path):
+    """
+    Test a fused ensemble is not used once the models it was fused from change
+    """
+
+    models = str(tmp_path)
+    for i in range(2):
+        build_model(neurons=4, layers=1, seed=i).save(
+            models + "/model_" + str(i) + ".h5"
+        )
+
+    fused = make_predictor(models, backend="keras", fused=True)
+    fused.models[0].save(os.path.join(models, FUSED_MODEL))
+    predictor.write_fused_manifest(models)
+    assert predictor.fused_is_current(models)
+
+    # replace a member with a different model
+    build_model(neurons=8, layers=1, seed=5).save(models + "/model_1.h5")
+    assert not predictor.fused_is_current(models)
+    assert predictor.model_files(models, True) == predictor.member_files(models)
+
+    # the members are fused again rather than loading the stale ensemble
+    members = make_predictor(models, backend="keras")
+    refused = make_predictor(models, backend="keras", fused=True)
+    X = format_data.generate_masked([[1, 0, 3, 0]], [[1, 3]], 10, 120)
+    np.testing.assert_allclose(
+        refused.models[0].predict(X, verbose=0),
+        sum([m.predict(X, verbose=0) for m in members.models]),
+        atol=1e-6,
+    )
+
+
+def test_annotation_table_matches_genbank_table(models, categories):
+    """
+    Test the table rows built at annotation time match the rows read back from the annotated genbank records
+    """
+
+    gene_predictor = make_predictor(models)
+    records = handle_genbank.get_genbank(TEST_DATA)
+    phrog_integer = gene_predictor.phrog_categories
+
+    # drop the protein id of a gene with a PHROG and the PHROG of a gene with a protein id
+    cds = [f for f in list(records.values())[0].features if f.type == "CDS"]
+    with_phrog = [c for c in cds if "phrog" in c.qualifiers]
+    with_phrog[0].qualifiers.pop("protein_id")
+    with_phrog[1].qualifiers.pop("phrog")
+
+    phages = {k: predictor.get_phage_features(r) for k, r in records.items()}
+    batch_predictions = gene_predictor.predict_batch(phages)
+
+    table = []
+    for key, record in records.items():
+        sequence = str(record.seq)
+        predictor.annotate_record(record, batch_predictions.get(key), categories)
+
+        expected, expected_found = predictor.table_rows(
+            key, record, categories, phrog_integer
+        )
+        rows, found = predictor.annotation_table(
+            key,
+            sequence,
+            phages.get(key),
+            batch_predictions.get(key),
+            categories,
+            phrog_integer,
+        )
+
+        assert found == expected_found
+        assert len(rows) == len(expected)
+        for row, expected_row in zip(rows, expected):
+            assert row == expected_row
+        table += rows
+
+    # the table covers genes without protein ids, without PHROGs and with predictions
+    assert len(table) == sum([len(p.get("phrogs")) for p in phages.values()])
+    assert any([r.startswith("\t") for r in table])
+    assert any([r.split("\t")[4] == "No_PHROG" for r in table])
+    assert any([r.split("\t")[6] != "nan" for r in table])
@@ -0,0 +1,71 @@
+"""
+Test recalibrating the confidence of phynteny outputs from a results database
+"""
+
+import sqlite3
+import numpy as np
+from phynteny_utils import recalibrate
+from phynteny_utils import results_db
+
+CATEGORIES = {0: "unknown function", 1: "lysis", 2: "tail"}
+
+
+def test_recalibrate(tmp_path):
+    phage = {
+        "phrogs": [10, 0, 0],
+        "protein_id": ["a", "b", "c"],
+        "sense": ["+", "-", "+"],
+        "position": [(0, 10), (10, 20), (20, 30)],
+        "scores": np.array([[0.5, 2.0, 0.5], [0.1, 0.2, 2.7]], dtype=np.float32),
+    }
+    phage_predictions = ([1, 2], [1, 2], np.round(phage.get("scores"), 3), [0.5, 0.6])
+
+    db = results_db.ResultsDB(str(tmp_path / "results.sqlite"), CATEGORIES)
+    db.add(
+        results_db.gene_rows(
+            "phage", phage, phage_predictions, CATEGORIES, {10: 1, "No_PHROG": 0}
+        )
+    )
+    db.close()
+
+    # confidence which increases with the score of the predicted category
+    grid = np.linspace(0, 3, 4)
+    curves = np.array([np.zeros(4), grid / 3, grid / 6])
+
+    connection = sqlite3.connect(str(tmp_path / "results.sqlite"))
+    rowids, records, genes, scores = results_db.read_scores(connection)
+    predictions, scores, confidence = recalibrate.recalibrate(
+        scores, {"grid": grid, "curves": curves}, results_db.read_categories(connection)
+    )
+
+    assert list(genes) == [1, 2]
+    assert list(predictions) == [1, 2]
+    np.testing.assert_allclose(confidence, [0.6667, 0.45])
+
+    # only the phynteny columns of the annotated genes change
+    table = tmp_path / "phynteny.tsv"
+    table.write_text(
+        "header\n"
+        "a\t0\t10\t1\t10\tlysis\tnan\tnan\tnan\tAAA\tphage\n"
+        "b\t10\t20\t-1\tNo_PHROG\tunknown function\tlysis\t2.0\t0.5\tCCC\tphage\n"
+        "c\t20\t30\t1\tNo_PHROG\tunknown function\ttail\t2.7\t0.6\tGGG\tphage\n"
+        "d\t0\t10\t1\tNo_PHROG\tunknown function\tnan\tnan\tnan\tTTT\tother\n"
+    )
+    phage_dict = recalibrate.group_predictions(
+        records, genes, predictions, scores, confidence
+    )
+    recalibrate.recalibrate_table(
+        str(table), str(tmp_path / "out.tsv"), phage_dict, CATEGORIES
+    )
+
+    rows = [r.split("\t") for r in (tmp_path / "out.tsv").read_text().splitlines()]
+    assert rows[1][6:9] == ["nan", "nan", "nan"]
+    assert rows[2][6:9] == ["lysis", "2.0", "0.6667"]
+    assert rows[3][6:9] == ["tail", "2.7", "0.45"]
+    assert rows[4][6:9] == ["nan", "nan", "nan"]
+
+    # the database keeps the new confidence
+    results_db.update_confidence(connection, rowids, confidence)
+    assert connection.execute(
+        "SELECT confidence FROM genes WHERE scores IS NOT NULL ORDER BY gene"
+    ).fetchall() == [(0.6667,), (0.45,)]
@@ -0,0 +1,57 @@
+"""
+Test the resource bundle
+"""
+
+import numpy as np
+from phynteny_utils import format_data
+from phynteny_utils import predictor
+from phynteny_utils import resources
+
+
+def test_bundle(tmp_path):
+    path = str(tmp_path / "resources.bin")
+    categories = {0: "unknown function", 1: "lysis", 2: "tail"}
+    compiled = {"grid": np.linspace(0, 1, 5), "curves": np.random.rand(3, 5)}
+
+    resources.compile_bundle(path, {0: 0, 1: 2, 3: 1}, categories, compiled, "test")
+    assert resources.is_bundle(path)
+
+    bundle = resources.load_bundle(path)
+    assert bundle.version == "test"
+    assert bundle.categories == categories
+
+    # phrogs which are not in the dictionary have no category
+    phrog_integer = bundle.phrog_integer
+    assert [phrog_integer.get(p) for p in [0, 1, 2, 3, 4, "No_PHROG"]] == [
+        0,
+        2,
+        None,
+        1,
+        None,
+        None,
+    ]
+    assert len(phrog_integer) == 3
+
+    # the arrays are read-only views of the file
+    np.testing.assert_array_equal(bundle.confidence.get("curves"), compiled["curves"])
+    assert bundle.confidence.get("grid").flags.writeable is False
+    assert bundle.confidence.get("grid").ctypes.data % resources.ALIGNMENT == 0
+
+
+def test_shipped_bundle():
+    """the shipped bundle must match the files it was compiled from"""
+
+    bundle = resources.load_bundle()
+    phrog_integer = format_data.get_dict(
+        resources.resource_path("phrog_annotation_info", "phrog_integer.pkl")
+    )
+
+    assert bundle.categories == format_data.get_dict(
+        resources.resource_path("phrog_annotation_info", "integer_category.pkl")
+    )
+    assert all([bundle.phrog_integer.get(k) == v for k, v in phrog_integer.items()])
+
+    compiled = predictor.get_confidence(
+        resources.resource_path("phrog_annotation_info", "confidence_curves.npz")
+    )
+    np.testing.assert_array_equal(bundle.confidence.get("curves"), compiled["curves"])
@@ -0,0 +1,56 @@
+"""
+Test the SQLite results database
+"""
+
+import sqlite3
+import numpy as np
+from phynteny_utils import results_db
+
+
+def test_results_db(tmp_path):
+    categories = {0: "unknown function", 1: "lysis", 2: "tail"}
+    phrog_integer = {"No_PHROG": 0, 10: 1, 20: 2}
+
+    phage = {
+        "phrogs": [10, 0, 20, 0],
+        "protein_id": ["a", "b", None, "d"],
+        "sense": ["+", "-", "+", "-"],
+        "position": [(0, 10), (10, 20), (20, 30), (30, 40)],
+        "scores": np.array([[0.5, 2.0, 0.5], [0.1, 0.2, 2.7]]),
+        "member_scores": np.array(
+            [[[0.2, 0.7, 0.1], [0.0, 0.1, 0.9]]] * 3, dtype=np.float32
+        ),
+    }
+    phage_predictions = ([1, 3], [1, 2], np.round(phage.get("scores"), 3), [0.5, 0.9])
+
+    db = results_db.ResultsDB(
+        str(tmp_path / "results.sqlite"), categories, batch_size=3
+    )
+    db.add(
+        results_db.gene_rows(
+            "phage", phage, phage_predictions, categories, phrog_integer
+        )
+    )
+    db.close()
+
+    connection = sqlite3.connect(str(tmp_path / "results.sqlite"))
+    rows = connection.execute(
+        "SELECT gene, strand, phrog, phrog_category, phynteny_category, phynteny_score, scores, member_scores "
+        "FROM genes WHERE record = 'phage' ORDER BY gene"
+    ).fetchall()
+
+    assert len(rows) == 4
+    assert rows[0][1:5] == (1, 10, "lysis", None)
+    assert rows[1][1:6] == (-1, None, "unknown function", "lysis", 2.0)
+    assert rows[3][4] == "tail"
+
+    np.testing.assert_allclose(
+        results_db.decode_scores(rows[3][6], 3), phage.get("scores")[[1]], rtol=1e-6
+    )
+    assert results_db.decode_scores(rows[1][7], 3).shape == (3, 3)
+
+    # the category columns are indexed
+    plan = connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM genes WHERE phynteny_category = 'tail'"
+    ).fetchall()
+    assert "genes_phynteny_category" in str(plan)
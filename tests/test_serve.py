@@ -0,0 +1,212 @@
+# imports
+import json
+import os
+import threading
+import urllib.error
+import numpy as np
+import pytest
+from click.testing import CliRunner
+from phynteny_utils import format_data
+from phynteny_utils import phynteny_client
+from phynteny_utils import resources
+from phynteny_utils import serve
+from helpers import write_random_model, make_predictor
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), "data", "test_phage.gbk")
+
+
+@pytest.fixture(scope="module")
+def gene_predictor(tmp_path_factory):
+    models = tmp_path_factory.mktemp("models")
+    for i in range(3):
+        write_random_model(str(models / ("model_" + str(i) + ".npz")), i)
+
+    return make_predictor(models)
+
+
+@pytest.fixture(scope="module")
+def categories():
+    return format_data.get_dict(
+        resources.resource_path("phrog_annotation_info", "integer_category.pkl")
+    )
+
+
+@pytest.fixture(scope="module")
+def url(gene_predictor, categories):
+    server = serve.make_server(gene_predictor, categories, port=0, max_latency=0.2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:" + str(server.server_address[1])
+    server.shutdown()
+
+
+def test_concurrent_requests_are_batched(url, gene_predictor, categories):
+    """
+    Test concurrent requests are merged into a batch and match predictions made directly
+    """
+
+    rng = np.random.default_rng(0)
+    requests = [
+        {"categories": {"phage": [int(i) for i in rng.integers(0, 10, size=n)]}}
+        for n in [10, 40, 80, 120]
+    ]
+
+    batches = []
+    predict_batch = gene_predictor.predict_batch
+
+    def record_batch(batch):
+        batches.append(len(batch))
+        return predict_batch(batch)
+
+    gene_predictor.predict_batch = record_batch
+
+    results = [None] * len(requests)
+
+    def send(i):
+        results[i] = list(serve.request_predictions(url, requests[i]))
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(len(requests))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    gene_predictor.predict_batch = predict_batch
+
+    # every request was answered by fewer model calls than requests
+    assert sum(batches) == len(requests)
+    assert len(batches) < len(requests)
+
+    for i in range(len(requests)):
+        expected = serve.format_result(
+            "phage",
+            gene_predictor.predict_annotations(
+                {"phage": {"categories": requests[i]["categories"]["phage"]}}
+            ),
+            categories,
+        )
+        assert results[i] == [expected]
+
+
+def test_genbank_request(url, gene_predictor):
+    """
+    Test an annotated genbank file is streamed back for each phage
+    """
+
+    with open(TEST_DATA, "rt") as handle:
+        genbank = handle.read()
+
+    results = list(serve.request_predictions(url, {"genbank": genbank}))
+
+    assert len(results) == genbank.count("LOCUS")
+    assert all(r["genbank"].startswith("LOCUS") for r in results)
+    assert sum([len(r["phynteny"]) for r in results]) == sum(
+        [r["genbank"].count("/phynteny=") for r in results]
+    )
+
+
+def test_malformed_request(url):
+    """
+    Test a request which cannot be encoded is rejected before it joins a batch
+    """
+
+    for body in [
+        {"categories": {"phage": [1, 0, 42]}},
+        {"categories": {"phage": [1, 0, 2.5]}},
+        {"phrogs": {"phage": [1, "No_PHROG", 99999999]}},
+    ]:
+        with pytest.raises(urllib.error.HTTPError) as e:
+            list(serve.request_predictions(url, body))
+        assert e.value.code == 400
+
+
+def test_errors_are_not_sent_to_client(url, gene_predictor, monkeypatch):
+    """
+    Test errors which were not written for the client are replaced by a generic message
+    """
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        list(serve.request_predictions(url, {"phrogs": {"phage": ["not_a_phrog"]}}))
+    assert e.value.code == 400
+    assert e.value.reason == "Malformed request"
+    assert "not_a_phrog" not in e.value.read().decode()
+
+    def fail(batch):
+        raise RuntimeError("/home/phynteny/models/model_0.h5 could not be read")
+
+    monkeypatch.setattr(gene_predictor, "predict_batch", fail)
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        list(serve.request_predictions(url, {"categories": {"phage": [1, 0, 3]}}))
+    assert e.value.code == 500
+    assert e.value.reason == "Prediction failed"
+    assert "model_0.h5" not in e.value.read().decode()
+
+
+def test_failed_batch_only_fails_bad_request(gene_predictor, monkeypatch):
+    """
+    Test the requests sharing a batch with a request which fails are still answered
+    """
+
+    predict_batch = gene_predictor.predict_batch
+    batches = []
+
+    def fail_on_bad_phage(batch):
+        batches.append(len(batch))
+        if any([key == "bad" for i, key in batch]):
+            raise RuntimeError("bad phage")
+        return predict_batch(batch)
+
+    monkeypatch.setattr(gene_predictor, "predict_batch", fail_on_bad_phage)
+    batcher = serve.MicroBatcher(gene_predictor, max_latency=0.5)
+
+    names = ["good_0", "bad", "good_1", "good_2"]
+    results = {}
+
+    def send(name):
+        try:
+            results[name] = batcher.submit({name: {"categories": [1, 0, 3, 4, 0]}})
+        except RuntimeError as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=send, args=(n,)) for n in names]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # the batch which failed was run again one request at a time
+    assert batches[0] > 1
+    assert isinstance(results.get("bad"), RuntimeError)
+    for name in ["good_0", "good_1", "good_2"]:
+        assert list(results.get(name).get(name)[0]) == [1, 4]
+
+
+def test_client_encoded_phages(url, gene_predictor, categories, tmp_path):
+    """
+    Test the client sends phages already encoded as categories and writes the predictions as json lines
+    """
+
+    phages = {"phage_0": [1, 0, 3, 4, 0], "phage_1": [5, 0, 7]}
+    infile = tmp_path / "phages.json"
+    infile.write_text(json.dumps(phages))
+
+    result = CliRunner().invoke(
+        phynteny_client.main, [str(infile), "-u", url, "-f", "categories"]
+    )
+    assert result.exit_code == 0
+
+    expected = [
+        serve.format_result(
+            k,
+            gene_predictor.predict_annotations({k: {"categories": v}}),
+            categories,
+        )
+        for k, v in phages.items()
+    ]
+    assert [json.loads(line) for line in result.output.splitlines()] == expected
+
+    # a genbank file is not accepted in place of the encoded phages
+    result = CliRunner().invoke(
+        phynteny_client.main, [TEST_DATA, "-u", url, "-f", "categories"]
+    )
+    assert result.exit_code == 2
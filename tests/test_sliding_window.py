@@ -0,0 +1,48 @@
+"""
+Test annotating phages with more genes than the models take
+"""
+
+import numpy as np
+from helpers import make_predictor, write_random_model
+
+
+def test_sliding_window(tmp_path):
+    write_random_model(str(tmp_path / "model_0.npz"), 0)
+
+    rng = np.random.default_rng(1)
+    long_phage = list(rng.integers(1, 10, size=300))
+    unknowns = [0, 5, 61, 150, 151, 290, 299]
+    for i in unknowns:
+        long_phage[i] = 0
+
+    phages = {"long": {"categories": long_phage}, "short": {"categories": [1, 0, 3]}}
+
+    # long phages are skipped unless the sliding window is used
+    skipped = make_predictor(tmp_path, raw_scores=True)
+    assert skipped.count_masked(phages.get("long")) == 0
+    assert len(skipped.predict_batch(phages).get("long")[0]) == 0
+
+    windowed = make_predictor(tmp_path, raw_scores=True, sliding_window=True)
+    assert windowed.count_masked(phages.get("long")) == len(unknowns)
+    predictions = windowed.predict_batch(phages)
+    assert list(predictions.get("long")[0]) == unknowns
+
+    # each gene is scored in the window centred on it and clamped to the ends of the phage
+    scores = phages.get("long").get("scores")
+    starts = [0, 0, 1, 90, 91, 180, 180]
+    for j, start in enumerate(starts):
+        expected = windowed.score(
+            [long_phage[start : start + 120]], [[unknowns[j] - start]]
+        )[0]
+        np.testing.assert_allclose(scores[j], expected[0], rtol=1e-6)
+
+    # short phages are unchanged
+    np.testing.assert_array_equal(
+        predictions.get("short")[2], skipped.predict_batch(phages).get("short")[2]
+    )
+
+    # reusing the states of each window gives the same scores
+    make_predictor(
+        tmp_path, raw_scores=True, sliding_window=True, reuse_states=True
+    ).predict_batch(phages)
+    np.testing.assert_allclose(phages.get("long").get("scores"), scores, atol=1e-6)
@@ -11,7 +11,11 @@ import pkg_resources
 
 
 @click.command()
-# @click.option("--data", "-d", help="File path to training data")
+@click.option(
+    "--data",
+    "-d",
+    help="File path to training data which is masked when it is read. Required with --masking",
+)
 @click.option("--x_path", "-x", help="File path to X training data")
 @click.option("--y_path", "-y", help="File path to y training data")
 @click.option(
@@ -129,7 +133,13 @@ import pkg_resources
     type=int,
     help="Restrict kfold index",
 )
+@click.option(
+    "--masking",
+    is_flag=True,
+    help="Build the model with a masking layer which skips the padding after each genome and batch the examples by genome length",
+)
 def main(
+    data,
     x_path,
     y_path,
     max_length,
@@ -150,6 +160,7 @@ def main(
     l2_regularize,
     kernel_initializer,
     include,
+    masking,
 ):
     print("STARTING")
     # create a model object
@@ -170,14 +181,22 @@ def main(
         l1_regularizer=l1_regularize,
         l2_regularizer=l2_regularize,
         kernel_initializer=kernel_initializer,
+        masking=masking,
     )
 
-    # fit data to the model
-    # model.fit_data(data)
-
     print("PARSING DATA")
-    # parse the pre-masked data
-    model.parse_masked_data(x_path, y_path)
+    if data is not None:
+        # fit data to the model
+        model.fit_data(data)
+
+    elif masking:
+        raise click.UsageError(
+            "--masking needs the length of each genome. Use --data rather than --x_path and --y_path"
+        )
+
+    else:
+        # parse the pre-masked data
+        model.parse_masked_data(x_path, y_path)
 
     # perform stratified k-fold validation
     print("Performing cross validation... ")